@@ -0,0 +1,92 @@
+# Traffic spike against a slow LLM stub, with and without admission control.
+#
+#   python -m benchmarks.bench_admission --free 2000 --premium 100 --slots 16
+#
+# Every user asks one uncached question at the same moment. Reports, per
+# tier, how many got an LLM answer or an offline reply and how long they
+# waited. Without admission control every request queues FIFO for a slot;
+# with it premium users go first and free users degrade after
+# AI_MAX_WAIT_FREE instead of queuing behind the whole spike.
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from benchmarks.bench_ai_client import start_stub
+from config import Config
+from src.ai.client import AIClient
+from src.ai.coaching import AICoach, OFFLINE_REPLIES
+from src.database.models import Database
+from src.runtime.admission import AdmissionControl, TierPolicy
+
+
+class NoAdmission(AdmissionControl):
+    # Baseline: every request admitted, FIFO slots, no waiting limit
+    async def admit_ai(self, user_id: int) -> TierPolicy:
+        return None
+
+
+async def make_db(free: int, premium: int) -> Database:
+    db = Database()
+    for user_id in range(free + premium):
+        user = await db.create_user(user_id, f"user{user_id}", "Bench")
+        user.subscription = "premium" if user_id >= free else "free"
+    return db
+
+
+async def run(label: str, admission_cls, free: int, premium: int, slots: int, latency: float, base_url: str):
+    db = await make_db(free, premium)
+    coach = AICoach(
+        db=db,
+        client=AIClient(api_key="stub", base_url=base_url, max_concurrency=slots),
+        admission=admission_cls(db),
+    )
+    offline = set(OFFLINE_REPLIES.values())
+    waits = defaultdict(list)
+    outcomes = defaultdict(lambda: defaultdict(int))
+
+    async def ask(user_id: int):
+        tier = "premium" if user_id >= free else "free"
+        # Premium users arrive spread over the first half of the spike
+        if tier == "premium":
+            await asyncio.sleep(random.uniform(0, latency * free / slots / 2))
+        started = time.perf_counter()
+        reply = await coach.answer_question(user_id, f"question number {user_id}")
+        waits[tier].append(time.perf_counter() - started)
+        outcomes[tier]["offline" if reply in offline else "answered"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(ask(user_id) for user_id in range(free + premium)))
+    elapsed = time.perf_counter() - started
+    await coach.client.close()
+
+    print(f"{label} (spike drained in {elapsed:.1f}s)")
+    for tier in ("premium", "free"):
+        values = sorted(waits[tier])
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+        print(f"  {tier:8s} answered {outcomes[tier]['answered']:6,}  offline {outcomes[tier]['offline']:6,}  "
+              f"p50 {statistics.median(values):6.2f}s  p99 {p99:6.2f}s  max {values[-1]:6.2f}s")
+
+
+async def main(free: int, premium: int, slots: int, latency: float):
+    random.seed(1)
+    runner, base_url = await start_stub(latency)
+    try:
+        await run("no admission control", NoAdmission, free, premium, slots, latency, base_url)
+        await run("admission control", AdmissionControl, free, premium, slots, latency, base_url)
+    finally:
+        await runner.cleanup()
+    print(f"free: wait {Config.AI_MAX_WAIT_FREE}s, queue {Config.AI_MAX_WAITING_FREE}, "
+          f"overtaken for {Config.AI_AGING_FREE}s; premium: wait {Config.AI_MAX_WAIT_PREMIUM}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--free", type=int, default=2000)
+    parser.add_argument("--premium", type=int, default=100)
+    parser.add_argument("--slots", type=int, default=16, help="LLM concurrency")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub completion latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(main(args.free, args.premium, args.slots, args.latency))
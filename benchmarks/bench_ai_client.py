@@ -0,0 +1,95 @@
+# Concurrency check for AIClient against a local OpenAI-compatible stub.
+#
+#   python -m benchmarks.bench_ai_client --requests 20 --latency 0.5
+#
+# With a non-blocking client, N concurrent requests should finish in about
+# one latency period (as long as N <= OPENAI_MAX_CONCURRENCY). Checks that
+# bound for raw completions and for N users asking /daily at once, and
+# exits non-zero if either takes longer than --max-periods latencies.
+import os
+
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+
+from src.ai.client import AIClient
+from src.ai.coaching import DEFAULT_PLAN, AICoach
+from src.database.models import Database
+
+
+def make_stub_app(latency: float) -> web.Application:
+    async def chat_completions(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.json_response({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "ok"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+async def start_stub(latency: float, port: int = 0):
+    runner = web.AppRunner(make_stub_app(latency))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+async def run(requests: int, latency: float, max_periods: float):
+    runner, base_url = await start_stub(latency)
+    client = AIClient(api_key="stub", base_url=base_url, max_concurrency=requests)
+    db = Database()
+    for user_id in range(requests):
+        await db.create_user(user_id, f"user{user_id}", "Bench")
+        # A different level per user, so no two plans share a cache entry
+        db.user_progress[user_id].subjects["math"]["level"] = user_id + 1
+    coach = AICoach(db=db, client=client)
+    try:
+        # Load openai and open the pool before timing
+        await client.chat([{"role": "user", "content": "warm-up"}])
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            client.chat([{"role": "user", "content": f"plan {i}"}])
+            for i in range(requests)
+        ])
+        chat_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        plans = await asyncio.gather(*[coach.generate_daily_plan(user_id) for user_id in range(requests)])
+        daily_elapsed = time.perf_counter() - started
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+    for name, elapsed in (("chat", chat_elapsed), ("/daily", daily_elapsed)):
+        print(f"{name:6s} {requests} concurrent requests, {latency:.2f}s latency: {elapsed:.2f}s total "
+              f"({elapsed / latency:.1f} latency periods)")
+        assert elapsed <= latency * max_periods, f"{name} took {elapsed / latency:.1f} latency periods"
+    assert all(plan.get("advice") == "ok" for plan in plans), "a /daily plan fell back to DEFAULT_PLAN"
+    assert all(plan["goals"] == DEFAULT_PLAN["goals"] for plan in plans)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-periods", type=float, default=1.5)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.latency, args.max_periods))
@@ -0,0 +1,128 @@
+# Answer-checking latency and accuracy over a corpus of correct,
+# equivalent-but-rewritten, incorrect and pathological answers to
+# generated math problems.
+#
+#   python -m benchmarks.bench_answer_check --problems 40
+#
+# Reports, per category, how many answers were misjudged, which path
+# decided them (exact, sampled, symbolic, rejected, timeout) and latency
+# percentiles; a second pass over the same corpus shows the memo.
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+
+from src.learning.answer_check import AnswerChecker
+from src.learning.exercises import ExpectedAnswer
+from src.learning.problem_pool import generate_batch
+
+PATHOLOGICAL = [
+    "x**x**x**x**x**99",
+    "9**9**9**9**9",
+    "(" * 300 + "x" + ")" * 300,
+    "+".join(["x"] * 400),
+    "__import__('os').system('true')",
+    "(lambda: 1)()",
+    "sin(" * 60 + "x" + ")" * 60,
+    "x" * 5000,
+    "1/0",
+    "exp(exp(exp(exp(x))))",
+    "(x+1)**99999",
+    "log(-x)*sqrt(-x)",
+]
+
+
+def rewrites(problem: dict, rng: random.Random):
+    # Equivalent forms a student might type, built with sympy here in the
+    # benchmark only
+    import sympy
+
+    x = sympy.Symbol("x")
+    kind = problem["answer_kind"]
+    solution = problem["solution"].removesuffix(" + C")
+    if kind in ("expression", "antiderivative"):
+        expr = sympy.sympify(solution)
+        forms = [sympy.sstr(sympy.factor(expr)), sympy.sstr(sympy.expand(expr)),
+                 " + ".join(reversed(sympy.sstr(sympy.expand(expr)).split(" + ")))]
+        if kind == "antiderivative":
+            forms.append(sympy.sstr(expr + rng.randint(1, 9)) + " + C")
+        wrong = [sympy.sstr(expr + x), sympy.sstr(expr * 2), sympy.sstr(sympy.diff(expr, x))]
+        return forms, wrong
+    if kind == "factored":
+        expr = sympy.sympify(solution)
+        factors = list(expr.args)
+        rng.shuffle(factors)
+        forms = ["*".join(f"({sympy.sstr(factor)})" for factor in factors)]
+        wrong = [problem["canonical"], sympy.sstr(sympy.factor(expr + 1))]
+        return forms, wrong
+    if kind == "set":
+        values = [value.strip() for value in solution.split(",")]
+        return [", ".join(reversed(values)), " and ".join(f"x = {value}" for value in values)], \
+               [", ".join(str(int(value) + 1) for value in values)]
+    value = int(solution)
+    return [f" {value} ", f"{value}.0"], [str(value + 1), str(-value or 7)]
+
+
+def build_corpus(problems_per_topic: int, seed: int):
+    rng = random.Random(seed)
+    corpus = []
+    for topic in ("arithmetic", "algebra", "geometry", "calculus"):
+        for tier in range(1, 6):
+            for problem in generate_batch(topic, tier, max(1, problems_per_topic // 5), seed=rng.getrandbits(32)):
+                expected = ExpectedAnswer.from_problem(
+                    problem["answer_kind"], problem["solution"], problem["canonical"]
+                )
+                corpus.append(("correct", expected, problem["solution"], True))
+                forms, wrong = rewrites(problem, rng)
+                corpus.extend(("equivalent", expected, form, True) for form in forms)
+                corpus.extend(("incorrect", expected, answer, False) for answer in wrong)
+                if problem["answer_kind"] in ("expression", "antiderivative", "factored"):
+                    corpus.extend(
+                        ("pathological", expected, answer, False) for answer in rng.sample(PATHOLOGICAL, 3)
+                    )
+    return corpus
+
+
+async def run_pass(checker: AnswerChecker, corpus):
+    latencies = defaultdict(list)
+    outcomes = defaultdict(Counter)
+    wrong = Counter()
+    for category, expected, answer, truth in corpus:
+        started = time.perf_counter()
+        verdict = await checker.check(expected, answer)
+        latencies[category].append(time.perf_counter() - started)
+        outcomes[category][verdict.path] += 1
+        if verdict.correct is not None and verdict.correct != truth:
+            wrong[category] += 1
+    return latencies, outcomes, wrong
+
+
+def report(title, latencies, outcomes, wrong):
+    print(title)
+    for category, values in latencies.items():
+        values = sorted(values)
+        p50 = statistics.median(values) * 1000
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))] * 1000
+        paths = ", ".join(f"{path} {count}" for path, count in outcomes[category].most_common())
+        print(f"  {category:13s} n={len(values):4d}  misjudged {wrong[category]:3d}  "
+              f"p50 {p50:8.3f} ms  p99 {p99:8.1f} ms  max {values[-1] * 1000:8.1f} ms  [{paths}]")
+
+
+async def main(problems: int, seed: int):
+    corpus = build_corpus(problems, seed)
+    checker = AnswerChecker(timeout=1.0)
+    try:
+        report("first pass", *await run_pass(checker, corpus))
+        report("second pass (memoised)", *await run_pass(checker, corpus))
+    finally:
+        await checker.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--problems", type=int, default=40, help="problems per topic")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.problems, args.seed))
@@ -0,0 +1,104 @@
+# Audio analysis throughput over synthetic voice-like clips.
+#
+#   python -m benchmarks.bench_audio --clips 32 --seconds 8 --workers 2
+#
+# Clips are harmonic tones with gliding pitch, syllable-rate amplitude
+# modulation, pauses and background noise, written as 16 kHz WAV files.
+# Each is analysed once in-process (per-stage timings) and then all of
+# them concurrently through the AudioPipeline worker pool. With --ogg the
+# clips are encoded to OGG/Opus first, as Telegram voice messages are, and
+# decoded through ffmpeg.
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from src.media.audio import SAMPLE_RATE, AudioPipeline, analyze_audio, ffmpeg_binary, score_pronunciation
+
+
+def synth_clip(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    base = rng.uniform(100, 220)
+    pitch = base * 2 ** (rng.uniform(1, 4) / 12 * np.sin(2 * np.pi * rng.uniform(0.2, 0.6) * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = np.clip(np.sin(2 * np.pi * rng.uniform(2, 5) * t), 0, None)
+    pauses = (np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, np.pi)) > -0.7).astype(float)
+    signal = 0.2 * voice * syllables * pauses + 0.005 * rng.standard_normal(len(t))
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2")
+
+
+def write_wav(path: str, samples: np.ndarray):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+
+
+def encode_ogg(ffmpeg: str, wav_path: str) -> str:
+    path = wav_path[:-4] + ".ogg"
+    subprocess.run(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-i", wav_path, "-c:a", "libopus", "-b:a", "24k", path],
+        check=True
+    )
+    return path
+
+
+async def run_pool(paths, workers: int, fmt: str) -> float:
+    pipeline = AudioPipeline(workers=workers, max_queue=len(paths))
+    pipeline._ensure_started()
+    try:
+        # Spawn the workers before timing
+        await pipeline.run_in_worker(analyze_audio, paths[0], fmt)
+        started = time.perf_counter()
+        await asyncio.gather(*[pipeline.run_in_worker(analyze_audio, path, fmt) for path in paths])
+        return time.perf_counter() - started
+    finally:
+        await pipeline.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=8.0)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--ogg", action="store_true", help="encode clips to OGG/Opus and decode them with ffmpeg")
+    args = parser.parse_args()
+    fmt = "ogg" if args.ogg else "wav"
+    ffmpeg = ffmpeg_binary()
+    if args.ogg:
+        if ffmpeg is None:
+            raise SystemExit("--ogg needs ffmpeg (pip install imageio-ffmpeg, or set FFMPEG_BINARY)")
+        print(f"ffmpeg: {ffmpeg}")
+
+    rng = np.random.default_rng(7)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(args.clips):
+            path = os.path.join(directory, f"clip{i}.wav")
+            write_wav(path, synth_clip(args.seconds, rng))
+            paths.append(encode_ogg(ffmpeg, path) if args.ogg else path)
+
+        results = [analyze_audio(path, fmt) for path in paths]
+        for stage in ("decode", "features", "analysis"):
+            values = [result["timings"][stage] * 1000 for result in results]
+            print(f"{stage:9s} median {statistics.median(values):7.2f} ms  max {max(values):7.2f} ms")
+        analysis = statistics.median(result["timings"]["analysis"] for result in results)
+        print(f"realtime factor (single process): {args.seconds / analysis:.0f}x")
+        scores = [score_pronunciation(result)["accuracy"] for result in results]
+        print(f"scores: median {statistics.median(scores)}  range {min(scores)}-{max(scores)}")
+
+        elapsed = asyncio.run(run_pool(paths, args.workers, fmt))
+        print(f"pool ({args.workers} workers): {args.clips} clips in {elapsed:.2f}s "
+              f"({args.clips / elapsed:.1f} clips/s, {args.clips * args.seconds / elapsed:.0f}s audio/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Outbound scheduler and broadcast check against the fake Bot API.
+#
+#   python -m benchmarks.bench_broadcast --users 20000 --rate 30
+#   python -m benchmarks.bench_broadcast --users 100000 --rate 1000 --flood-every 500
+#
+# 1. Broadcasts the daily reminder to every seeded user through
+#    LearningBot's Broadcaster and OutboundLimiter, with some users having
+#    blocked the bot and the fake API answering every n-th send with a
+#    flood wait. Reports throughput, and checks that every reachable user
+#    got exactly one message and that no one-second window exceeded the
+#    global limit.
+# 2. Sends replies to one chat in a tight loop and checks the per-chat
+#    pace, and that a placeholder is edited in place (one message).
+import os
+
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("WARM_UP_IMPORTS", "0")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import main
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeRequest
+from config import Config
+from src.runtime.outbound import replace_placeholder
+
+
+def max_per_window(times, window: float = 1.0) -> int:
+    # Most sends inside any `window` seconds
+    times = sorted(times)
+    best = start = 0
+    for end, at in enumerate(times):
+        while at - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def bench_broadcast(args):
+    rng = random.Random(args.seed)
+    blocked = set(rng.sample(range(1, args.users + 1), args.users // 100))
+    fake = FakeRequest(latency=args.api_latency, flood_every=args.flood_every, retry_after=1, blocked=blocked)
+    bot = main.LearningBot(FAKE_TOKEN, request=fake)
+    # Broadcast share of the global limit, as in production
+    bot.outbound.global_rate = args.rate
+    bot.outbound.bulk_rate = args.rate * Config.BROADCAST_RATE / Config.SEND_RATE_GLOBAL
+    for user_id in range(1, args.users + 1):
+        await bot.db.create_user(user_id, f"user{user_id}", f"User{user_id}")
+        bot.db.user_stats[user_id].current_streak = rng.choice((0, 0, 3, 12))
+    await bot.application.initialize()
+
+    report = await bot.broadcaster.broadcast(bot.render_daily_reminder, progress_every=5)
+    sends = [entry for entry in fake.sent if entry["method"] == "sendMessage"]
+    per_user = Counter(int(entry["chat_id"]) for entry in sends)
+    peak = max_per_window([entry["at"] for entry in sends])
+    print(f"broadcast {args.users:,} users at {bot.outbound.bulk_rate:,.0f} msg/s bulk "
+          f"({args.rate:,.0f} global): {report.to_dict()}")
+    print(f"  flood waits retried {bot.outbound.flood_waits:,}  peak {peak} sends in one second")
+    assert report.sent == args.users - len(blocked), report.to_dict()
+    assert report.blocked == len(blocked) and report.failed == 0, report.to_dict()
+    assert set(per_user) == set(range(1, args.users + 1)) - blocked
+    assert max(per_user.values()) == 1, "a user got the broadcast twice"
+    assert peak <= args.rate + 1, f"{peak} sends in one second exceeds the global limit"
+    await bot.application.shutdown()
+
+
+async def bench_chat_pace(args):
+    fake = FakeRequest()
+    bot = main.LearningBot(FAKE_TOKEN, request=fake)
+    await bot.application.initialize()
+    chat_id = 42
+    started = time.monotonic()
+    for i in range(10):
+        await bot.application.bot.send_message(chat_id, f"reply {i}")
+    elapsed = time.monotonic() - started
+    burst = int(Config.SEND_BURST_CHAT)
+    expected = (10 - burst) / Config.SEND_RATE_CHAT
+    print(f"10 replies to one chat took {elapsed:.2f}s (burst {burst}, then {Config.SEND_RATE_CHAT}/s: "
+          f"expected ~{expected:.1f}s)")
+    assert elapsed >= expected * 0.9
+
+    # Placeholder edited into the answer: one message, one edit
+    fake.sent.clear()
+    placeholder = await bot.application.bot.send_message(7, "📸 Analyzing your problem...")
+    await replace_placeholder(placeholder, "✅ Problem Solved!")
+    methods = Counter(entry["method"] for entry in fake.sent)
+    print(f"placeholder flow: {dict(methods)}")
+    assert methods == {"sendMessage": 1, "editMessageText": 1}
+    await bot.application.shutdown()
+
+
+async def main_async(args):
+    await bench_broadcast(args)
+    await bench_chat_pace(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--rate", type=float, default=Config.SEND_RATE_GLOBAL or 30,
+                        help="global messages per second (Telegram allows ~30, paid broadcasts more)")
+    parser.add_argument("--flood-every", type=int, default=200, help="every n-th send gets a flood wait")
+    parser.add_argument("--api-latency", type=float, default=0.03)
+    parser.add_argument("--seed", type=int, default=3)
+    asyncio.run(main_async(parser.parse_args()))
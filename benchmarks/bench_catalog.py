@@ -0,0 +1,147 @@
+# Lesson catalog check: builds a synthetic pack and compares it with
+# holding the same lessons as Python dicts.
+#
+#   python -m benchmarks.bench_catalog --lessons 50000 --users 1000
+#
+# Reports pack size and build time, the cost of opening the pack and of
+# serving lessons through per-user cursors, and the memory both approaches
+# take. Checks that a user sees every lesson of a pool once before any
+# repeats, that the next cycle is a different order, that stored cursors
+# carry on after a restart without repeats, that lesson ids survive adding
+# a lesson to the pack, and that an empty pool falls back to a
+# neighbouring difficulty.
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from src.learning.catalog import (
+    DIFFICULTIES, LessonCatalog, LessonCursors, LessonPack, build_pack, difficulty_for_level, write_pack
+)
+
+UNITS = ("basics", "food", "travel", "work", "family", "health", "school", "nature")
+
+
+def synthetic_lessons(count: int, seed: int):
+    rng = random.Random(seed)
+    for number in range(count):
+        yield {
+            "subject": "english",
+            # No advanced lessons, so fallback is exercised
+            "difficulty": DIFFICULTIES[number % 2],
+            "unit": UNITS[number % len(UNITS)],
+            "title": f"Lesson {number}",
+            "content": " ".join(rng.choice(("word", "phrase", "sentence", "grammar")) for _ in range(60)),
+            "exercise": {
+                "type": "multiple_choice",
+                "question": f"Question {number}?",
+                "options": ["one", "two", "three", "four"],
+                "answer": rng.randrange(4),
+            },
+        }
+
+
+def main(args):
+    directory = tempfile.mkdtemp(prefix="lessons-")
+    path = os.path.join(directory, "lessons.pack")
+    started = time.perf_counter()
+    write_pack(path, synthetic_lessons(args.lessons, args.seed))
+    print(f"{args.lessons:,} lessons: pack {os.path.getsize(path) / 2 ** 20:.1f} MiB, "
+          f"built in {time.perf_counter() - started:.2f}s")
+
+    def serve(catalog: LessonCatalog) -> float:
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        for _ in range(args.picks):
+            catalog.next_lesson(rng.randint(1, args.users), "english", rng.choice(DIFFICULTIES), rng.choice(UNITS))
+        return (time.perf_counter() - started) / args.picks
+
+    started = time.perf_counter()
+    catalog = LessonCatalog(LessonPack(path), LessonCursors())
+    catalog.next_lesson(1, "english", "beginner", "basics")
+    opened = time.perf_counter() - started
+    per_pick = serve(catalog)
+    catalog.close()
+    # Memory on a fresh catalog, with tracemalloc off while timing
+    tracemalloc.start()
+    catalog = LessonCatalog(LessonPack(path), LessonCursors())
+    serve(catalog)
+    pack_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"pack: first lesson after {opened * 1000:.1f} ms, {per_pick * 1e6:.1f} us per lesson, "
+          f"{pack_memory / 2 ** 20:.1f} MiB held ({args.users:,} users' cursors)")
+
+    # The same lessons as dicts, as if read from JSON at startup
+    source = os.path.join(directory, "lessons.json")
+    with open(source, "w") as f:
+        json.dump(list(synthetic_lessons(args.lessons, args.seed)), f)
+    tracemalloc.start()
+    started = time.perf_counter()
+    with open(source) as f:
+        lessons = json.load(f)
+    loaded = time.perf_counter() - started
+    dict_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"dicts: loaded in {loaded * 1000:.0f} ms (under tracemalloc), {dict_memory / 2 ** 20:.1f} MiB held")
+    os.unlink(source)
+    del lessons
+
+    # Non-repeating: a whole pool once, then a different order
+    user_id = args.users + 1  # no cursor yet
+    first, size = catalog.pack.span("english", "beginner", "travel")
+    cycles = [[catalog.next_lesson(user_id, "english", "beginner", "travel")["title"] for _ in range(size)]
+              for _ in range(2)]
+    assert len(set(cycles[0])) == size and set(cycles[0]) == set(cycles[1]), "lessons repeated within a cycle"
+    assert cycles[0] != cycles[1], "second cycle has the same order"
+    print(f"a new user saw all {size:,} lessons of english/beginner/travel once per cycle, in a new order each cycle")
+
+    # Stored cursors: half a cycle, a restart (fresh catalog, cursors read
+    # back from JSON as from the progress row), then the rest of the cycle
+    stored = {}
+    seen = [catalog.next_lesson(user_id, "english", "beginner", "travel", stored)["id"] for _ in range(size // 2)]
+    restarted = LessonCatalog(LessonPack(path), LessonCursors())
+    stored = json.loads(json.dumps(stored))
+    seen += [restarted.next_lesson(user_id, "english", "beginner", "travel", stored)["id"]
+             for _ in range(size - size // 2)]
+    assert len(set(seen)) == size, "lessons repeated across a restart"
+    assert len(restarted.cursors) == 0
+    restarted.close()
+    print(f"stored cursors: a restart mid-cycle carried on, all {size:,} lessons once")
+
+    # Ids belong to the lesson, not its position in the pack
+    def ids(pack: LessonPack):
+        pack.span("", "")
+        return {pack.lesson(number)["id"]: pack.lesson(number)["title"] for number in range(pack.count)}
+
+    before = ids(catalog.pack)
+    added = {**next(synthetic_lessons(1, args.seed)), "unit": "basics", "title": "A new first lesson"}
+    grown = LessonPack(data=build_pack([added, *synthetic_lessons(args.lessons, args.seed)]))
+    after = ids(grown)
+    assert len(after) == len(before) + 1 and all(after[lesson_id] == title for lesson_id, title in before.items())
+    grown.close()
+    try:
+        build_pack([added, added])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("duplicate lesson ids were accepted")
+    print("adding a lesson kept every other lesson's id; duplicate ids are rejected")
+
+    lesson = catalog.next_lesson(user_id, "english", difficulty_for_level(12), "basics")
+    assert difficulty_for_level(12) == "advanced" and lesson["difficulty"] == "intermediate"
+    print("level 12 -> advanced, no advanced lessons -> served intermediate")
+    catalog.close()
+    os.unlink(path)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lessons", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--picks", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,97 @@
+# Sustained update throughput of SQLiteDatabase with write-behind batching.
+#
+#   python -m benchmarks.bench_database --users 100000 --updates 500000
+#
+# Then reads every user with the hot cache capped at --max-users: the cache
+# stays at the cap after each flush, dirty users are never dropped, and
+# evicted users (and handles still held to them) read back their values.
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from src.database.storage import SQLiteDatabase
+
+
+async def run(users: int, updates: int, flush_interval: float, max_users: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db = SQLiteDatabase(path, flush_interval=flush_interval)
+    await db.start()
+
+    started = time.perf_counter()
+    for user_id in range(users):
+        await db.create_user(user_id, f"user{user_id}", "Bench")
+    await db.flush()
+    created = time.perf_counter() - started
+    print(f"created {users:,} users in {created:.2f}s ({users / created:,.0f}/s)")
+
+    rng = random.Random(42)
+    subjects = ("english", "math", "programming")
+    started = time.perf_counter()
+    for i in range(updates):
+        user_id = rng.randrange(users)
+        if i % 2:
+            await db.update_user_stats(user_id, {"total_xp": i, "current_streak": i % 30})
+        else:
+            await db.update_user_progress(user_id, rng.choice(subjects), {"xp": i})
+        if i % 10000 == 0:
+            # Let the background flusher run as it would between updates
+            await asyncio.sleep(0)
+    await db.flush()
+    elapsed = time.perf_counter() - started
+    print(f"applied {updates:,} updates in {elapsed:.2f}s ({updates / elapsed:,.0f}/s), "
+          f"{db.flush_count} flushes, {db.flushed_rows:,} rows written")
+
+    await db.close()
+
+    # Cold read-through after restart
+    db = SQLiteDatabase(path, flush_interval=0)
+    await db.start()
+    started = time.perf_counter()
+    for user_id in rng.sample(range(users), min(users, 10000)):
+        await db.get_user_stats(user_id)
+    elapsed = time.perf_counter() - started
+    print(f"cold-loaded {min(users, 10000):,} users in {elapsed:.2f}s")
+    await db.close()
+
+    # Bounded hot cache
+    db = SQLiteDatabase(path, flush_interval=0, max_users=max_users)
+    await db.start()
+    expected = {}
+    held = {}
+    started = time.perf_counter()
+    for user_id in range(users):
+        stats = await db.get_user_stats(user_id)
+        expected[user_id] = stats.total_xp
+        if user_id % 1000 == 0:
+            held[user_id] = stats
+            await db.update_user_stats(user_id, {"total_xp": stats.total_xp + 1})
+            expected[user_id] += 1
+        if user_id % 5000 == 4999:
+            dirty = set(db._dirty["user_stats"])
+            db.evict()
+            assert dirty <= set(db.users), "evicted a dirty user"
+            await db.flush()
+            db.evict()
+            assert len(db.users) <= max_users and len(db.stats_table) == len(db.user_stats)
+    elapsed = time.perf_counter() - started
+    cached = len(db.users)
+    assert all(stats.total_xp == expected[user_id] for user_id, stats in held.items())
+    for user_id in rng.sample(range(users), min(users, 10000)):
+        assert (await db.get_user_stats(user_id)).total_xp == expected[user_id]
+    assert all(db.stats_table.user_ids[stats._row] == user_id for user_id, stats in db.user_stats.items())
+    print(f"read {users:,} users with at most {max_users:,} cached in {elapsed:.2f}s: {db.evicted:,} evicted, "
+          f"{cached:,} held, reloads and held handles match")
+    await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--updates", type=int, default=500000)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--max-users", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.updates, args.flush_interval, args.max_users))
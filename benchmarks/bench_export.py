@@ -0,0 +1,191 @@
+# Cohort export against a SQLite store, next to a process that keeps
+# serving from the same file.
+#
+#   python -m benchmarks.bench_export --users 1000000
+#
+# Seeds --users users (kept in --db between runs), then measures a serving
+# loop (hot-cache writes plus a flush every 200 ms, as the bot does) alone
+# and while `python -m src.analytics.export` runs as a child process.
+# Reports export time, the child's peak RSS, file sizes, and serving loop
+# lag and flush times idle vs during the export. Checks the level
+# distribution against SQLite's own count and that the snapshot holds
+# every user.
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.database.storage import SQLiteDatabase
+from src.gamification.leaderboard import SUBJECTS
+from src.gamification.levels import LevelCurve
+
+SUBJECT_FIELDS = {
+    "english": ("current_unit", "basics", "completed_lessons", {"vocabulary_size": 0}),
+    "math": ("current_topic", "arithmetic", "completed_exercises", {}),
+    "programming": ("current_language", "python", "completed_challenges", {}),
+}
+
+
+def seed(path: str, users: int, seed_value: int):
+    rng = random.Random(seed_value)
+    curve = LevelCurve()
+    now = datetime.now()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for table in ("users", "user_stats", "user_progress"):
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+    batch = 50_000
+    for start in range(0, users, batch):
+        rows: Dict[str, List] = {"users": [], "user_stats": [], "user_progress": []}
+        for user_id in range(start, min(start + batch, users)):
+            subject_xp = {subject: int(rng.expovariate(1 / 400)) if rng.random() < 0.6 else 0 for subject in SUBJECTS}
+            total_xp = sum(subject_xp.values()) + rng.randrange(200)
+            longest = int(rng.expovariate(1 / 6))
+            rows["users"].append((user_id, json.dumps({
+                "user_id": user_id, "username": f"user{user_id}", "first_name": "Bench",
+                "created_at": now.isoformat(), "subscription": "free", "language": "en",
+            })))
+            rows["user_stats"].append((user_id, json.dumps({
+                "user_id": user_id, "total_xp": total_xp, "global_level": curve.level_for_xp(total_xp),
+                "current_streak": rng.randint(0, longest), "longest_streak": longest,
+                "total_learning_time": rng.randrange(2000),
+                "last_active": (now - timedelta(days=rng.expovariate(1 / 10))).isoformat(),
+                "streak_freeze": rng.randrange(3), "lesson_day": 0, "lessons_today": 0,
+            })))
+            subjects = {}
+            for subject, (focus_key, focus, completed_key, extra) in SUBJECT_FIELDS.items():
+                subjects[subject] = {
+                    "level": curve.level_for_xp(subject_xp[subject]), "xp": subject_xp[subject],
+                    focus_key: focus, "mastery_percentage": rng.randrange(101),
+                    completed_key: rng.sample(range(500), rng.randrange(12)), **extra,
+                }
+            rows["user_progress"].append((user_id, json.dumps({
+                "user_id": user_id, "subjects": subjects, "weak_topics": [], "strengths": [], "achievements": [],
+            })))
+        with conn:
+            for table, table_rows in rows.items():
+                conn.executemany(f"INSERT OR REPLACE INTO {table} (user_id, data) VALUES (?, ?)", table_rows)
+    conn.close()
+
+
+def stored_users(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM user_stats").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+
+async def serve(db: SQLiteDatabase, users: int, stop: asyncio.Event) -> Dict[str, List[float]]:
+    # Stand-in for the bot: a tick every 20 ms writes 50 hot users, and
+    # every tenth tick flushes them to SQLite
+    rng = random.Random(1)
+    hot = rng.sample(range(users), 2000)
+    for user_id in hot:
+        await db.get_user_stats(user_id)
+    lags, flushes = [], []
+    tick = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.02)
+        lags.append(time.perf_counter() - started - 0.02)
+        for user_id in rng.sample(hot, 50):
+            await db.update_user_stats(user_id, {"total_learning_time": tick})
+        tick += 1
+        if tick % 10 == 0:
+            started = time.perf_counter()
+            await db.flush()
+            flushes.append(time.perf_counter() - started)
+    return {"lag": lags, "flush": flushes}
+
+
+def describe(samples: Dict[str, List[float]]) -> str:
+    lag = np.array(samples["lag"]) * 1000
+    flush = np.array(samples["flush"]) * 1000
+    return (f"loop lag p50 {np.percentile(lag, 50):5.1f} ms  p99 {np.percentile(lag, 99):6.1f} ms  "
+            f"flush p50 {np.percentile(flush, 50):5.1f} ms  p99 {np.percentile(flush, 99):6.1f} ms")
+
+
+async def bench(args):
+    path = args.db or os.path.join(tempfile.gettempdir(), f"bench-export-{args.users}.db")
+    if stored_users(path) != args.users:
+        if os.path.exists(path):
+            os.unlink(path)
+        started = time.perf_counter()
+        seed(path, args.users, args.seed)
+        print(f"seeded {args.users:,} users in {time.perf_counter() - started:.1f}s")
+    print(f"{args.users:,} users in {path} ({os.path.getsize(path) / 2 ** 20:,.0f} MiB)")
+
+    db = SQLiteDatabase(path, flush_interval=0)
+    await db.start()
+    stop = asyncio.Event()
+    idle = asyncio.create_task(serve(db, args.users, stop))
+    await asyncio.sleep(args.probe_seconds)
+    stop.set()
+    print(f"serving alone:         {describe(await idle)}")
+
+    out = tempfile.mkdtemp(prefix="export-")
+    stop = asyncio.Event()
+    busy = asyncio.create_task(serve(db, args.users, stop))
+    started = time.perf_counter()
+    child = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "src.analytics.export", out, "--database", f"sqlite:///{path}",
+        "--chunk-size", str(args.chunk_size), "--format", args.format,
+        stderr=subprocess.PIPE,
+    )
+    _, stderr = await child.communicate()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    samples = await busy
+    await db.close()
+    if child.returncode != 0:
+        raise SystemExit(stderr.decode())
+    print(f"serving during export: {describe(samples)}")
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"export: {elapsed:.1f}s ({args.users / elapsed:,.0f} users/s), peak RSS {peak:,.0f} MiB, "
+          f"chunks of {args.chunk_size:,}")
+    for name in sorted(os.listdir(out)):
+        print(f"  {name:28s} {os.path.getsize(os.path.join(out, name)) / 2 ** 10:10,.1f} KiB")
+
+    # Against SQLite's own view of the same rows
+    levels = pd.read_csv(os.path.join(out, "level_distribution.csv"))
+    conn = sqlite3.connect(path)
+    expected = dict(conn.execute(
+        "SELECT json_extract(data, '$.global_level'), COUNT(*) FROM user_stats GROUP BY 1"
+    ).fetchall())
+    conn.close()
+    exported = {int(level): int(count) for level, count in zip(levels["level"], levels["global"]) if count}
+    assert exported == expected, "level distribution differs from SQLite"
+    if args.format == "csv":
+        rows = sum(len(chunk) for chunk in pd.read_csv(os.path.join(out, "users.csv.gz"), chunksize=200_000))
+        assert rows == args.users, rows
+    print(pd.read_csv(os.path.join(out, "streak_retention.csv")).to_string(index=False))
+    print(pd.read_csv(os.path.join(out, "subject_mix.csv")).to_string(index=False))
+    print("level distribution matches SQLite; the snapshot has every user")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--db", help="SQLite file to reuse (seeded if the user count differs)")
+    parser.add_argument("--probe-seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=3)
+    asyncio.run(bench(parser.parse_args()))
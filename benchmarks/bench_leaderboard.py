@@ -0,0 +1,48 @@
+# Leaderboard microbenchmark: score updates and rank queries at 1M users.
+#
+#   python -m benchmarks.bench_leaderboard --users 1000000
+import argparse
+import random
+import time
+
+from src.gamification.leaderboard import Leaderboard
+
+
+def timed(label: str, count: int, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {count:>10,} ops {elapsed:8.2f}s {count / elapsed:>12,.0f} ops/s")
+
+
+def run(users: int, ops: int):
+    rng = random.Random(7)
+    board = Leaderboard()
+
+    timed("bulk load", users, lambda: board.set_scores(
+        (user_id, rng.randrange(100000)) for user_id in range(users)
+    ))
+    timed("single insert", ops, lambda: [
+        board.set_score(users + i, rng.randrange(100000)) for i in range(ops)
+    ])
+    users += ops
+    timed("score update", ops, lambda: [
+        board.add_score(rng.randrange(users), rng.randrange(1, 50)) for _ in range(ops)
+    ])
+    timed("my rank", ops, lambda: [board.rank(rng.randrange(users)) for _ in range(ops)])
+    timed("top 10", ops, lambda: [board.top(10) for _ in range(ops)])
+    timed("around me (+-5)", ops, lambda: [
+        board.around(rng.randrange(users), radius=5) for _ in range(ops)
+    ])
+
+    # Sanity check against a full sort
+    expected = sorted(board.scores.items(), key=lambda item: (-item[1], item[0]))[:10]
+    assert [(user_id, score) for _, user_id, score in board.top(10)] == expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--ops", type=int, default=200000)
+    args = parser.parse_args()
+    run(args.users, args.ops)
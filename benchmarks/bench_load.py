@@ -0,0 +1,291 @@
+# End-to-end load test. Builds LearningBot against the fake Bot API and a
+# local OpenAI stub, seeds N users, then pushes a synthetic update stream
+# (commands, text, photos, voice, callback queries) through the real
+# update queue and update processor at a fixed arrival rate. Fully offline.
+#
+#   python -m benchmarks.bench_load --scenario 10k
+#   python -m benchmarks.bench_load --users 250000 --updates 50000 --rate 3000 --ai-latency 0.8
+#   python -m benchmarks.bench_load --scenario 1m --json results.json --baseline previous.json
+#
+# Latency is measured from enqueue to the end of handler processing.
+# Reports p50/p95/p99 per update kind, throughput and peak RSS; --json
+# writes the same numbers for comparison between releases.
+import os
+
+# Settings are read when config is imported, so they go first
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("WARM_UP_IMPORTS", "0")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+# The fake Bot API has no global send limit; measure the bot, not 30 msg/s
+os.environ.setdefault("SEND_RATE_GLOBAL", "0")
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import numpy as np
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import main
+from benchmarks.bench_ai_client import start_stub
+from benchmarks.fake_telegram import (
+    FAKE_TOKEN, FakeRequest, callback_update, command_update, photo_update, text_update, voice_update
+)
+from src.ai.client import AIClient
+from src.utils.lazy import warm_up
+
+# (users, updates, arrival rate per second). The rates sit just below what
+# a single process sustains, so percentiles reflect service time rather
+# than an ever-growing backlog; raise --rate to find the saturation point.
+SCENARIOS = {
+    "1k": (1_000, 5_000, 200),
+    "10k": (10_000, 10_000, 200),
+    "100k": (100_000, 20_000, 200),
+    "1m": (1_000_000, 20_000, 200),
+}
+
+# Relative frequency of each update kind
+MIX = {
+    "/profile": 20,
+    "/stats": 10,
+    "/leaderboard": 8,
+    "/start": 4,
+    "/daily": 5,
+    "text": 25,
+    "cb:profile": 10,
+    "cb:daily_plan": 5,
+    "cb:start_math": 5,
+    "photo": 4,
+    "voice": 4,
+}
+
+QUESTIONS = [
+    "What is the past tense of go?",
+    "How do I solve 2x + 3 = 7?",
+    "Explain list comprehensions in Python",
+    "What does 'ubiquitous' mean?",
+    "Why is the derivative of x^2 equal to 2x?",
+]
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_media(directory: str) -> Dict[str, str]:
+    from PIL import Image, ImageDraw
+
+    from benchmarks.bench_audio import synth_clip, write_wav
+
+    image = Image.new("L", (1280, 960), 235)
+    draw = ImageDraw.Draw(image)
+    for row in range(8):
+        draw.text((80, 80 + row * 100), f"{row + 2}x + {row * 3} = {row * 7 + 11}", fill=20)
+    photo_path = os.path.join(directory, "problem.jpg")
+    image.save(photo_path, quality=85)
+
+    voice_path = os.path.join(directory, "voice.wav")
+    write_wav(voice_path, synth_clip(4.0, np.random.default_rng(3)))
+    return {"photo": photo_path, "voice": voice_path}
+
+
+async def seed_users(bot: "main.LearningBot", users: int, rng: random.Random):
+    db = bot.db
+    for user_id in range(1, users + 1):
+        await db.create_user(user_id, f"user{user_id}", f"User{user_id}")
+        db.user_stats[user_id].total_xp = rng.randrange(0, 50_000)
+        for subject in db.user_progress[user_id].subjects.values():
+            subject["xp"] = rng.randrange(0, 15_000)
+    await bot.xp_system.load_leaderboards()
+
+
+def build_update(kind: str, user_id: int, seq: int, media: Dict[str, str], files: Dict[str, str],
+                 rng: random.Random) -> Dict:
+    if kind.startswith("/"):
+        return command_update(user_id, kind)
+    if kind.startswith("cb:"):
+        return callback_update(user_id, kind[3:])
+    if kind == "text":
+        return text_update(user_id, rng.choice(QUESTIONS))
+    # Unique file ids, so the media caches do not hide the pipeline cost
+    file_id = f"{kind}-{seq}"
+    files[file_id] = media[kind]
+    if kind == "photo":
+        return photo_update(user_id, file_id)
+    return voice_update(user_id, file_id, duration=4)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"count": len(values), "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2), "max_ms": round(max(values) * 1000, 2)}
+
+
+async def run(args) -> Dict:
+    rng = random.Random(args.seed)
+    stub_runner, base_url = await start_stub(args.ai_latency)
+    media_dir = tempfile.TemporaryDirectory()
+    media = make_media(media_dir.name)
+    files: Dict[str, str] = {}
+    fake = FakeRequest(latency=args.api_latency, files=files)
+
+    bot = main.LearningBot(FAKE_TOKEN, request=fake)
+    bot.ai_coach.client = AIClient(api_key="stub", base_url=base_url)
+    application = bot.application
+
+    seed_started = time.perf_counter()
+    await seed_users(bot, args.users, rng)
+    seed_seconds = time.perf_counter() - seed_started
+    rss_after_seed = peak_rss_mb()
+
+    enqueued: Dict[int, float] = {}
+    kinds: Dict[int, str] = {}
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Counter = Counter()
+    finished = asyncio.Event()
+    completed = 0
+
+    async def record_done(update: Update, context):
+        nonlocal completed
+        started = enqueued.pop(update.update_id, None)
+        if started is not None:
+            latencies[kinds.pop(update.update_id)].append(time.perf_counter() - started)
+            completed += 1
+            if completed == args.updates:
+                finished.set()
+
+    async def record_error(update, context):
+        errors[type(context.error).__name__] += 1
+
+    application.add_handler(TypeHandler(Update, record_done), group=99)
+    application.add_error_handler(record_error)
+
+    await application.initialize()
+    await bot.post_init(application)
+    # Pay the lazy imports before the clock starts
+    await warm_up()
+    await application.start()
+
+    names = list(MIX)
+    weights = [MIX[name] for name in names]
+    started = time.perf_counter()
+    next_arrival = started
+    for seq in range(args.updates):
+        next_arrival += rng.expovariate(args.rate)
+        delay = next_arrival - time.perf_counter()
+        if delay > 0.001:
+            await asyncio.sleep(delay)
+        kind = rng.choices(names, weights)[0]
+        data = build_update(kind, rng.randint(1, args.users), seq, media, files, rng)
+        update = Update.de_json(data, application.bot)
+        enqueued[update.update_id] = time.perf_counter()
+        kinds[update.update_id] = kind
+        application.update_queue.put_nowait(update)
+    offered_seconds = time.perf_counter() - started
+
+    try:
+        await asyncio.wait_for(finished.wait(), timeout=args.drain_timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+
+    processor_stats = application.update_processor.stats()
+    await application.stop()
+    await application.shutdown()
+    await bot.shutdown(application)
+    await stub_runner.cleanup()
+    media_dir.cleanup()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "scenario": args.scenario,
+        "users": args.users,
+        "updates": args.updates,
+        "rate": args.rate,
+        "ai_latency": args.ai_latency,
+        "seed_seconds": round(seed_seconds, 2),
+        "completed": completed,
+        "lost": args.updates - completed,
+        "offered_per_s": round(args.updates / offered_seconds, 1),
+        "throughput_per_s": round(completed / elapsed, 1),
+        "elapsed_s": round(elapsed, 2),
+        "rss_after_seed_mb": round(rss_after_seed, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "overall": percentiles(all_latencies),
+        "kinds": {kind: percentiles(latencies[kind]) for kind in names},
+        "errors": dict(errors),
+        "bot_api_calls": dict(fake.calls),
+        "ai_cache": bot.ai_coach.cache.stats(),
+        "update_processor": processor_stats,
+    }
+
+
+def print_report(result: Dict, baseline: Dict = None):
+    print(f"{result['users']:,} users, {result['updates']:,} updates offered at "
+          f"{result['offered_per_s']:,.0f}/s (target {result['rate']:,}/s), seeded in {result['seed_seconds']}s")
+    print(f"completed {result['completed']:,} in {result['elapsed_s']}s -> {result['throughput_per_s']:,.0f} updates/s"
+          + (f", {result['lost']} not finished" if result["lost"] else ""))
+    print(f"peak RSS {result['peak_rss_mb']:,.0f} MB (after seeding {result['rss_after_seed_mb']:,.0f} MB)")
+    print(f"{'kind':16s}{'count':>8s}{'p50 ms':>10s}{'p95 ms':>10s}{'p99 ms':>10s}"
+          + (f"{'p95 vs base':>13s}" if baseline else ""))
+    rows = [("overall", result["overall"])] + list(result["kinds"].items())
+    for kind, stats in rows:
+        if not stats.get("count"):
+            continue
+        line = f"{kind:16s}{stats['count']:8d}{stats['p50_ms']:10.1f}{stats['p95_ms']:10.1f}{stats['p99_ms']:10.1f}"
+        if baseline:
+            base = baseline["overall"] if kind == "overall" else baseline["kinds"].get(kind, {})
+            if base.get("p95_ms"):
+                line += f"{(stats['p95_ms'] / base['p95_ms'] - 1) * 100:+12.1f}%"
+        print(line)
+    if result["errors"]:
+        print(f"errors: {result['errors']}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="1k")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--updates", type=int)
+    parser.add_argument("--rate", type=float, help="update arrivals per second")
+    parser.add_argument("--ai-latency", type=float, default=0.5, help="OpenAI stub latency in seconds")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="fake Bot API latency in seconds")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from a previous run to compare against")
+    args = parser.parse_args()
+
+    users, updates, rate = SCENARIOS[args.scenario]
+    args.users = args.users or users
+    args.updates = args.updates or updates
+    args.rate = args.rate or rate
+
+    # Handler errors are counted, not logged one by one
+    logging.getLogger("telegram").setLevel(logging.CRITICAL)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+    result = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
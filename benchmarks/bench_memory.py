@@ -0,0 +1,98 @@
+# Memory footprint of per-user state: the original dict-of-dicts objects
+# versus slotted records, StatsTable columns and CompletionSet arrays.
+#
+#   python -m benchmarks.bench_memory --users 200000 --completed 50
+import argparse
+import gc
+import random
+import tracemalloc
+from datetime import datetime
+
+from src.database.columns import StatsTable
+from src.database.models import User, UserProgress, UserStats
+
+
+class LegacyUser:
+    def __init__(self, user_id, username, first_name):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.created_at = datetime.now()
+        self.subscription = "free"
+        self.language = "en"
+
+
+class LegacyUserStats:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.total_xp = 0
+        self.global_level = 1
+        self.current_streak = 0
+        self.longest_streak = 0
+        self.total_learning_time = 0
+        self.last_active = datetime.now()
+        self.streak_freeze = 0
+
+
+class LegacyUserProgress:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.subjects = {
+            "english": {"level": 1, "xp": 0, "current_unit": "basics", "vocabulary_size": 0,
+                        "mastery_percentage": 0, "completed_lessons": []},
+            "math": {"level": 1, "xp": 0, "current_topic": "arithmetic",
+                     "mastery_percentage": 0, "completed_exercises": []},
+            "programming": {"level": 1, "xp": 0, "current_language": "python",
+                            "mastery_percentage": 0, "completed_challenges": []},
+        }
+        self.weak_topics = []
+        self.strengths = []
+        self.achievements = []
+
+
+def populate(users: int, completed: int, legacy: bool):
+    rng = random.Random(1)
+    table = StatsTable()
+    store = ({}, {}, {})
+    for user_id in range(users):
+        if legacy:
+            user = LegacyUser(user_id, f"user{user_id}", "Name")
+            stats = LegacyUserStats(user_id)
+            progress = LegacyUserProgress(user_id)
+        else:
+            user = User(user_id, f"user{user_id}", "Name")
+            stats = UserStats(user_id, table)
+            progress = UserProgress(user_id)
+        stats.total_xp = rng.randrange(100000)
+        stats.current_streak = rng.randrange(100)
+        for item_id in rng.sample(range(100000), completed):
+            progress.subjects["english"]["completed_lessons"].append(item_id)
+            progress.subjects["math"]["completed_exercises"].append(item_id)
+        store[0][user_id] = user
+        store[1][user_id] = stats
+        store[2][user_id] = progress
+    return store, table
+
+
+def measure(users: int, completed: int, legacy: bool) -> int:
+    gc.collect()
+    tracemalloc.start()
+    store = populate(users, completed, legacy)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return current
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--completed", type=int, default=50)
+    args = parser.parse_args()
+
+    old = measure(args.users, args.completed, legacy=True)
+    new = measure(args.users, args.completed, legacy=False)
+    print(f"{args.users:,} users, {args.completed} completions per subject")
+    print(f"legacy layout:   {old / 2**20:8.1f} MiB ({old / args.users:6.0f} B/user)")
+    print(f"compact layout:  {new / 2**20:8.1f} MiB ({new / args.users:6.0f} B/user)")
+    print(f"saving:          {1 - new / old:8.1%}")
@@ -0,0 +1,44 @@
+# Problem generation throughput per topic, and take() latency from a warm pool.
+#
+#   python -m benchmarks.bench_problem_pool --count 2000
+import argparse
+import asyncio
+import time
+
+from src.learning.problem_pool import MAX_TIER, TOPICS, ProblemPool, generate_batch
+
+
+def bench_generators(count: int):
+    print(f"{'topic':<12} {'tier':>4} {'problems/s':>12}")
+    for topic in TOPICS:
+        for tier in (1, 3, MAX_TIER):
+            started = time.perf_counter()
+            generate_batch(topic, tier, count, seed=tier)
+            elapsed = time.perf_counter() - started
+            print(f"{topic:<12} {tier:>4} {count / elapsed:>12,.0f}")
+
+
+async def bench_take(requests: int):
+    pool = ProblemPool(target_size=200, low_water=50, workers=2)
+    await pool.start()
+    while pool.stats()["refills_in_flight"]:
+        await asyncio.sleep(0.1)
+
+    started = time.perf_counter()
+    for i in range(requests):
+        pool.take(TOPICS[i % len(TOPICS)], 1 + i % 10)
+        if i % 100 == 0:
+            # Give refills a chance to land, as request gaps would
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    await pool.close()
+    print(f"take(): {requests / elapsed:,.0f} requests/s, {elapsed / requests * 1e6:.1f} µs each, {pool.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    bench_generators(args.count)
+    asyncio.run(bench_take(args.requests))
@@ -0,0 +1,118 @@
+# /profile and /stats rendering with and without the profile cache.
+#
+#   python -m benchmarks.bench_profiles --users 10000 --completed 300
+#
+# Seeds users whose subjects each hold --completed finished items, then
+# reports the cost of a first view (reads, aggregates, formatting), of a
+# repeat view (cache hit) and of the old path that walked every subject on
+# each view. Checks that XP events, progress writes and the streak rollover
+# all invalidate the cached text, that the running aggregates match a full
+# recount, and that a render overtaken by a write is not cached.
+import os
+
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("WARM_UP_IMPORTS", "0")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, timedelta
+
+import main
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeRequest
+from src.database.columns import CompletionSet
+from src.database.models import SUBJECT_FIELDS
+from src.gamification.leaderboard import SUBJECTS
+from src.gamification.profiles import ProfileAggregates
+
+
+async def seed(bot: main.LearningBot, users: int, completed: int, rng: random.Random):
+    for user_id in range(1, users + 1):
+        await bot.db.create_user(user_id, f"user{user_id}", f"User{user_id}")
+        progress = bot.db.user_progress[user_id]
+        for subject in SUBJECTS:
+            progress.subjects[subject].completed = CompletionSet(rng.sample(range(completed * 4), completed))
+            progress.subjects[subject].mastery_percentage = rng.randrange(101)
+
+
+async def timed_views(render, user_ids) -> float:
+    started = time.perf_counter()
+    for user_id in user_ids:
+        await render(user_id)
+    return (time.perf_counter() - started) / len(user_ids)
+
+
+async def bench(args):
+    rng = random.Random(args.seed)
+    bot = main.LearningBot(FAKE_TOKEN, request=FakeRequest())
+    xp = bot.xp_system
+    await seed(bot, args.users, args.completed, rng)
+    user_ids = list(range(1, args.users + 1))
+
+    async def walk(user_id: int):
+        # The old path: every view reads, walks every subject and formats
+        progress = await xp.get_user_progress(user_id)
+        ProfileAggregates.from_progress(progress)
+        xp.profiles.invalidate(user_id)
+        return await bot.profile_text(user_id)
+
+    first = await timed_views(bot.profile_text, user_ids)
+    repeat = await timed_views(bot.profile_text, user_ids)
+    walked = await timed_views(walk, user_ids)
+    stats_first = await timed_views(bot.stats_text, user_ids)
+    stats_repeat = await timed_views(bot.stats_text, user_ids)
+    print(f"{args.users:,} users, {args.completed} completed items per subject")
+    print(f"/profile: first view {first * 1e6:.1f} us, repeat {repeat * 1e6:.2f} us, "
+          f"rendering every view {walked * 1e6:.1f} us")
+    print(f"/stats:   first view {stats_first * 1e6:.1f} us, repeat {stats_repeat * 1e6:.2f} us")
+    print(f"cache: {xp.profiles.stats()}")
+
+    # XP events invalidate
+    user_id = user_ids[0]
+    before = await bot.profile_text(user_id)
+    await xp.add_xp(user_id, 50, "math_exercise")
+    after = await bot.profile_text(user_id)
+    assert before != after and "Total XP: 50" in after, after
+    assert "Total XP: 50" in await bot.stats_text(user_id)
+
+    # Progress writes move the aggregates, which match a recount
+    for _ in range(200):
+        subject = rng.choice(SUBJECTS)
+        completed = list(bot.db.user_progress[user_id].subjects[subject].completed)
+        updates = {"mastery_percentage": rng.randrange(101)}
+        field = next(key for key, slot in SUBJECT_FIELDS[subject].items() if slot == "completed")
+        updates[field] = completed + [rng.randrange(10 ** 6, 2 * 10 ** 6)]
+        await xp.record_progress(user_id, subject, updates)
+    recount = ProfileAggregates.from_progress(bot.db.user_progress[user_id])
+    aggregates = xp.profiles.aggregates(user_id, bot.db.user_progress[user_id])
+    assert (aggregates.mastery, aggregates.completed_units) == (recount.mastery, recount.completed_units)
+    assert f"Completed Units: {recount.completed_units}" in await bot.profile_text(user_id)
+    print(f"200 progress writes: aggregates match a recount ({recount.completed_units} units, "
+          f"{recount.mastery:.1f}% mastery)")
+
+    # The rollover invalidates every user at once
+    for other in user_ids[:100]:
+        bot.db.user_stats[other].current_streak = 4
+        bot.db.user_stats[other].last_active = bot.db.user_stats[other].last_active - timedelta(days=1)
+        xp.profiles.invalidate(other)
+        assert "Current Streak: 4 days" in await bot.profile_text(other)
+    await xp.rollover_streaks(date.today() - timedelta(days=1))
+    for other in user_ids[:100]:
+        assert "Current Streak: 5 days" in await bot.profile_text(other)
+
+    # A write between taking the version and storing the text wins
+    version = xp.profiles.version(user_id)
+    await xp.add_xp(user_id, 10, "math_exercise")
+    assert not xp.profiles.store(user_id, version, "profile", "stale")
+    assert "stale" not in await bot.profile_text(user_id)
+    print("XP events, progress writes, the rollover and an overtaken render all invalidate the cached text")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--completed", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=9)
+    asyncio.run(bench(parser.parse_args()))
@@ -0,0 +1,125 @@
+# Conversation memory and prompt budget check against a local OpenAI stub.
+#
+#   python -m benchmarks.bench_prompts --turns 40 --users 20000
+#
+# 1. One user asks --turns follow-up questions. For every request the stub
+#    receives, reports the prompt size in tokens next to what sending the
+#    whole conversation would cost, and checks the budget holds and the
+#    instruction prefix never changes. Condensing calls are counted too.
+# 2. Fills a ConversationStore for --users users and reports memory per
+#    conversation and the cost of building one prompt.
+import os
+
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+# One user asks every question in a row; keep the free tier's bucket out of it
+os.environ.setdefault("AI_BURST_FREE", "1000")
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import Dict, List
+
+from aiohttp import web
+
+from config import Config
+from src.ai.client import AIClient
+from src.ai.coaching import AICoach
+from src.ai.memory import COUNTER, ConversationStore
+from src.ai.prompts import SUMMARY_INSTRUCTIONS, TUTOR_INSTRUCTIONS, PromptBuilder
+from src.database.storage import create_database
+
+ANSWER = ("Here is how to think about it. " * 40).strip()
+
+
+class RecordingStub:
+    def __init__(self):
+        self.prompts: List[List[Dict]] = []
+        self.condensed = 0
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        messages = body["messages"]
+        summarizing = messages[0]["content"] == SUMMARY_INSTRUCTIONS
+        if summarizing:
+            self.condensed += 1
+        else:
+            self.prompts.append(messages)
+        return web.json_response({
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": "stub",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                "role": "assistant", "content": "- Asked about earlier topics" if summarizing else ANSWER,
+            }}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1"
+
+
+async def bench_conversation(args):
+    stub = RecordingStub()
+    runner, base_url = await stub.start()
+    db = create_database("memory://")
+    await db.create_user(1, "user1", "User1")
+    progress = await db.get_user_progress(1)
+    progress.weak_topics = [f"topic {i}" for i in range(200)]
+    coach = AICoach(db=db, client=AIClient(api_key="stub", base_url=base_url))
+    prompts = PromptBuilder()
+    naive = prompts.tokens([{"role": "system", "content": TUTOR_INSTRUCTIONS}])
+    try:
+        for turn in range(args.turns):
+            question = f"Follow-up {turn}: can you explain step {turn} of that again in more detail?"
+            await coach.answer_question(1, question)
+            naive += COUNTER.count(question) + COUNTER.count(ANSWER) + 8
+            await asyncio.sleep(0)  # let condensing run
+            sent = stub.prompts[-1]
+            tokens = prompts.tokens(sent)
+            if turn % max(args.turns // 8, 1) == 0 or turn == args.turns - 1:
+                history = sum(message["role"] == "assistant" for message in sent)
+                print(f"turn {turn + 1:3d}: prompt {tokens:5,} tokens ({history} exchanges kept), "
+                      f"whole conversation would be {naive:6,}")
+            assert tokens <= Config.PROMPT_TOKEN_BUDGET, tokens
+            assert sent[0]["content"] == TUTOR_INSTRUCTIONS
+        print(f"condensing calls: {stub.condensed}, summary "
+              f"{coach.memory.get(1).summary_tokens} tokens (limit {Config.CONVERSATION_SUMMARY_TOKENS})")
+    finally:
+        await coach.client.close()
+        await runner.cleanup()
+
+
+def bench_store(args):
+    store = ConversationStore(max_users=args.users)
+    prompts = PromptBuilder()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for user_id in range(args.users):
+        for turn in range(Config.CONVERSATION_TURNS):
+            store.record(user_id, f"question {turn} from {user_id} about fractions", ANSWER)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{args.users:,} conversations of {Config.CONVERSATION_TURNS} exchanges: "
+          f"{used / 2 ** 20:,.0f} MiB ({used / args.users / 1024:.1f} KiB each)")
+
+    conversation = store.get(0)
+    rounds = 2000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        prompts.answer_messages("and what about the next step?", None, conversation)
+    print(f"prompt build: {(time.perf_counter() - started) / rounds * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--users", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(bench_conversation(args))
+    bench_store(args)
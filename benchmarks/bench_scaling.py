@@ -0,0 +1,224 @@
+# Multi-process scaling benchmark. Runs 1..N shard workers (real
+# LearningBot processes on the fake Bot API and a local OpenAI stub) behind
+# the ShardRouter, all sharing one store, and measures routed throughput.
+#
+#   python -m benchmarks.bench_scaling --workers 1 2 4 8 --store sqlite
+#   python -m benchmarks.bench_scaling --store redis   # bundled RESP stand-in
+#
+# Each run seeds the store, starts the workers, sends a warm-up batch, then
+# pushes --updates updates with at most --window in flight and reports
+# updates/s. Speedup is bounded by the cores available: all workers, the
+# router, the stub and the store share this machine.
+import os
+
+# Settings are read when config is imported, so they go first; spawned
+# workers inherit the environment
+os.environ.setdefault("WARM_UP_IMPORTS", "0")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+# The fake Bot API has no global send limit; measure the bot, not 30 msg/s
+os.environ.setdefault("SEND_RATE_GLOBAL", "0")
+os.environ.setdefault("LEADERBOARD_MERGE_INTERVAL", "2")
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.bench_load import MIX, build_update
+
+# Media updates go through their own worker pools; leave them out so the
+# numbers show the update path itself
+KINDS = {kind: weight for kind, weight in MIX.items() if kind not in ("photo", "voice")}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def run_stub(port: int, latency: float):
+    from aiohttp import web
+
+    from benchmarks.bench_ai_client import make_stub_app
+    web.run_app(make_stub_app(latency), host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def run_store(port: int):
+    from src.database.resp import serve_stand_in
+    asyncio.run(serve_stand_in("127.0.0.1", port))
+
+
+def run_worker(index: int, count: int, path: str, done, api_latency: float):
+    import logging
+
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    import main
+    from benchmarks.fake_telegram import FAKE_TOKEN, FakeRequest
+    from src.runtime.sharding import serve_shard
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # As in main.run_shard, so killing the group also ends pool processes
+    os.setpgrp()
+    bot = main.LearningBot(FAKE_TOKEN, request=FakeRequest(latency=api_latency), shard=(index, count))
+
+    async def record_done(update: Update, context):
+        with done.get_lock():
+            done.value += 1
+
+    bot.application.add_handler(TypeHandler(Update, record_done), group=99)
+    asyncio.run(serve_shard(bot.application, path))
+
+
+async def seed(url: str, users: int, seed_value: int):
+    from src.database.storage import create_database
+
+    rng = random.Random(seed_value)
+    db = create_database(url)
+    db.flush_interval = 0
+    await db.start()
+    for user_id in range(1, users + 1):
+        await db.create_user(user_id, f"user{user_id}", f"User{user_id}")
+        db.user_stats[user_id].total_xp = rng.randrange(0, 50_000)
+        for subject in db.user_progress[user_id].subjects.values():
+            subject["xp"] = rng.randrange(0, 15_000)
+    await db.close()
+
+
+async def wait_for(done, target: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while done.value < target:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{done.value}/{target} updates processed")
+        await asyncio.sleep(0.002)
+
+
+async def drive(paths: List[str], done, args) -> Dict:
+    from src.runtime.sharding import ShardRouter
+
+    rng = random.Random(args.seed)
+    names = list(KINDS)
+    weights = [KINDS[name] for name in names]
+
+    def next_update(seq: int) -> Dict:
+        kind = rng.choices(names, weights)[0]
+        return build_update(kind, rng.randint(1, args.users), seq, {}, {}, rng)
+
+    router = ShardRouter(paths)
+    started = time.perf_counter()
+    await router.connect(timeout=120)
+    for seq in range(args.warmup):
+        await router.route(next_update(seq))
+    await wait_for(done, args.warmup, 120)
+    ready = time.perf_counter() - started
+
+    target = args.warmup + args.updates
+    started = time.perf_counter()
+    for seq in range(args.updates):
+        while seq + args.warmup - done.value >= args.window:
+            await asyncio.sleep(0.001)
+        await router.route(next_update(seq))
+    await wait_for(done, target, 300)
+    elapsed = time.perf_counter() - started
+    await router.close()
+    return {"ready": ready, "elapsed": elapsed, "routed": router.routed}
+
+
+def run(workers: int, url: str, args) -> Dict:
+    context = multiprocessing.get_context("spawn")
+    done = context.Value("q", 0)
+    directory = tempfile.mkdtemp(prefix="shards-")
+    paths = [os.path.join(directory, f"shard-{index}.sock") for index in range(workers)]
+    processes = [
+        context.Process(target=run_worker, args=(index, workers, path, done, args.api_latency))
+        for index, path in enumerate(paths)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        return asyncio.run(drive(paths, done, args))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                os.killpg(process.pid, signal.SIGKILL)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(args):
+    context = multiprocessing.get_context("spawn")
+    stub_port = free_port()
+    helpers = [context.Process(target=run_stub, args=(stub_port, args.ai_latency), daemon=True)]
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{stub_port}/v1"
+    data_dir = tempfile.mkdtemp(prefix="bench-store-")
+    if args.store == "redis":
+        store_port = free_port()
+        helpers.append(context.Process(target=run_store, args=(store_port,), daemon=True))
+    for helper in helpers:
+        helper.start()
+    wait_for_port(stub_port)
+    if args.store == "redis":
+        wait_for_port(store_port)
+
+    print(f"{os.cpu_count()} CPU(s), store {args.store}, {args.users:,} users, "
+          f"{args.updates:,} updates, window {args.window}")
+    baseline = None
+    try:
+        for workers in args.workers:
+            if args.store == "redis":
+                url = f"redis://127.0.0.1:{store_port}/0"
+                from src.database.resp import RespConnection
+                conn = RespConnection("127.0.0.1", store_port)
+                conn.connect()
+                conn.execute("FLUSHDB")
+                conn.close()
+            else:
+                url = f"sqlite:///{os.path.join(data_dir, f'bench-{workers}.db')}"
+            asyncio.run(seed(url, args.users, args.seed))
+            os.environ["DATABASE_URL"] = url
+            result = run(workers, url, args)
+            rate = args.updates / result["elapsed"]
+            baseline = baseline or rate
+            routed = result["routed"]
+            print(f"workers {workers:2d}  {rate:>8,.0f} updates/s  speedup {rate / baseline:4.2f}x  "
+                  f"ready in {result['ready']:5.1f}s  per shard {min(routed):,}-{max(routed):,}")
+    finally:
+        for helper in helpers:
+            helper.terminate()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--store", choices=("sqlite", "redis"), default="sqlite")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--updates", type=int, default=5_000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--window", type=int, default=256, help="max updates in flight")
+    parser.add_argument("--ai-latency", type=float, default=0.05)
+    parser.add_argument("--api-latency", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
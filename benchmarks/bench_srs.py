@@ -0,0 +1,174 @@
+# Spaced-repetition decks: per-card cost, persistence and due reminders.
+#
+#   python -m benchmarks.bench_srs --users 100000
+#
+# Reports bytes per card, review and due_cards cost at growing deck sizes
+# (logarithmic in the deck size), serialisation size and time, and an
+# engine review (deck marked changed, written once per flush) against
+# serialising the deck on every review. Then,
+# against SQLite (and the RESP stand-in with --redis): decks survive a
+# restart byte for byte, the in-memory LRU stays at SRS_MAX_DECKS while
+# evicted decks reload unchanged, and a reminder sweep over --users stored
+# decks claims exactly the users with words due, once each.
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from src.database.models import Database
+from src.database.storage import RedisDatabase, SQLiteDatabase
+from src.learning.srs import DECK_HEADER, MINUTES_PER_DAY, Deck, SRSEngine
+
+NOW = 29_000_000  # minutes since the epoch, fixed so runs repeat
+
+
+def build_deck(cards: int, rng: random.Random) -> Deck:
+    deck = Deck()
+    for card_id in rng.sample(range(cards * 4), cards):
+        deck.add(card_id, NOW - rng.randrange(MINUTES_PER_DAY) + rng.randrange(30 * MINUTES_PER_DAY))
+    return deck
+
+
+def per_call(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+
+def bench_deck(rng: random.Random):
+    for cards in (1_000, 10_000, 100_000):
+        deck = build_deck(cards, rng)
+        ids = list(deck.card_ids)
+        review = per_call(lambda: deck.review(rng.choice(ids), rng.randrange(6), NOW), 20_000)
+        due = per_call(lambda: deck.due_cards(NOW, 20), 5_000)
+        data = deck.to_bytes()
+        assert (len(data) - DECK_HEADER.size) / cards == 34
+        dump = per_call(deck.to_bytes, 50)
+        load = per_call(lambda: Deck.from_bytes(data), 50)
+        copy = Deck.from_bytes(data)
+        assert copy.to_bytes() == data and copy.due_cards(NOW, 50) == deck.due_cards(NOW, 50)
+        print(f"{cards:>7,} cards: {len(data) / cards:.0f} B/card ({len(data) / 1024:,.0f} KiB), "
+              f"review {review * 1e6:5.2f} us, due_cards(20) {due * 1e6:5.2f} us, "
+              f"to_bytes {dump * 1e6:7.1f} us, from_bytes {load * 1e6:7.1f} us")
+
+
+async def bench_engine(rng: random.Random, cards: int = 5_000, reviews: int = 20_000):
+    db = Database()
+    engine = SRSEngine(db)
+    await engine.add_cards(1, range(cards), now=NOW)
+    started = time.perf_counter()
+    for _ in range(reviews):
+        await engine.review(1, rng.randrange(cards), rng.randrange(6), now=NOW)
+    review = (time.perf_counter() - started) / reviews
+    started = time.perf_counter()
+    assert await engine.flush() == 1
+    flush = time.perf_counter() - started
+    deck = await engine.deck(1)
+    assert db.decks[1] == deck.to_bytes()
+    per_review_dump = per_call(deck.to_bytes, 200)
+    print(f"engine, {cards:,}-card deck: review {review * 1e6:.2f} us, one flush {flush * 1e6:.0f} us "
+          f"for {reviews:,} reviews; serialising on every review would add {per_review_dump * 1e6:.0f} us "
+          f"({len(db.decks[1]) / 1024:,.0f} KiB) each")
+
+
+async def bench_store(db: SQLiteDatabase, reopen, users: int, max_decks: int, rng: random.Random):
+    engine = SRSEngine(db, max_decks=max_decks)
+    started = time.perf_counter()
+    for user_id in range(1, users + 1):
+        deck = Deck()
+        # A few users already have words due; the rest are days away
+        first_due = NOW - rng.randrange(1, 600) if user_id % 10 == 0 else NOW + rng.randrange(1, 10 * MINUTES_PER_DAY)
+        for card_id in range(20):
+            deck.add(card_id, first_due + card_id * 60)
+        # Seeded as of a practice session a day ago
+        await db.save_deck(user_id, deck.to_bytes(), max(deck.next_due(), NOW - MINUTES_PER_DAY + 1))
+        if user_id % 10_000 == 0:
+            await db.flush()
+    await db.flush()
+    print(f"stored {users:,} decks in {time.perf_counter() - started:.1f}s")
+
+    # Reviews through the engine, with far more users than max_decks
+    touched = rng.sample(range(1, users + 1), min(users, max_decks * 5))
+    expected = {}
+    for i, user_id in enumerate(touched, 1):
+        await engine.review(user_id, rng.randrange(20), rng.randrange(6), now=NOW - MINUTES_PER_DAY)
+        expected[user_id] = (await engine.deck(user_id)).to_bytes()
+        # Changed decks stay in memory until the next flush
+        assert len(engine) <= max_decks + len(engine._dirty)
+        if i % 500 == 0:
+            await engine.flush()
+            assert len(engine) <= max_decks
+    await engine.flush()
+    evicted = [user_id for user_id in touched[:100] if user_id not in engine._decks]
+    for user_id in evicted:
+        assert (await engine.deck(user_id)).to_bytes() == expected[user_id]
+    print(f"{len(touched):,} users reviewed: {len(engine)} decks in memory (max {max_decks}), "
+          f"{len(evicted)} evicted decks reloaded unchanged, {engine.loads:,} loads")
+
+    # Everything is due by NOW except decks first due later
+    due_users = set()
+    for user_id in range(1, users + 1):
+        deck = Deck.from_bytes(expected[user_id]) if user_id in expected else None
+        if deck is None:
+            deck = Deck.from_bytes(await db.load_deck(user_id))
+        if deck.next_due() <= NOW:
+            due_users.add(user_id)
+    started = time.perf_counter()
+    claimed = []
+    while True:
+        batch = await engine.sweep_due_users(now=NOW, limit=1000)
+        if not batch:
+            break
+        claimed.extend(batch)
+    elapsed = time.perf_counter() - started
+    assert len(claimed) == len(set(claimed)) and set(claimed) == due_users, (len(claimed), len(due_users))
+    # Claimed users come back only a day later
+    assert due_users.isdisjoint(await engine.sweep_due_users(now=NOW + MINUTES_PER_DAY - 1, limit=users))
+    assert set(await engine.sweep_due_users(now=NOW + MINUTES_PER_DAY, limit=users)) >= due_users
+    print(f"sweep: {len(claimed):,} of {users:,} users due, claimed once each in {elapsed * 1000:.0f} ms; "
+          f"re-armed for a day later")
+
+    # A restart keeps every deck
+    await db.close()
+    db = reopen()
+    await db.start()
+    engine = SRSEngine(db, max_decks=max_decks)
+    for user_id in rng.sample(touched, 200):
+        assert (await engine.deck(user_id)).to_bytes() == expected[user_id]
+    await db.close()
+    print("decks reloaded unchanged after a restart")
+
+
+async def bench(args):
+    rng = random.Random(args.seed)
+    bench_deck(rng)
+    await bench_engine(rng)
+
+    path = os.path.join(tempfile.mkdtemp(), "srs.db")
+    print("-- sqlite")
+    db = SQLiteDatabase(path, flush_interval=0)
+    await db.start()
+    await bench_store(db, lambda: SQLiteDatabase(path, flush_interval=0), args.users, args.max_decks, rng)
+
+    if args.redis:
+        from src.database.resp import StandInServer
+        server = StandInServer()
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        url = f"redis://127.0.0.1:{listener.sockets[0].getsockname()[1]}/0"
+        print("-- redis stand-in")
+        db = RedisDatabase(url, flush_interval=0)
+        await db.start()
+        await bench_store(db, lambda: RedisDatabase(url, flush_interval=0), args.users // 10, args.max_decks, rng)
+        listener.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--max-decks", type=int, default=2_000)
+    parser.add_argument("--redis", action="store_true", help="also run the store checks against the RESP stand-in")
+    parser.add_argument("--seed", type=int, default=5)
+    asyncio.run(bench(parser.parse_args()))
@@ -0,0 +1,96 @@
+# Cold-start budget: `import main` time and time-to-first-handled-update,
+# each measured in fresh interpreters. Exits non-zero when the median
+# exceeds the budget, so it can gate releases.
+#
+#   python -m benchmarks.bench_startup --runs 5 --max-import-ms 800 --max-first-update-ms 1500
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import time
+started = time.perf_counter()
+import main
+print(time.perf_counter() - started)
+"""
+
+
+def child_first_update():
+    # Runs inside a fresh interpreter: import, build the bot, handle /start
+    started = time.perf_counter()
+    import asyncio
+
+    import main
+    from telegram import Update
+    from benchmarks.fake_telegram import FAKE_TOKEN, FakeRequest, command_update
+
+    imported = time.perf_counter()
+
+    async def first_update():
+        bot = main.LearningBot(FAKE_TOKEN, request=FakeRequest())
+        application = bot.application
+        await application.initialize()
+        await bot.post_init(application)
+        ready = time.perf_counter()
+        await application.process_update(Update.de_json(command_update(1001, "/start"), application.bot))
+        handled = time.perf_counter()
+        await application.shutdown()
+        await bot.shutdown(application)
+        return ready, handled
+
+    ready, handled = asyncio.run(first_update())
+    print(json.dumps({
+        "import": imported - started,
+        "ready": ready - started,
+        "first_update": handled - started,
+    }))
+
+
+def run_python(args, env) -> str:
+    return subprocess.run(
+        [sys.executable] + args, cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=800)
+    parser.add_argument("--max-first-update-ms", type=float, default=1500)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_first_update()
+        return
+
+    env = dict(os.environ, DATABASE_URL="memory://", WARM_UP_IMPORTS="0", TELEGRAM_BOT_TOKEN="")
+
+    import_times, first_update_times, process_times = [], [], []
+    for _ in range(args.runs):
+        import_times.append(float(run_python(["-c", IMPORT_PROBE], env)) * 1000)
+        started = time.perf_counter()
+        result = json.loads(run_python(["-m", "benchmarks.bench_startup", "--child"], env).strip().splitlines()[-1])
+        process_times.append((time.perf_counter() - started) * 1000)
+        first_update_times.append(result["first_update"] * 1000)
+
+    import_ms = statistics.median(import_times)
+    first_update_ms = statistics.median(first_update_times)
+    print(f"import main:          median {import_ms:7.1f} ms  (budget {args.max_import_ms:.0f} ms)")
+    print(f"first handled update: median {first_update_ms:7.1f} ms  (budget {args.max_first_update_ms:.0f} ms)")
+    print(f"whole process:        median {statistics.median(process_times):7.1f} ms")
+
+    failed = import_ms > args.max_import_ms or first_update_ms > args.max_first_update_ms
+    if failed:
+        print("startup budget exceeded")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# Streamed tutor answers against a local streaming OpenAI stub and the
+# fake Bot API.
+#
+#   python -m benchmarks.bench_streaming --users 20 --tokens 300 --token-interval 0.02
+#
+# The stub takes --first-token seconds before the first token, then sends
+# --tokens tokens every --token-interval seconds (non-streaming requests
+# get the whole answer after the same total time). For each mode it sends
+# one question per user through the real update processor and reports:
+#   visible: question -> first message in the chat
+#   done:    question -> final text in the chat
+#   edits:   editMessageText calls per answer
+# Then checks cancellation: a second message from the user while the
+# answer is streaming closes the upstream request and marks the partial
+# answer as stopped. Last, a stream that errors or stalls past the client
+# timeout after some tokens ends with the partial answer marked cut off.
+import os
+
+os.environ.setdefault("DATABASE_URL", "memory://")
+os.environ.setdefault("WARM_UP_IMPORTS", "0")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("SEND_RATE_GLOBAL", "0")
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import main
+from benchmarks.fake_telegram import FAKE_TOKEN, FakeRequest, text_update
+from config import Config
+from src.ai.client import AIClient
+from src.runtime.outbound import STREAM_FAILED, STREAM_STOPPED
+
+
+class StreamingStub:
+    def __init__(self, first_token: float, tokens: int, token_interval: float):
+        self.first_token = first_token
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.completed = 0
+        self.disconnected = 0
+        # Mid-stream trouble after this many tokens: "error" or "stall"
+        self.fail_after: Optional[int] = None
+        self.failure = "error"
+
+    def chunk(self, content: str, finish: bool = False) -> bytes:
+        body = {
+            "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": "stub",
+            "choices": [{"index": 0, "delta": {} if finish else {"content": content},
+                         "finish_reason": "stop" if finish else None}],
+        }
+        return f"data: {json.dumps(body)}\n\n".encode()
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        words = [f"word{i} " for i in range(self.tokens)]
+        if not body.get("stream"):
+            await asyncio.sleep(self.first_token + self.tokens * self.token_interval)
+            self.completed += 1
+            return web.json_response({
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                "model": "stub",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": self.tokens, "total_tokens": self.tokens + 1},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            await asyncio.sleep(self.first_token)
+            for i, word in enumerate(words):
+                if i == self.fail_after:
+                    if self.failure == "stall":
+                        await asyncio.sleep(3600)
+                    await response.write(f"data: {json.dumps({'error': {'message': 'stub failure'}})}\n\n".encode())
+                    return response
+                await response.write(self.chunk(word))
+                await asyncio.sleep(self.token_interval)
+            await response.write(self.chunk("", finish=True))
+            await response.write(b"data: [DONE]\n\n")
+        except asyncio.CancelledError:
+            # The bot closed the stream
+            self.disconnected += 1
+            raise
+        except ConnectionResetError:
+            self.disconnected += 1
+            return response
+        self.completed += 1
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://127.0.0.1:{port}/v1"
+
+
+async def make_bot(base_url: str, users: int, fake: FakeRequest) -> "main.LearningBot":
+    bot = main.LearningBot(FAKE_TOKEN, request=fake)
+    # One completion slot per user, so no question is turned away as busy
+    bot.ai_coach.client = AIClient(api_key="stub", base_url=base_url, max_concurrency=max(users, 1))
+    for user_id in range(1, users + 1):
+        await bot.db.create_user(user_id, f"user{user_id}", f"User{user_id}")
+    await bot.application.initialize()
+    await bot.application.start()
+    return bot
+
+
+async def ask_all(bot: "main.LearningBot", fake: FakeRequest, users: int) -> Dict[str, List[float]]:
+    processed = asyncio.Event()
+    done = 0
+
+    async def record_done(update: Update, context):
+        nonlocal done
+        done += 1
+        if done == users:
+            processed.set()
+
+    bot.application.add_handler(TypeHandler(Update, record_done), group=99)
+    asked = time.monotonic()
+    for user_id in range(1, users + 1):
+        # Distinct questions, so nothing comes from the response cache
+        data = text_update(user_id, f"Explain topic number {user_id}")
+        bot.application.update_queue.put_nowait(Update.de_json(data, bot.application.bot))
+    await processed.wait()
+
+    first: Dict[int, float] = {}
+    last: Dict[int, float] = {}
+    edits: Dict[int, int] = defaultdict(int)
+    for entry in fake.sent:
+        chat_id = int(entry["chat_id"])
+        first.setdefault(chat_id, entry["at"])
+        last[chat_id] = entry["at"]
+        edits[chat_id] += entry["method"] == "editMessageText"
+    return {
+        "visible": [first[user_id] - asked for user_id in first],
+        "done": [last[user_id] - asked for user_id in last],
+        "edits": [edits[user_id] for user_id in first],
+    }
+
+
+def summary(values: List[float]) -> str:
+    return f"p50 {statistics.median(values):6.2f}  max {max(values):6.2f}"
+
+
+async def bench_modes(stub: StreamingStub, base_url: str, args):
+    answer_seconds = args.first_token + args.tokens * args.token_interval
+    print(f"{args.users} users, {args.tokens} tokens, first token {args.first_token:.2f}s, "
+          f"answer takes {answer_seconds:.2f}s, edit interval {Config.STREAM_EDIT_INTERVAL}s")
+    for streaming in (False, True):
+        Config.STREAM_REPLIES = streaming
+        fake = FakeRequest(latency=args.api_latency)
+        bot = await make_bot(base_url, args.users, fake)
+        result = await ask_all(bot, fake, args.users)
+        label = "streaming" if streaming else "buffered "
+        print(f"  {label}  visible {summary(result['visible'])}s  done {summary(result['done'])}s  "
+              f"edits/answer {statistics.mean(result['edits']):5.1f} (max {max(result['edits'])})")
+        await bot.application.stop()
+        await bot.application.shutdown()
+        await bot.ai_coach.client.close()
+        if streaming:
+            # Edits must stay within the edit interval
+            assert max(result["edits"]) <= max(result["done"]) / Config.STREAM_EDIT_INTERVAL + 2
+
+
+async def bench_cancel(stub: StreamingStub, base_url: str, args):
+    Config.STREAM_REPLIES = True
+    fake = FakeRequest(latency=args.api_latency)
+    bot = await make_bot(base_url, 1, fake)
+    disconnected = stub.disconnected
+    bot.application.update_queue.put_nowait(
+        Update.de_json(text_update(1, "Explain something long"), bot.application.bot)
+    )
+    await asyncio.sleep(args.first_token + 1.0)
+    interrupted = time.monotonic()
+    bot.application.update_queue.put_nowait(
+        Update.de_json(text_update(1, "/profile"), bot.application.bot)
+    )
+    while stub.disconnected == disconnected:
+        if time.monotonic() - interrupted > 5:
+            raise AssertionError("upstream stream was not closed")
+        await asyncio.sleep(0.005)
+    closed_after = time.monotonic() - interrupted
+    await asyncio.sleep(0.5)
+    answer = [entry for entry in fake.sent if entry.get("message_id") or "word" in entry.get("text", "")]
+    stopped = any(entry["text"].endswith(STREAM_STOPPED) for entry in answer)
+    print(f"cancel: upstream closed {closed_after * 1000:.0f} ms after the new message, "
+          f"partial answer marked stopped: {stopped}")
+    assert stopped
+    await bot.application.stop()
+    await bot.application.shutdown()
+    await bot.ai_coach.client.close()
+
+
+async def bench_failure(stub: StreamingStub, base_url: str, args):
+    Config.STREAM_REPLIES = True
+    stub.fail_after = 20
+    try:
+        for failure in ("error", "stall"):
+            stub.failure = failure
+            fake = FakeRequest(latency=args.api_latency)
+            bot = await make_bot(base_url, 1, fake)
+            bot.ai_coach.client = AIClient(api_key="stub", base_url=base_url, timeout=1.0, max_retries=0)
+            await ask_all(bot, fake, 1)
+            final = fake.sent[-1]["text"]
+            print(f"{failure}: partial answer of {final.count('word')} tokens marked cut off: "
+                  f"{final.endswith(STREAM_FAILED)}")
+            assert final.endswith(STREAM_FAILED) and "word19" in final, final[-80:]
+            await bot.application.stop()
+            await bot.application.shutdown()
+            await bot.ai_coach.client.close()
+    finally:
+        stub.fail_after = None
+
+
+async def main_async(args):
+    stub = StreamingStub(args.first_token, args.tokens, args.token_interval)
+    runner, base_url = await stub.start()
+    try:
+        await bench_modes(stub, base_url, args)
+        await bench_cancel(stub, base_url, args)
+        await bench_failure(stub, base_url, args)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--first-token", type=float, default=0.4)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--api-latency", type=float, default=0.03)
+    asyncio.run(main_async(parser.parse_args()))
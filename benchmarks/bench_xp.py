@@ -0,0 +1,173 @@
+# XP pipeline and streak rollover benchmark.
+#
+#   python -m benchmarks.bench_xp --users 1000000 --events 200000
+#
+# 1. Applies the same random XP events inline (one write per event) and
+#    through the batched queue, and checks both end in the same totals.
+# 2. Closes one day for every user with the vectorised rollover and
+#    compares the result and the time with a per-user loop, at 20k users
+#    and at --users. Some users were active only after the day closed,
+#    some on both days. numpy is loaded first, as the warm-up does in the
+#    bot, so its import is not counted against the vectorised pass.
+# 3. Catches up on three missed days and checks the streaks and the stored
+#    marker.
+import argparse
+import asyncio
+import importlib
+import random
+import time
+from datetime import date, timedelta
+
+from config import Config
+from src.database.models import Database
+from src.gamification.streaks import day_start, mark_active, streak_bonus, streak_day
+from src.gamification.xp_system import ACTIVITY_SUBJECTS, ROLLOVER_MARKER, XPSystem
+
+ACTIVITIES = list(ACTIVITY_SUBJECTS)
+# One clock for every database built, so runs compare equal
+NOW = time.time()
+
+
+async def make_db(users: int, seed: int) -> Database:
+    rng = random.Random(seed)
+    db = Database()
+    hour = Config.STREAK_ROLLOVER_HOUR
+    for user_id in range(users):
+        await db.create_user(user_id, f"user{user_id}", "Bench")
+        stats = db.user_stats[user_id]
+        stats.current_streak = rng.choice((0, 0, 1, 3, 6, 13, 29, 99))
+        stats.longest_streak = stats.current_streak + rng.randrange(5)
+        stats.streak_freeze = rng.randrange(Config.STREAK_FREEZE_MAX + 1)
+        # Spread last activity over the last four days; some users were
+        # also active the day before their last activity
+        stats._last_active = NOW - rng.uniform(0, 4 * 86400)
+        day = streak_day(stats._last_active, hour).toordinal()
+        stats.active_day, stats.active_days = mark_active(0, 0, day)
+        if rng.random() < 0.3:
+            stats.active_day, stats.active_days = mark_active(stats.active_day, stats.active_days, day - 1)
+    return db
+
+
+def snapshot(db: Database):
+    return {
+        user_id: (stats.total_xp, stats.global_level, stats.current_streak, stats.longest_streak,
+                  stats.streak_freeze, tuple(
+                      (subject["xp"], subject["level"]) for subject in db.user_progress[user_id].subjects.values()
+                  ))
+        for user_id, stats in db.user_stats.items()
+    }
+
+
+async def bench_events(users: int, events: int, seed: int):
+    rng = random.Random(seed)
+    # Skewed towards a hot minority, like real traffic
+    stream = [(min(int(rng.paretovariate(1.2)) - 1, users - 1), rng.choice((10, 15, 25, 50)), rng.choice(ACTIVITIES))
+              for _ in range(events)]
+    results = {}
+    for mode in ("inline", "batched"):
+        db = await make_db(users, seed)
+        levels = []
+        system = XPSystem(db=db, on_level_up=lambda user_id, info: _record(levels, user_id, info))
+        if mode == "batched":
+            await system.start()
+        started = time.perf_counter()
+        for user_id, xp, activity in stream:
+            await system.add_xp(user_id, xp, activity)
+            # Handlers yield to the loop between updates
+            await asyncio.sleep(0)
+        submitted = time.perf_counter() - started
+        await system.events.flush()
+        await asyncio.sleep(0)
+        elapsed = time.perf_counter() - started
+        await system.close()
+        results[mode] = snapshot(db)
+        print(f"{mode:8s} {events:>9,} events  handler side {submitted:6.2f}s "
+              f"({events / submitted:>10,.0f}/s)  applied after {elapsed:6.2f}s  "
+              f"batches {system.events.batches:>6,}  level-ups {system.level_ups:>7,} notified {len(levels):>7,}")
+    assert results["inline"] == results["batched"], "batched totals differ from inline"
+
+
+async def _record(levels: list, user_id: int, info: dict):
+    levels.append((user_id, info))
+
+
+def reference_rollover(db: Database, day: date):
+    # Scalar version of streaks.rollover_streaks, one user at a time
+    hour = Config.STREAK_ROLLOVER_HOUR
+    since, until = day_start(day, hour), day_start(day + timedelta(days=1), hour)
+    for stats in db.user_stats.values():
+        offset = stats.active_day - day.toordinal()
+        remembered = 0 <= offset < 32 and stats.active_days >> offset & 1
+        if remembered or since <= stats._last_active < until:
+            stats.current_streak += 1
+            stats.longest_streak = max(stats.longest_streak, stats.current_streak)
+            if stats.current_streak % Config.STREAK_FREEZE_EVERY == 0:
+                stats.streak_freeze = max(stats.streak_freeze, min(stats.streak_freeze + 1, Config.STREAK_FREEZE_MAX))
+        elif stats.current_streak > 0:
+            if stats.streak_freeze > 0:
+                stats.streak_freeze -= 1
+            else:
+                stats.current_streak = 0
+
+
+async def bench_rollover(users: int, seed: int) -> float:
+    yesterday = streak_day(NOW, Config.STREAK_ROLLOVER_HOUR) - timedelta(days=1)
+    reference = await make_db(users, seed)
+    started = time.perf_counter()
+    reference_rollover(reference, yesterday)
+    looped = time.perf_counter() - started
+    print(f"per-user loop  {users:>9,} users {looped:6.3f}s")
+
+    db = await make_db(users, seed)
+    system = XPSystem(db=db)
+    started = time.perf_counter()
+    counts = await system.rollover_streaks(yesterday)
+    vectorised = time.perf_counter() - started
+    print(f"vectorised     {users:>9,} users {vectorised:6.3f}s  ({looped / vectorised:.1f}x)  {counts}")
+    assert snapshot(db) == snapshot(reference), "vectorised rollover differs from the per-user loop"
+    return looped / vectorised
+    assert [streak_bonus(s) for s in (0, 6, 7, 29, 30, 99, 100)] == [0, 0, 10, 10, 25, 25, 50]
+
+
+async def check_catch_up():
+    # Down for three streak days: each is closed in order from the bitmask
+    hour = Config.STREAK_ROLLOVER_HOUR
+    latest = streak_day(time.time(), hour) - timedelta(days=1)
+    db = Database()
+    system = XPSystem(db=db)
+    assert await system.catch_up_rollover() == [] and await system.last_rolled_day() == latest
+    await db.publish_aggregate(ROLLOVER_MARKER, 0, (latest - timedelta(days=3)).isoformat().encode())
+    missed = [latest - timedelta(days=offset) for offset in (2, 1, 0)]
+    # every day / only the first missed day / never, with one freeze
+    for user_id, days, streak, freezes in ((1, missed, 10, 0), (2, missed[:1], 10, 0), (3, [], 5, 1)):
+        await db.create_user(user_id, f"user{user_id}", "Bench")
+        stats = db.user_stats[user_id]
+        stats.current_streak, stats.longest_streak, stats.streak_freeze = streak, streak, freezes
+        for day in days:
+            stats.active_day, stats.active_days = mark_active(stats.active_day, stats.active_days, day.toordinal())
+        # Active again today, after the last missed day closed
+        stats._last_active = time.time()
+    assert await system.catch_up_rollover() == missed
+    assert await system.last_rolled_day() == latest
+    assert await system.catch_up_rollover() == []
+    streaks = [(db.user_stats[user_id].current_streak, db.user_stats[user_id].streak_freeze) for user_id in (1, 2, 3)]
+    assert streaks == [(13, 0), (0, 0), (0, 0)], streaks
+    print(f"catch-up closed {', '.join(map(str, missed))} in order: streaks {streaks}")
+
+
+async def main(users: int, events: int, seed: int):
+    await bench_events(min(users, 100_000), events, seed)
+    importlib.import_module("numpy")
+    for size in sorted({min(users, 20_000), users}):
+        speedup = await bench_rollover(size, seed)
+    assert users < 100_000 or speedup > 1, "vectorised rollover is not faster at this scale"
+    await check_catch_up()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.events, args.seed))
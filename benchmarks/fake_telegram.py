@@ -0,0 +1,133 @@
+# Offline stand-in for the Telegram Bot API plus builders for synthetic
+# updates, shared by the benchmarks. Pass FakeRequest() to
+# LearningBot(token, request=...) and feed updates to
+# application.process_update().
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "TutorBot", "username": "tutor_bot"}
+FAKE_TOKEN = "123456:BENCHMARK-TOKEN"
+
+
+class FakeRequest(BaseRequest):
+    # Answers every Bot API method locally. `latency` simulates the round
+    # trip; `flood_every` makes every n-th send fail with retry_after.
+    # `files` maps file_id to a local path; getFile returns that path the
+    # way a local-mode Bot API server does, so downloads stay offline.
+    # Sends to chats in `blocked` fail with 403, as for users who blocked
+    # the bot. Every recorded send carries its monotonic time in "at".
+    def __init__(self, latency: float = 0.0, flood_every: int = 0, retry_after: int = 1,
+                 files: Optional[Dict[str, str]] = None, blocked: Optional[Set[int]] = None):
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.files = files if files is not None else {}
+        self.blocked = blocked or set()
+        self.calls: Counter = Counter()
+        self.sent: List[Dict] = []
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params: Dict) -> Dict:
+        return {
+            "message_id": params.get("message_id") or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        self.calls[api_method] += 1
+
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText", "sendPhoto"):
+            if int(params.get("chat_id", 0)) in self.blocked:
+                return 403, json.dumps({
+                    "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user",
+                }).encode()
+            if self.flood_every and self.calls[api_method] % self.flood_every == 0:
+                return 429, json.dumps({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }).encode()
+            result = self._message(params)
+            self.sent.append({"method": api_method, "at": time.monotonic(), **params})
+        elif api_method == "getFile":
+            file_id = params.get("file_id", "file")
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": 0,
+                      "file_path": self.files.get(file_id, f"files/{file_id}")}
+        else:
+            # answerCallbackQuery, setWebhook, deleteWebhook, sendChatAction, ...
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def _message(user_id: int, **fields) -> Dict:
+    return {
+        "message_id": next(_update_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        **fields,
+    }
+
+
+def command_update(user_id: int, command: str) -> Dict:
+    text = command if command.startswith("/") else f"/{command}"
+    name_length = len(text.split()[0])
+    return {"update_id": next(_update_ids), "message": _message(
+        user_id, text=text, entities=[{"type": "bot_command", "offset": 0, "length": name_length}]
+    )}
+
+
+def text_update(user_id: int, text: str) -> Dict:
+    return {"update_id": next(_update_ids), "message": _message(user_id, text=text)}
+
+
+def photo_update(user_id: int, file_id: str) -> Dict:
+    return {"update_id": next(_update_ids), "message": _message(user_id, photo=[
+        {"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960, "file_size": 120000}
+    ])}
+
+
+def voice_update(user_id: int, file_id: str, duration: int = 3) -> Dict:
+    return {"update_id": next(_update_ids), "message": _message(user_id, voice={
+        "file_id": file_id, "file_unique_id": file_id, "duration": duration,
+        "mime_type": "audio/ogg", "file_size": 16000 * duration
+    })}
+
+
+def callback_update(user_id: int, data: str) -> Dict:
+    return {"update_id": next(_update_ids), "callback_query": {
+        "id": str(next(_update_ids)),
+        "from": _user(user_id),
+        "chat_instance": str(user_id),
+        "data": data,
+        "message": {**_message(user_id, text="menu"), "from": BOT_USER},
+    }}
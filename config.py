@@ -7,12 +7,162 @@ class Config:
     TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot.db")
+    DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", 1.0))
+    DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", 5.0))
+    # SQLite/Redis hot cache: users idle this long, or the least recently
+    # used past the cap, are dropped after a flush and reloaded on a miss
+    DB_CACHE_MAX_USERS = int(os.getenv("DB_CACHE_MAX_USERS", 50000))
+    DB_CACHE_IDLE_TTL = float(os.getenv("DB_CACHE_IDLE_TTL", 1800))
+    UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 32))
+    UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", 4096))
     WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+    
+    # Multi-process serving: WORKERS > 1 runs that many bot processes, each
+    # owning the users with user_id % WORKERS == index, behind one process
+    # that receives updates and routes them over unix sockets. State is
+    # shared through DATABASE_URL (sqlite:/// or redis://), and each worker
+    # publishes its leaderboard tops every LEADERBOARD_MERGE_INTERVAL
+    # seconds for the others to merge.
+    WORKERS = int(os.getenv("WORKERS", 1))
+    SHARD_SOCKET_DIR = os.getenv("SHARD_SOCKET_DIR", "/tmp/learning-bot")
+    LEADERBOARD_MERGE_INTERVAL = float(os.getenv("LEADERBOARD_MERGE_INTERVAL", 15))
+    LEADERBOARD_MERGE_TOP = int(os.getenv("LEADERBOARD_MERGE_TOP", 100))
+    WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", 30))
+    
+    # Observability: /metrics sits next to the webhook. METRICS_TOKEN is
+    # required as a bearer token for /metrics and /debug/profiler; without
+    # it neither endpoint is served.
+    METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    SLOW_HANDLER_SECONDS = float(os.getenv("SLOW_HANDLER_SECONDS", 2.0))
+    PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", 0.005))
+    LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.5))
+    
+    # Startup: heavy modules are imported lazily, then warmed in the background
+    WARM_UP_IMPORTS = os.getenv("WARM_UP_IMPORTS", "1") == "1"
+    WARM_UP_DELAY = float(os.getenv("WARM_UP_DELAY", 2))
+    
+    # OpenAI client settings
+    OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+    OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 16))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 32))
+    OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 30))
+    OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 3))
+    OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", 0.5))
+    OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", 8))
+    
+    # AI response cache (RESPONSE_CACHE_PATH enables the on-disk tier)
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 10000))
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")
+    
+    # Tutor conversation memory: the last CONVERSATION_TURNS exchanges per
+    # user (each side capped to CONVERSATION_TURN_TOKENS), forgotten after
+    # CONVERSATION_IDLE_TTL seconds without a question. Older exchanges
+    # become notes, condensed by the model (CONVERSATION_CONDENSE) or
+    # trimmed once they pass CONVERSATION_SUMMARY_TOKENS.
+    CONVERSATION_TURNS = int(os.getenv("CONVERSATION_TURNS", 4))
+    CONVERSATION_TURN_TOKENS = int(os.getenv("CONVERSATION_TURN_TOKENS", 200))
+    CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", 30 * 60))
+    CONVERSATION_MAX_USERS = int(os.getenv("CONVERSATION_MAX_USERS", 20_000))
+    CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", 200))
+    CONVERSATION_CONDENSE = os.getenv("CONVERSATION_CONDENSE", "1") == "1"
+    # Prompt size limit in tokens, and weak topics mentioned per prompt
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 1500))
+    PROMPT_MAX_WEAK_TOPICS = int(os.getenv("PROMPT_MAX_WEAK_TOPICS", 5))
+    
+    # Active exercises awaiting an answer
+    EXERCISE_TTL = float(os.getenv("EXERCISE_TTL", 30 * 60))
+    EXERCISE_MAX_SESSIONS = int(os.getenv("EXERCISE_MAX_SESSIONS", 100_000))
+    EXERCISE_MAX_ATTEMPTS = int(os.getenv("EXERCISE_MAX_ATTEMPTS", 3))
+    # Symbolic answer checking falls back to sympy in a worker process
+    ANSWER_CHECK_WORKERS = int(os.getenv("ANSWER_CHECK_WORKERS", 1))
+    ANSWER_CHECK_TIMEOUT = float(os.getenv("ANSWER_CHECK_TIMEOUT", 2.0))
+    ANSWER_CHECK_CACHE_SIZE = int(os.getenv("ANSWER_CHECK_CACHE_SIZE", 10000))
     
     # XP settings
     BASE_XP_RATE = 10
     STREAK_MULTIPLIER = 1.1
+    # XP events are applied in batches by a background task
+    XP_BATCH_SIZE = int(os.getenv("XP_BATCH_SIZE", 512))
+    XP_FLUSH_INTERVAL = float(os.getenv("XP_FLUSH_INTERVAL", 0.2))
+    # Nightly streak rollover: one freeze earned every STREAK_FREEZE_EVERY
+    # days of streak, up to STREAK_FREEZE_MAX banked
+    STREAK_ROLLOVER_HOUR = int(os.getenv("STREAK_ROLLOVER_HOUR", 0))
+    STREAK_FREEZE_EVERY = int(os.getenv("STREAK_FREEZE_EVERY", 7))
+    STREAK_FREEZE_MAX = int(os.getenv("STREAK_FREEZE_MAX", 2))
+    # Rendered /profile and /stats texts are kept for this many users
+    PROFILE_CACHE_MAX_USERS = int(os.getenv("PROFILE_CACHE_MAX_USERS", 100_000))
+    
+    # Lesson content pack (python -m src.learning.catalog builds one; unset:
+    # the built-in lessons) and how many users' lesson cursors to keep
+    LESSON_PACK_PATH = os.getenv("LESSON_PACK_PATH")
+    LESSON_CURSOR_MAX_USERS = int(os.getenv("LESSON_CURSOR_MAX_USERS", 100_000))
+    
+    # Vocabulary decks held in memory (the rest are loaded from storage on
+    # use), and how often users with words due get a reminder sweep (0: off)
+    SRS_MAX_DECKS = int(os.getenv("SRS_MAX_DECKS", 20_000))
+    # Reviews mark a deck changed; changed decks are written this often
+    SRS_FLUSH_INTERVAL = float(os.getenv("SRS_FLUSH_INTERVAL", 5.0))
+    SRS_REMINDER_INTERVAL = float(os.getenv("SRS_REMINDER_INTERVAL", 15 * 60))
+    SRS_REMINDER_BATCH = int(os.getenv("SRS_REMINDER_BATCH", 1000))
     
     # Learning settings
     DAILY_LESSON_LIMIT_FREE = 5
     DAILY_LESSON_LIMIT_PREMIUM = 50
+    
+    # Admission control for LLM calls, per subscription tier: a token
+    # bucket per user (rate per second, burst), how long a request may wait
+    # for a slot before degrading, and for free users how far premium
+    # requests may overtake them and how many may queue at all
+    AI_RATE_FREE = float(os.getenv("AI_RATE_FREE", 0.1))
+    AI_BURST_FREE = float(os.getenv("AI_BURST_FREE", 5))
+    AI_RATE_PREMIUM = float(os.getenv("AI_RATE_PREMIUM", 1.0))
+    AI_BURST_PREMIUM = float(os.getenv("AI_BURST_PREMIUM", 20))
+    AI_AGING_FREE = float(os.getenv("AI_AGING_FREE", 10))
+    AI_MAX_WAIT_FREE = float(os.getenv("AI_MAX_WAIT_FREE", 5))
+    AI_MAX_WAIT_PREMIUM = float(os.getenv("AI_MAX_WAIT_PREMIUM", 20))
+    AI_MAX_WAITING_FREE = int(os.getenv("AI_MAX_WAITING_FREE", 64))
+    RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", 100_000))
+    
+    # Outbound Bot API limits: messages per second for the whole bot (0:
+    # unlimited; split across shard workers), per private chat and per
+    # group, and the share of the global rate broadcasts may use
+    SEND_RATE_GLOBAL = float(os.getenv("SEND_RATE_GLOBAL", 30))
+    SEND_RATE_CHAT = float(os.getenv("SEND_RATE_CHAT", 1.0))
+    SEND_RATE_GROUP = float(os.getenv("SEND_RATE_GROUP", 20 / 60))
+    SEND_BURST_CHAT = float(os.getenv("SEND_BURST_CHAT", 3))
+    SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))
+    BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 20))
+    BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 64))
+    BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", 1000))
+    # Morning push of the daily plan (unset: off); users idle for longer
+    # than DAILY_BROADCAST_MAX_IDLE_DAYS are skipped
+    DAILY_BROADCAST_HOUR = int(os.getenv("DAILY_BROADCAST_HOUR")) if os.getenv("DAILY_BROADCAST_HOUR") else None
+    DAILY_BROADCAST_MAX_IDLE_DAYS = int(os.getenv("DAILY_BROADCAST_MAX_IDLE_DAYS", 30))
+    
+    # Tutor answers are streamed into one message, edited at most once per
+    # STREAM_EDIT_INTERVAL seconds while the model is still writing
+    STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") == "1"
+    STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))
+    
+    # Pre-generated math problem pools
+    PROBLEM_POOL_SIZE = int(os.getenv("PROBLEM_POOL_SIZE", 200))
+    PROBLEM_POOL_LOW_WATER = int(os.getenv("PROBLEM_POOL_LOW_WATER", 50))
+    PROBLEM_POOL_WORKERS = int(os.getenv("PROBLEM_POOL_WORKERS", 1))
+    
+    # Photo processing pipeline
+    PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", 1))
+    PHOTO_MAX_QUEUE = int(os.getenv("PHOTO_MAX_QUEUE", 8))
+    PHOTO_CACHE_SIZE = int(os.getenv("PHOTO_CACHE_SIZE", 128))
+    PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", 20 * 1024 * 1024))
+
+    AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", 1))
+    AUDIO_MAX_QUEUE = int(os.getenv("AUDIO_MAX_QUEUE", 8))
+    AUDIO_CACHE_SIZE = int(os.getenv("AUDIO_CACHE_SIZE", 256))
+    AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", 20 * 1024 * 1024))
+    # Voice messages are OGG/Opus, decoded by ffmpeg (unset: PATH, then the
+    # binary bundled with imageio-ffmpeg)
+    FFMPEG_BINARY = os.getenv("FFMPEG_BINARY")
\ No newline at end of file
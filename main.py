@@ -1,41 +1,323 @@
+import asyncio
 import logging
+import multiprocessing
 import os
+import signal
+from datetime import datetime
+from typing import Dict, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.request import BaseRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes
 from src.database.models import User, UserStats, UserProgress
+from src.database.storage import create_database
+from src.gamification.leaderboard import SUBJECTS
+from src.gamification.streaks import seconds_until
 from src.gamification.xp_system import XPSystem
+from src.learning.exercises import ExerciseSessionStore, ExpectedAnswer
 from src.learning.language_mode import LanguageLearning
 from src.learning.math_mode import MathLearning
 from src.ai.coaching import AICoach
+from src.media.audio import AudioDecodeError, ffmpeg_binary
+from src.media.pipeline import MediaTooLarge, PipelineBusy
+from src.runtime.admission import AdmissionControl
+from src.runtime.metrics import REGISTRY, monitor_event_loop, timed
+from src.runtime.outbound import Broadcaster, OutboundLimiter, StreamingReply, replace_placeholder
+from src.runtime.scheduling import PRIORITY_FAST, PRIORITY_NORMAL, PRIORITY_SLOW, UserOrderedUpdateProcessor
+from src.utils.lazy import warm_up
+from config import Config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LEADERBOARD_NAMES = ("global",) + SUBJECTS
+
+# Handlers that only read local state; everything else may wait on the LLM
+FAST_COMMANDS = {"start", "profile", "stats", "leaderboard", "vocab"}
+FAST_CALLBACKS = {"profile", "vocab_review"}
+
+
+def update_priority(update: Update) -> int:
+    if update.callback_query is not None:
+        return PRIORITY_FAST if update.callback_query.data in FAST_CALLBACKS else PRIORITY_SLOW
+    message = update.message
+    if message is None:
+        return PRIORITY_NORMAL
+    if message.text:
+        if message.text.startswith("/"):
+            command = (message.text[1:].split() or [""])[0].partition("@")[0]
+            return PRIORITY_FAST if command in FAST_COMMANDS else PRIORITY_SLOW
+        return PRIORITY_SLOW
+    return PRIORITY_NORMAL
+
 class LearningBot:
-    def __init__(self, token: str):
-        self.application = Application.builder().token(token).build()
-        self.xp_system = XPSystem()
-        self.language_learning = LanguageLearning()
-        self.math_learning = MathLearning()
-        self.ai_coach = AICoach()
+    def __init__(self, token: str, request: Optional[BaseRequest] = None, shard: Optional[Tuple[int, int]] = None):
+        # Every Bot API call passes the send limits; shards split the global one
+        self.outbound = OutboundLimiter(global_rate=Config.SEND_RATE_GLOBAL / (shard[1] if shard else 1))
+        # Answers still streaming, by user; a new message stops them
+        self.streaming: Dict[int, asyncio.Task] = {}
+        builder = (
+            Application.builder()
+            .token(token)
+            .rate_limiter(self.outbound)
+            .post_init(self.post_init)
+            .post_shutdown(self.shutdown)
+            .concurrent_updates(UserOrderedUpdateProcessor(
+                Config.UPDATE_WORKERS, update_priority, max_pending=Config.UPDATE_MAX_PENDING,
+                preempt=self.stop_streaming
+            ))
+        )
+        if request is not None:
+            # Custom transport, e.g. a fake Bot API for benchmarks
+            builder = builder.request(request).get_updates_request(request)
+        self.application = builder.build()
+        self.db = create_database()
+        # (index, count) when running as one of several shard workers
+        self.shard = shard
+        if shard is not None:
+            self.db.set_shard(*shard)
+        self.xp_system = XPSystem(db=self.db, on_level_up=self.notify_level_up)
+        self.language_learning = LanguageLearning(db=self.db)
+        self.math_learning = MathLearning(db=self.db)
+        self.admission = AdmissionControl(self.db)
+        self.ai_coach = AICoach(db=self.db, admission=self.admission)
+        self.exercises = ExerciseSessionStore()
+        self.broadcaster = Broadcaster(self.application.bot, self.db)
+        self._loop_monitor: Optional[asyncio.Task] = None
+        self._streak_rollover: Optional[asyncio.Task] = None
+        self._leaderboard_merge: Optional[asyncio.Task] = None
+        self._daily_broadcast: Optional[asyncio.Task] = None
+        self._review_reminders: Optional[asyncio.Task] = None
         self.setup_handlers()
+        self.register_metrics()
     
     def setup_handlers(self):
+        # Every callback is wrapped in timed() for per-handler latency metrics
         # Command handlers
-        self.application.add_handler(CommandHandler("start", self.start))
-        self.application.add_handler(CommandHandler("profile", self.show_profile))
-        self.application.add_handler(CommandHandler("stats", self.show_stats))
-        self.application.add_handler(CommandHandler("daily", self.daily_lesson))
-        self.application.add_handler(CommandHandler("leaderboard", self.leaderboard))
+        self.application.add_handler(CommandHandler("start", timed(self.start)))
+        self.application.add_handler(CommandHandler("profile", timed(self.show_profile)))
+        self.application.add_handler(CommandHandler("stats", timed(self.show_stats)))
+        self.application.add_handler(CommandHandler("daily", timed(self.daily_lesson)))
+        self.application.add_handler(CommandHandler("leaderboard", timed(self.leaderboard)))
+        self.application.add_handler(CommandHandler("vocab", timed(self.vocabulary_review)))
         
         # Message handlers
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
-        self.application.add_handler(MessageHandler(filters.PHOTO, self.handle_photo))
-        self.application.add_handler(MessageHandler(filters.VOICE, self.handle_voice))
+        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed(self.handle_message)))
+        self.application.add_handler(MessageHandler(filters.PHOTO, timed(self.handle_photo)))
+        self.application.add_handler(MessageHandler(filters.VOICE, timed(self.handle_voice)))
         
         # Callback handlers
-        self.application.add_handler(CallbackQueryHandler(self.handle_callback))
+        self.application.add_handler(CallbackQueryHandler(timed(self.handle_callback)))
+    
+    def register_metrics(self):
+        # Gauges read live component state when /metrics is scraped
+        cache = self.ai_coach.cache
+        processor = self.application.update_processor
+        pipelines = {
+            "photo": self.math_learning.photo_pipeline,
+            "audio": self.language_learning.audio_pipeline,
+        }
+        pool = self.math_learning.problem_pool
+        
+        REGISTRY.gauge_callback(
+            "bot_update_queue_depth", "Updates received but not yet dispatched", (),
+            lambda: {(): self.application.update_queue.qsize()}
+        )
+        REGISTRY.gauge_callback(
+            "bot_updates_in_flight", "Dispatched updates by state", ("state",),
+            lambda: {(state,): processor.stats()[state] for state in ("running", "waiting")}
+        )
+        REGISTRY.gauge_callback(
+            "bot_active_users", "Users with at least one update in flight", (),
+            lambda: {(): processor.stats()["active_users"]}
+        )
+        REGISTRY.gauge_callback(
+            "bot_ai_cache_lookups_total", "AI response cache lookups by result", ("result",),
+            lambda: {(result,): cache.stats()[result] for result in ("hits", "disk_hits", "misses", "coalesced")},
+            kind="counter"
+        )
+        REGISTRY.gauge_callback(
+            "bot_ai_cache_hit_ratio", "Share of AI cache lookups served from cache", (),
+            lambda: {(): cache.stats()["hit_rate"]}
+        )
+        REGISTRY.gauge_callback(
+            "bot_media_jobs", "Media pipeline jobs by state", ("pipeline", "state"),
+            lambda: {
+                (name, state): pipeline.stats()[key]
+                for name, pipeline in pipelines.items()
+                for state, key in (("queued", "queue_depth"), ("running", "running"))
+            }
+        )
+        REGISTRY.gauge_callback(
+            "bot_media_requests_total", "Media pipeline requests by outcome", ("pipeline", "outcome"),
+            lambda: {
+                (name, outcome): pipeline.stats()[outcome]
+                for name, pipeline in pipelines.items()
+                for outcome in ("processed", "cache_hits", "rejected", "failed")
+            },
+            kind="counter"
+        )
+        REGISTRY.gauge_callback(
+            "bot_problem_pool_size", "Pre-generated problems ready to serve", (),
+            lambda: {(): pool.stats()["pooled"]}
+        )
+        REGISTRY.gauge_callback(
+            "bot_problem_pool_requests_total", "Problem pool requests by result", ("result",),
+            lambda: {("served",): pool.stats()["served"], ("empty",): pool.stats()["empty_hits"]},
+            kind="counter"
+        )
+        REGISTRY.gauge_callback(
+            "bot_db_pending_writes", "Rows waiting for the next database flush", (),
+            lambda: {(): self.db.pending_writes}
+        )
+        REGISTRY.gauge_callback(
+            "bot_active_exercises", "Exercises waiting for an answer", (),
+            lambda: {(): len(self.exercises)}
+        )
+        REGISTRY.gauge_callback(
+            "bot_xp_events_pending", "XP events waiting for the next batch", (),
+            lambda: {(): len(self.xp_system.events)}
+        )
+        REGISTRY.gauge_callback(
+            "bot_xp_events_total", "XP events by outcome", ("outcome",),
+            lambda: {(outcome,): self.xp_system.events.stats()[outcome] for outcome in ("applied", "failed")},
+            kind="counter"
+        )
+        REGISTRY.gauge_callback(
+            "bot_level_ups_total", "Global and subject level-ups", (),
+            lambda: {(): self.xp_system.level_ups},
+            kind="counter"
+        )
+        REGISTRY.gauge_callback(
+            "bot_llm_slots_waiting", "Requests queued for an LLM completion slot", (),
+            lambda: {(): self.ai_coach.client.semaphore.waiting}
+        )
+        REGISTRY.gauge_callback(
+            "bot_conversations_active", "Users with tutor conversation memory", (),
+            lambda: {(): len(self.ai_coach.memory)}
+        )
+        REGISTRY.gauge_callback(
+            "bot_profile_cache_lookups_total", "Rendered /profile and /stats lookups by result", ("result",),
+            lambda: {(result,): self.xp_system.profiles.stats()[result] for result in ("hits", "misses", "stale")},
+            kind="counter"
+        )
+        REGISTRY.gauge_callback(
+            "bot_rate_limited_users", "Users holding a token bucket", (),
+            lambda: {(): len(self.admission.limiter)}
+        )
+        REGISTRY.gauge_callback(
+            "bot_outbound_waiting", "Bot API calls waiting for the send rate limits", (),
+            lambda: {(): self.outbound.waiting}
+        )
+        REGISTRY.gauge_callback(
+            "bot_users_loaded", "Users held in memory", (),
+            lambda: {(): len(self.db.users)}
+        )
+        REGISTRY.gauge_callback(
+            "bot_srs_decks_loaded", "Vocabulary decks held in memory", (),
+            lambda: {(): len(self.language_learning.srs)}
+        )
+    
+    async def post_init(self, application: Application):
+        await self.db.start()
+        await self.xp_system.load_leaderboards()
+        await self.xp_system.start()
+        self.language_learning.srs.start()
+        await self.math_learning.problem_pool.start()
+        if ffmpeg_binary() is None:
+            logger.warning("ffmpeg not found: voice messages cannot be analysed (install imageio-ffmpeg or set FFMPEG_BINARY)")
+        if Config.WARM_UP_IMPORTS:
+            # Runs once the webhook/polling loop is up, one module at a time
+            application.create_task(self.warm_up())
+        # Not application.create_task: Application.stop() waits for those
+        self._loop_monitor = asyncio.create_task(monitor_event_loop(Config.LOOP_LAG_INTERVAL))
+        self._streak_rollover = asyncio.create_task(self.xp_system.run_nightly_rollover())
+        if self.shard is not None:
+            self._leaderboard_merge = asyncio.create_task(self.xp_system.run_leaderboard_merge(self.shard[0]))
+        if Config.DAILY_BROADCAST_HOUR is not None:
+            self._daily_broadcast = asyncio.create_task(self.run_daily_broadcast())
+        if Config.SRS_REMINDER_INTERVAL:
+            self._review_reminders = asyncio.create_task(self.run_review_reminders())
+    
+    async def warm_up(self):
+        await asyncio.sleep(Config.WARM_UP_DELAY)
+        await warm_up()
+    
+    async def shutdown(self, application: Application):
+        for task in (self._loop_monitor, self._streak_rollover, self._leaderboard_merge, self._daily_broadcast,
+                     self._review_reminders):
+            if task is not None:
+                task.cancel()
+        self._loop_monitor = self._streak_rollover = self._leaderboard_merge = self._daily_broadcast = None
+        self._review_reminders = None
+        # Release the pooled OpenAI connections and the cache file
+        await self.ai_coach.client.close()
+        self.ai_coach.cache.close()
+        await self.math_learning.problem_pool.close()
+        await self.math_learning.photo_pipeline.close()
+        await self.math_learning.answer_checker.close()
+        await self.language_learning.audio_pipeline.close()
+        self.language_learning.catalog.close()
+        # Apply queued XP and changed decks, then flush pending writes before
+        # the process exits
+        await self.language_learning.srs.close()
+        await self.xp_system.close()
+        await self.db.close()
+    
+    def render_daily_reminder(self, stats: UserStats, progress: UserProgress) -> Optional[Dict]:
+        # Morning push: a short nudge with a button, not the plan itself, so
+        # a broadcast costs no LLM calls; the plan is built when tapped
+        idle_days = (datetime.now() - stats.last_active).days
+        if idle_days > Config.DAILY_BROADCAST_MAX_IDLE_DAYS:
+            return None
+        streak = stats.current_streak
+        text = (
+            f"🌅 Good morning! Keep your {streak}-day streak going 🔥" if streak
+            else "🌅 Good morning! A few minutes of practice today?"
+        )
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("🎯 Today's Plan", callback_data="daily_plan")]])
+        return {"text": text, "reply_markup": keyboard}
+    
+    async def run_daily_broadcast(self):
+        # Background task: push the reminder to every user (of this shard)
+        # each day at DAILY_BROADCAST_HOUR:00 local time
+        while True:
+            await asyncio.sleep(seconds_until(Config.DAILY_BROADCAST_HOUR) + 1)
+            try:
+                report = await self.broadcaster.broadcast(self.render_daily_reminder)
+            except Exception:
+                logger.exception("Daily broadcast failed")
+                continue
+            logger.info("Daily broadcast done: %s", report.to_dict())
+    
+    async def run_review_reminders(self):
+        # Background task: every SRS_REMINDER_INTERVAL seconds, nudge the
+        # users (of this shard) whose vocabulary reviews have come due. Each
+        # claimed user is re-armed for a day later, so reminders do not repeat.
+        message = {
+            "text": "📝 You have words due for review - it only takes a minute!",
+            "reply_markup": InlineKeyboardMarkup([[InlineKeyboardButton("📝 Review now", callback_data="vocab_review")]]),
+        }
+        srs = self.language_learning.srs
+        while True:
+            await asyncio.sleep(Config.SRS_REMINDER_INTERVAL)
+            try:
+                while True:
+                    user_ids = await srs.sweep_due_users(limit=Config.SRS_REMINDER_BATCH)
+                    if not user_ids:
+                        break
+                    report = await self.broadcaster.send_to(user_ids, message)
+                    logger.info("Review reminders sent: %s", report.to_dict())
+            except Exception:
+                logger.exception("Review reminders failed")
+    
+    async def notify_level_up(self, user_id: int, level_up: Dict):
+        # Sent from the XP batch, after the reply that earned the XP
+        area = level_up["subject"].capitalize() if level_up["subject"] else "Global"
+        await self.application.bot.send_message(
+            chat_id=user_id,
+            text=f"🎉 Level up! {area} level {level_up['old_level']} → {level_up['new_level']}"
+        )
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
@@ -58,6 +340,7 @@ I'm your personal tutor that will help you master:
 /stats - Detailed statistics
 /daily - Get today's lessons
 /leaderboard - See rankings
+/vocab - Review vocabulary
 /math - Math exercises
 /english - Language practice
 /code - Programming challenges
@@ -77,8 +360,23 @@ Let's start your learning journey! 🚀
         await update.message.reply_text(welcome_text, reply_markup=reply_markup)
     
     async def show_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id
+        profile_text = await self.profile_text(update.effective_user.id)
+        if profile_text is None:
+            await update.effective_message.reply_text("No profile yet - send /start to begin!")
+            return
+        await update.effective_message.reply_text(profile_text)
+    
+    async def profile_text(self, user_id: int) -> Optional[str]:
+        # A repeat view is one cache lookup; XP and progress writes
+        # invalidate the text (see ProfileCache)
+        profiles = self.xp_system.profiles
+        profile_text = profiles.get(user_id, "profile")
+        if profile_text is not None:
+            return profile_text
+        version = profiles.version(user_id)
         profile_data = await self.xp_system.get_user_profile(user_id)
+        if profile_data is None:
+            return None
         
         profile_text = f"""
 👤 {profile_data['username']}'s Profile
@@ -100,12 +398,44 @@ Let's start your learning journey! 🚀
 • Mastery: {profile_data['mastery_percentage']}%
 • Completed Units: {profile_data['completed_units']}
         """
+        profiles.store(user_id, version, "profile", profile_text)
+        return profile_text
+    
+    async def show_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        stats_text = await self.stats_text(update.effective_user.id)
+        if stats_text is None:
+            await update.message.reply_text("No stats yet - send /start to begin!")
+            return
+        await update.message.reply_text(stats_text)
+    
+    async def stats_text(self, user_id: int) -> Optional[str]:
+        profiles = self.xp_system.profiles
+        stats_text = profiles.get(user_id, "stats")
+        if stats_text is not None:
+            return stats_text
+        version = profiles.version(user_id)
+        stats = await self.xp_system.get_user_stats(user_id)
+        if stats is None:
+            return None
         
-        await update.message.reply_text(profile_text)
+        stats_text = f"""
+📈 Detailed Statistics
+
+• Total XP: {stats.total_xp:,}
+• Global Level: {stats.global_level}
+• Current Streak: {stats.current_streak} days 🔥
+• Longest Streak: {stats.longest_streak} days
+• Streak Freezes: {stats.streak_freeze}
+• Learning Time: {stats.total_learning_time} mins
+        """
+        profiles.store(user_id, version, "stats", stats_text)
+        return stats_text
     
     async def daily_lesson(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         daily_plan = await self.ai_coach.generate_daily_plan(user_id)
+        # The coach's advice, when the LLM call went through
+        advice = f"\n💡 Coach's Tip:\n{daily_plan['advice']}\n" if daily_plan.get('advice') else ""
         
         plan_text = f"""
 📅 Your Daily Learning Plan
@@ -117,7 +447,7 @@ Let's start your learning journey! 🚀
 {daily_plan['subjects']}
 
 ⏰ Estimated Time: {daily_plan['estimated_time']} minutes
-
+{advice}
 💪 Let's get started! Complete tasks to earn XP and maintain your streak!
         """
         
@@ -128,7 +458,73 @@ Let's start your learning journey! 🚀
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.message.reply_text(plan_text, reply_markup=reply_markup)
+        await update.effective_message.reply_text(plan_text, reply_markup=reply_markup)
+    
+    async def vocabulary_review(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # One due word at a time; the rating buttons record the review and
+        # bring up the next word
+        user_id = update.effective_user.id
+        words = await self.language_learning.generate_vocabulary_review(user_id, count=1)
+        if not words:
+            await update.effective_message.reply_text("✅ All caught up - no words to review right now!")
+            return
+        word = words[0]
+        card_id = self.language_learning.word_ids[word]
+        keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton("😕 Forgot", callback_data=f"vocab:{card_id}:1"),
+            InlineKeyboardButton("🤔 Hard", callback_data=f"vocab:{card_id}:3"),
+            InlineKeyboardButton("😎 Easy", callback_data=f"vocab:{card_id}:5"),
+        ]])
+        await update.effective_message.reply_text(
+            f"📝 Do you remember this word?\n\n**{word}**", reply_markup=keyboard
+        )
+    
+    async def rate_vocabulary(self, update: Update, context: ContextTypes.DEFAULT_TYPE, card_id: int, quality: int):
+        user_id = update.effective_user.id
+        if 0 <= card_id < len(self.language_learning.vocabulary):
+            await self.language_learning.record_vocabulary_review(
+                user_id, self.language_learning.vocabulary[card_id], quality
+            )
+        await self.vocabulary_review(update, context)
+    
+    async def leaderboard(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+        
+        # /leaderboard [global|english|math|programming] [week]
+        args = [arg.lower() for arg in (context.args or [])]
+        weekly = "week" in args or "weekly" in args
+        board_name = next((arg for arg in args if arg in LEADERBOARD_NAMES), "global")
+        # With several workers this merges the other shards' snapshots
+        board = self.xp_system.leaderboards.view(board_name, weekly=weekly)
+        
+        rows = board.top(10)
+        my_rank = board.rank(user_id)
+        if my_rank is not None and my_rank > 10:
+            rows += [None] + board.around(user_id, radius=1)
+        
+        lines = []
+        for row in rows:
+            if row is None:
+                lines.append("...")
+                continue
+            rank, ranked_user_id, score = row
+            name = board.names.get(ranked_user_id)
+            if name is None:
+                user = await self.db.get_user(ranked_user_id)
+                name = (user.username or user.first_name) if user else str(ranked_user_id)
+            marker = " ⬅️" if ranked_user_id == user_id else ""
+            lines.append(f"{rank}. {name} - {score:,} XP{marker}")
+        
+        title = board_name.capitalize() + (" (this week)" if weekly else "")
+        leaderboard_text = f"""
+🏆 Leaderboard - {title}
+
+{chr(10).join(lines) if lines else "No scores yet. Be the first!"}
+
+📍 Your Rank: {f"#{my_rank:,} of {len(board):,}" if my_rank else "unranked"}
+        """
+        
+        await update.message.reply_text(leaderboard_text)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
@@ -139,17 +535,59 @@ Let's start your learning journey! 🚀
             await self.check_exercise_answer(user_id, message_text, update)
         else:
             # General AI tutor response
-            response = await self.ai_coach.answer_question(user_id, message_text)
-            await update.message.reply_text(response)
+            if Config.STREAM_REPLIES:
+                await self.stream_reply(update, self.ai_coach.stream_answer(user_id, message_text))
+            else:
+                response = await self.ai_coach.answer_question(user_id, message_text)
+                await update.message.reply_text(response)
+    
+    async def stream_reply(self, update: Update, deltas):
+        # The stream runs in its own task so stop_streaming() can cancel it
+        # without cancelling this handler, which then marks the message
+        user_id = update.effective_user.id
+        reply = StreamingReply(update.message)
+        task = asyncio.create_task(reply.run(deltas))
+        self.streaming[user_id] = task
+        try:
+            await asyncio.wait({task})
+        finally:
+            if self.streaming.get(user_id) is task:
+                del self.streaming[user_id]
+            task.cancel()
+        if task.cancelled():
+            await reply.stop()
+        else:
+            task.result()
+    
+    def stop_streaming(self, update: Update):
+        # Called by the update processor as soon as an update arrives
+        if update.message is None or update.effective_user is None:
+            return
+        task = self.streaming.get(update.effective_user.id)
+        if task is not None:
+            task.cancel()
     
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         photo = update.message.photo[-1]
         
-        await update.message.reply_text("📸 Analyzing your problem...")
+        # The placeholder is edited into the answer instead of a second message
+        placeholder = await update.message.reply_text("📸 Analyzing your problem...")
         
         # This would integrate with OCR and AI solving
-        solution = await self.math_learning.solve_photo_problem(photo)
+        try:
+            solution = await self.math_learning.solve_photo_problem(photo)
+        except PipelineBusy:
+            await replace_placeholder(placeholder, "⏳ I'm busy with other photos right now. Please try again in a minute!")
+            return
+        except MediaTooLarge:
+            await replace_placeholder(placeholder, "📏 That photo is too large - please send a smaller one.")
+            return
+        except Exception:
+            # Unreadable images (PIL errors), failed downloads, dead workers
+            logger.exception("Photo processing failed for user %s", user_id)
+            await replace_placeholder(placeholder, "😕 I couldn't read that photo. Please try another one, or type the problem.")
+            return
         
         response_text = f"""
 ✅ Problem Solved!
@@ -164,16 +602,31 @@ Let's start your learning journey! 🚀
         # Award XP for photo solving
         await self.xp_system.add_xp(user_id, 25, "photo_solve")
         
-        await update.message.reply_text(response_text)
+        await replace_placeholder(placeholder, response_text)
     
     async def handle_voice(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         voice = update.message.voice
         
-        await update.message.reply_text("🎤 Analyzing your pronunciation...")
+        placeholder = await update.message.reply_text("🎤 Analyzing your pronunciation...")
         
         # This would integrate with speech-to-text and pronunciation analysis
-        pronunciation_feedback = await self.language_learning.analyze_pronunciation(voice)
+        try:
+            pronunciation_feedback = await self.language_learning.analyze_pronunciation(voice)
+        except PipelineBusy:
+            await replace_placeholder(placeholder, "⏳ I'm busy with other recordings right now. Please try again in a minute!")
+            return
+        except MediaTooLarge:
+            await replace_placeholder(placeholder, "📏 That recording is too long - please keep it under a minute or two.")
+            return
+        except AudioDecodeError as e:
+            logger.warning("Could not decode voice message from user %s: %s", user_id, e)
+            await replace_placeholder(placeholder, "😕 I couldn't play that recording. Please try sending it again.")
+            return
+        except Exception:
+            logger.exception("Voice processing failed for user %s", user_id)
+            await replace_placeholder(placeholder, "😕 Something went wrong analysing that recording. Please try again later.")
+            return
         
         feedback_text = f"""
 🎯 Pronunciation Analysis:
@@ -185,7 +638,7 @@ Let's start your learning journey! 🚀
 💡 Tip: {pronunciation_feedback['tip']}
         """
         
-        await update.message.reply_text(feedback_text)
+        await replace_placeholder(placeholder, feedback_text)
         await self.xp_system.add_xp(user_id, 15, "speaking_practice")
 
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -202,10 +655,37 @@ Let's start your learning journey! 🚀
             await self.start_english_lesson(update, context)
         elif callback_data == "start_math":
             await self.start_math_exercise(update, context)
+        elif callback_data == "vocab_review":
+            await self.vocabulary_review(update, context)
+        elif callback_data.startswith("vocab:"):
+            _, card_id, quality = callback_data.split(":")
+            await self.rate_vocabulary(update, context, int(card_id), int(quality))
+    
+    async def lesson_allowed(self, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        allowed, _ = await self.admission.take_lesson(user_id)
+        if not allowed:
+            policy = await self.admission.policy(user_id)
+            await context.bot.send_message(
+                chat_id=user_id,
+                text=f"🌙 You've finished all {policy.lesson_limit} lessons for today - great work! "
+                     "Come back tomorrow to keep your streak going."
+            )
+        return allowed
     
     async def start_english_lesson(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
-        lesson = await self.language_learning.generate_lesson(user_id)
+        if not await self.lesson_allowed(user_id, context):
+            return
+        try:
+            lesson = await self.language_learning.generate_lesson(user_id)
+        except Exception:
+            await self.admission.refund_lesson(user_id)
+            raise
+        if lesson is None:
+            # Nothing was served, so it does not count against the quota
+            await self.admission.refund_lesson(user_id)
+            await context.bot.send_message(chat_id=user_id, text="📚 No English lessons are available right now.")
+            return
         
         lesson_text = f"""
 📚 English Lesson: {lesson['title']}
@@ -217,13 +697,27 @@ Let's start your learning journey! 🚀
 
 Options:
 {chr(10).join([f"{chr(65+i)}. {option}" for i, option in enumerate(lesson['exercise']['options'])])}
+
+Reply with the letter of your answer.
         """
         
+        exercise = lesson['exercise']
+        self.exercises.issue(
+            user_id, "english", lesson['title'],
+            ExpectedAnswer.choice(exercise['options'], exercise['answer']),
+            self.xp_system.exercise_xp["perfect_lesson"], lesson.get('id')
+        )
         await context.bot.send_message(chat_id=user_id, text=lesson_text)
     
     async def start_math_exercise(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
-        exercise = await self.math_learning.generate_exercise(user_id)
+        if not await self.lesson_allowed(user_id, context):
+            return
+        try:
+            exercise = await self.math_learning.generate_exercise(user_id)
+        except Exception:
+            await self.admission.refund_lesson(user_id)
+            raise
         
         exercise_text = f"""
 🔢 Math Challenge - {exercise['topic']}
@@ -233,41 +727,131 @@ Options:
 
 Difficulty: {exercise['difficulty']} ⭐
 XP Reward: {exercise['xp_reward']}
+
+Reply with your answer.
         """
         
+        self.exercises.issue(
+            user_id, "math", exercise['topic'],
+            ExpectedAnswer.from_problem(exercise['answer_kind'], exercise['solution'], exercise['canonical']),
+            exercise['xp_reward'], exercise['id']
+        )
         await context.bot.send_message(chat_id=user_id, text=exercise_text)
     
     async def initialize_user(self, user_id: int, first_name: str, username: str):
         # Initialize user in database
-        pass
+        if await self.db.get_user(user_id) is None:
+            await self.db.create_user(user_id, username, first_name)
     
     async def is_exercise_response(self, user_id: int, message: str) -> bool:
-        # Check if user is responding to an exercise
-        pass
+        # Runs on every text message: one dict probe. Questions go to the
+        # tutor even while an exercise is open.
+        return self.exercises.get(user_id) is not None and not message.rstrip().endswith("?")
     
     async def check_exercise_answer(self, user_id: int, answer: str, update: Update):
-        # Check exercise answer and provide feedback
-        pass
+        session = self.exercises.get(user_id)
+        if session is None:
+            return
+        
+        if session.subject == "math":
+            verdict = await self.math_learning.check_answer(session.expected, answer)
+            if verdict.correct is None:
+                await update.message.reply_text("🤔 I couldn't verify that form in time - try writing it more simply.")
+                return
+            correct = verdict.correct
+        else:
+            correct = session.expected.matches(answer)
+        
+        if correct:
+            self.exercises.pop(user_id)
+            activity = "math_exercise" if session.subject == "math" else "perfect_lesson"
+            gained = await self.xp_system.add_xp(user_id, session.xp_reward, activity)
+            # Full marks on the first try, less for each retry
+            await self.xp_system.record_exercise(user_id, session.subject, 100 / (session.attempts + 1), session.item_id)
+            await update.message.reply_text(f"✅ Correct! +{gained} XP")
+            return
+        
+        session.attempts += 1
+        if session.attempts >= Config.EXERCISE_MAX_ATTEMPTS:
+            self.exercises.pop(user_id)
+            await self.xp_system.record_exercise(user_id, session.subject, 0)
+            await update.message.reply_text(
+                f"❌ Not quite. The answer was: {session.expected.display}\n"
+                "Keep practicing - you'll get the next one!"
+            )
+        else:
+            left = Config.EXERCISE_MAX_ATTEMPTS - session.attempts
+            await update.message.reply_text(f"❌ Not quite - try again! ({left} {'tries' if left > 1 else 'try'} left)")
+
+def run_shard(token: str, index: int, count: int, path: str):
+    # Entry point of a spawned shard worker process. Its own process group,
+    # so the front decides when it stops and a kill also reaches the
+    # worker's pool processes.
+    from src.runtime.sharding import serve_shard
+    os.setpgrp()
+    bot = LearningBot(token, shard=(index, count))
+    asyncio.run(serve_shard(bot.application, path))
+
+
+def serve_sharded(token: str, workers: int, port: int, webhook_url: Optional[str]):
+    # One front process receives updates and routes them by user_id to
+    # `workers` bot processes that share DATABASE_URL
+    from src.runtime.sharding import ShardRouter, serve_front, shard_socket_path
+    if Config.DATABASE_URL == "memory://":
+        logger.warning("WORKERS=%d with in-memory storage: shards share no state", workers)
+    paths = [shard_socket_path(Config.SHARD_SOCKET_DIR, index) for index in range(workers)]
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_shard, args=(token, index, workers, path), name=f"shard-{index}")
+        for index, path in enumerate(paths)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        asyncio.run(serve_front(
+            token, ShardRouter(paths),
+            webhook_url=f"{webhook_url}/{token}" if webhook_url else None,
+            port=port,
+            url_path=token,
+            secret_token=Config.WEBHOOK_SECRET
+        ))
+    finally:
+        # SIGTERM lets each worker flush its writes before exiting; one
+        # stuck on a pool process past the grace period is killed
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=Config.WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning("Shard worker %s did not stop, killing it", process.name)
+                os.killpg(process.pid, signal.SIGKILL)
 
 def main():
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not token:
         raise ValueError("TELEGRAM_BOT_TOKEN environment variable is required")
     
-    bot = LearningBot(token)
-    
     # Start the bot
     port = int(os.environ.get('PORT', 8443))
     webhook_url = os.getenv("WEBHOOK_URL")
     
+    if Config.WORKERS > 1:
+        serve_sharded(token, Config.WORKERS, port, webhook_url)
+        return
+    
+    bot = LearningBot(token)
+    
     if webhook_url:
-        # Production with webhook
-        bot.application.run_webhook(
+        # Production with webhook; the same aiohttp server serves /metrics
+        from src.runtime.webserver import serve_webhook
+        asyncio.run(serve_webhook(
+            bot.application,
             listen="0.0.0.0",
             port=port,
             url_path=token,
-            webhook_url=f"{webhook_url}/{token}"
-        )
+            webhook_url=f"{webhook_url}/{token}",
+            secret_token=Config.WEBHOOK_SECRET
+        ))
     else:
         # Development with polling
         bot.application.run_polling()
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    # "What is a Derivative?" and "what is a derivative" share one entry
+    text = _PUNCTUATION.sub(" ", text.casefold())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class _LeaderGone(Exception):
+    # Set on an in-flight entry whose computing caller went away
+    pass
+
+
+class DiskCache:
+    # Optional second tier in a small SQLite file, survives restarts
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[1], json.loads(row[0])
+
+    def set(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = DiskCache(disk_path) if disk_path else None
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(kind: str, text: str, levels: Tuple = ()) -> str:
+        raw = f"{kind}|{','.join(map(str, levels))}|{normalize_prompt(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            # Kept until LRU eviction or a refresh: still good as a fallback
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        # Served when admission control refuses a fresh computation
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None):
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: str, factory: Callable[[], Awaitable[Any]],
+                             personal: Tuple[Type[BaseException], ...] = ()) -> Any:
+        # `personal` errors concern only the caller that raised them (e.g.
+        # its own rate limit): like the leader being cancelled, they are not
+        # passed on to coalesced waiters, one of which computes instead
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            # Identical request already on its way: wait for that one instead
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except _LeaderGone:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load_from_disk(key)
+            if value is None:
+                self.misses += 1
+                value = await factory()
+                await self.store(key, value)
+            future.set_result(value)
+            return value
+        except (asyncio.CancelledError, *personal):
+            future.set_exception(_LeaderGone())
+            future.exception()
+            raise
+        except Exception as e:
+            # Failures are never cached; waiters see the same error
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody is waiting
+            raise
+        finally:
+            # Before any waiter resumes, so a retrying one can take over
+            del self._inflight[key]
+
+    async def _load_from_disk(self, key: str) -> Optional[Any]:
+        if self.disk is None:
+            return None
+        row = await asyncio.to_thread(self.disk.get, key)
+        if row is None or row[0] < time.time():
+            return None
+        self.disk_hits += 1
+        self.set(key, row[1], expires_at=row[0])
+        return row[1]
+
+    async def lookup(self, key: str) -> Optional[Any]:
+        # Memory, then disk, without computing anything: for callers that
+        # produce the value themselves and store() it, e.g. streamed answers
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        value = await self._load_from_disk(key)
+        if value is None:
+            self.misses += 1
+        return value
+
+    async def store(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl
+        self.set(key, value, expires_at=expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, expires_at)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
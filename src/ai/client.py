@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from config import Config
+from src.runtime.admission import Overloaded, TierPolicy
+from src.runtime.metrics import ADMISSION, LLM_FIRST_TOKEN, LLM_LATENCY, LLM_REQUESTS, LLM_TOKENS
+from src.runtime.scheduling import PrioritySemaphore
+from src.utils.lazy import lazy_import
+
+# openai pulls in pydantic and its type tree; load it on the first request
+openai = lazy_import("openai")
+
+logger = logging.getLogger(__name__)
+
+
+def retryable_errors() -> tuple:
+    # Errors worth another attempt: network trouble, timeouts, throttling and 5xx
+    return (
+        asyncio.TimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+async def stream_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    # Content deltas of a streamed chat completion, read straight from the
+    # server-sent events: the SDK's per-chunk models cost about 1 ms of CPU
+    # per token, which caps a process at roughly a thousand tokens a second
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        chunk = json.loads(data)
+        if chunk.get("error"):
+            raise openai.APIError("An error occurred during streaming", response.request, body=chunk["error"])
+        choices = chunk.get("choices")
+        content = choices and (choices[0].get("delta") or {}).get("content")
+        if content:
+            yield content
+
+
+class AIClient:
+    # Shared async OpenAI client: one keep-alive connection pool for the
+    # whole process, a cap on in-flight completions and retry with backoff.
+    # Completion slots are handed out by tier priority (see TierPolicy); a
+    # request that cannot get one in time raises Overloaded.
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ):
+        self.api_key = api_key or Config.OPENAI_API_KEY
+        self.base_url = base_url or Config.OPENAI_BASE_URL
+        self.model = model or Config.OPENAI_MODEL
+        self.max_concurrency = max_concurrency or Config.OPENAI_MAX_CONCURRENCY
+        self.max_connections = max_connections or Config.OPENAI_MAX_CONNECTIONS
+        self.timeout = timeout or Config.OPENAI_TIMEOUT
+        self.max_retries = Config.OPENAI_MAX_RETRIES if max_retries is None else max_retries
+        self._client = None
+        self._semaphore = None
+
+    @property
+    def client(self) -> "openai.AsyncOpenAI":
+        # Created lazily so the pool binds to the running event loop
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+            )
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,  # retries are handled here, with jitter
+                http_client=http_client,
+            )
+        return self._client
+
+    @property
+    def semaphore(self) -> PrioritySemaphore:
+        if self._semaphore is None:
+            self._semaphore = PrioritySemaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def acquire(self, policy: Optional[TierPolicy]):
+        if policy is None:
+            await self.semaphore.acquire(time.monotonic())
+            return
+        if policy.max_waiting and self.semaphore.waiting >= policy.max_waiting:
+            ADMISSION.inc(tier=policy.name, outcome="busy")
+            raise Overloaded("busy")
+        try:
+            await self.semaphore.acquire(time.monotonic() + policy.aging, timeout=policy.max_wait)
+        except asyncio.TimeoutError:
+            ADMISSION.inc(tier=policy.name, outcome="busy")
+            raise Overloaded("busy") from None
+
+    def backoff_delay(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        ceiling = min(Config.OPENAI_BACKOFF_MAX, Config.OPENAI_BACKOFF_BASE * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    async def chat(self, messages: List[Dict], policy: Optional[TierPolicy] = None, **kwargs) -> str:
+        model = kwargs.pop("model", self.model)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(policy)
+            started = time.perf_counter()
+            try:
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            **kwargs
+                        ),
+                        timeout=self.timeout,
+                    )
+                finally:
+                    # Released before any backoff sleep
+                    self.semaphore.release()
+                self.record(started, "ok", response.usage)
+                return response.choices[0].message.content
+            except retryable_errors() as e:
+                last_error = e
+                if attempt == self.max_retries:
+                    self.record(started, "error")
+                    break
+                self.record(started, "retry")
+                delay = self.backoff_delay(attempt)
+                logger.warning("AI request failed (%s), retry %d in %.2fs", e, attempt + 1, delay)
+                await asyncio.sleep(delay)
+            except Exception:
+                self.record(started, "error")
+                raise
+        raise last_error
+
+    async def stream_chat(self, messages: List[Dict], policy: Optional[TierPolicy] = None,
+                          **kwargs) -> AsyncIterator[str]:
+        # Streaming variant of chat(): yields content deltas as they arrive.
+        # The completion slot is held until the stream ends. Attempts are
+        # retried only before the first delta, so text is never repeated;
+        # OPENAI_TIMEOUT bounds the wait for each chunk rather than the whole
+        # answer. Closing the generator (aclose, or cancelling the consumer
+        # inside contextlib.aclosing) closes the HTTP response, which cancels
+        # the completion upstream.
+        model = kwargs.pop("model", self.model)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(policy)
+            started = time.perf_counter()
+            stream = None
+            streamed = False
+            try:
+                try:
+                    stream = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            stream=True,
+                            **kwargs
+                        ),
+                        timeout=self.timeout,
+                    )
+                    deltas = stream_deltas(stream.response)
+                    while True:
+                        try:
+                            delta = await asyncio.wait_for(deltas.__anext__(), timeout=self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        if not streamed:
+                            LLM_FIRST_TOKEN.observe(time.perf_counter() - started)
+                            streamed = True
+                        yield delta
+                finally:
+                    try:
+                        if stream is not None:
+                            await stream.response.aclose()
+                    finally:
+                        self.semaphore.release()
+                self.record(started, "ok")
+                return
+            except retryable_errors() as e:
+                if streamed or attempt == self.max_retries:
+                    self.record(started, "error")
+                    raise
+                self.record(started, "retry")
+                delay = self.backoff_delay(attempt)
+                logger.warning("AI stream failed (%s), retry %d in %.2fs", e, attempt + 1, delay)
+                await asyncio.sleep(delay)
+            except (asyncio.CancelledError, GeneratorExit):
+                self.record(started, "cancelled")
+                raise
+            except Exception:
+                self.record(started, "error")
+                raise
+
+    @staticmethod
+    def record(started: float, outcome: str, usage=None):
+        # Per-attempt metrics; latency excludes waiting for the semaphore
+        LLM_REQUESTS.inc(outcome=outcome)
+        LLM_LATENCY.observe(time.perf_counter() - started, outcome=outcome)
+        if usage is not None:
+            LLM_TOKENS.inc(usage.prompt_tokens, kind="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens, kind="completion")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
@@ -1,52 +1,186 @@
-from typing import Dict
-import openai
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
 import os
+from config import Config
+from src.ai.cache import ResponseCache
+from src.ai.client import AIClient
+from src.ai.memory import Conversation, ConversationStore
+from src.ai.prompts import PromptBuilder, progress_summary
+from src.database.models import Database, UserProgress
+from src.runtime.admission import AdmissionControl, Overloaded
+from src.runtime.outbound import StreamInterrupted
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_REPLY = "I'm here to help you learn! Let me think about that..."
+
+# Served when admission control turns an LLM call away and nothing is cached
+OFFLINE_REPLIES = {
+    "rate": "⏳ You've asked a lot of questions in a short time. Take a moment to practice "
+            "with /daily, and ask me again in a few minutes!",
+    "busy": "⏳ I'm helping a lot of students right now and couldn't get to your question. "
+            "Please ask again in a minute - meanwhile /daily has practice ready for you!",
+}
+
+DEFAULT_PLAN = {
+    "goals": "• Review 10 vocabulary words\n• Complete 5 math problems\n• Practice pronunciation",
+    "subjects": "• English (15 mins)\n• Math (10 mins)\n• Programming (5 mins)",
+    "estimated_time": 30
+}
 
 class AICoach:
-    def __init__(self):
+    # Answers carry the user's recent conversation (ConversationStore) in a
+    # prompt packed to PROMPT_TOKEN_BUDGET (PromptBuilder). Only questions
+    # without conversation context use the response cache: a follow-up's
+    # answer depends on what came before.
+    def __init__(self, db: Optional[Database] = None, client: Optional[AIClient] = None,
+                 cache: Optional[ResponseCache] = None, admission: Optional[AdmissionControl] = None,
+                 memory: Optional[ConversationStore] = None, prompts: Optional[PromptBuilder] = None):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        openai.api_key = self.openai_api_key
+        self.db = db or Database()
+        self.admission = admission or AdmissionControl(self.db)
+        self.client = client or AIClient(api_key=self.openai_api_key)
+        self.cache = cache or ResponseCache(
+            max_entries=Config.RESPONSE_CACHE_SIZE,
+            ttl=Config.RESPONSE_CACHE_TTL,
+            disk_path=Config.RESPONSE_CACHE_PATH
+        )
+        self.memory = memory or ConversationStore()
+        self.prompts = prompts or PromptBuilder()
+        self._condensing: Set[asyncio.Task] = set()
+    
+    async def get_user_progress(self, user_id: int) -> Optional[UserProgress]:
+        return await self.db.get_user_progress(user_id)
+    
+    def level_tuple(self, user_progress: Optional[UserProgress]) -> Tuple:
+        # Answers are tailored to level, so levels are part of the cache key
+        if user_progress is None:
+            return ()
+        return tuple(subject["level"] for subject in user_progress.subjects.values())
     
     async def generate_daily_plan(self, user_id: int) -> Dict:
         user_progress = await self.get_user_progress(user_id)
+        key = self.cache.make_key("daily_plan", progress_summary(user_progress), self.level_tuple(user_progress))
         
-        prompt = f"""
-        Create a daily learning plan for a student with:
-        - English level: {user_progress.subjects['english']['level']}
-        - Math level: {user_progress.subjects['math']['level']}
-        - Programming level: {user_progress.subjects['programming']['level']}
-        - Weak topics: {user_progress.weak_topics}
-        
-        Generate a balanced 30-minute study plan.
-        """
+        async def build_plan() -> Dict:
+            policy = await self.admission.admit_ai(user_id)
+            response = await self.client.chat(self.prompts.plan_messages(user_progress), policy=policy)
+            return dict(DEFAULT_PLAN, advice=response)
         
-        # This would call OpenAI API
-        response = await self.call_ai(prompt)
-        
-        return {
-            "goals": "• Review 10 vocabulary words\n• Complete 5 math problems\n• Practice pronunciation",
-            "subjects": "• English (15 mins)\n• Math (10 mins)\n• Programming (5 mins)",
-            "estimated_time": 30
-        }
+        try:
+            return await self.cache.get_or_compute(key, build_plan, personal=(Overloaded,))
+        except Overloaded:
+            # An expired plan beats the generic one
+            return self.cache.get_stale(key) or dict(DEFAULT_PLAN)
+        except Exception as e:
+            logger.warning("Daily plan generation failed: %s", e)
+            return dict(DEFAULT_PLAN)
+    
+    async def answer_context(self, user_id: int, question: str) -> Tuple[Optional[str], List[Dict]]:
+        # (cache key or None, prompt messages) for a question
+        user_progress = await self.get_user_progress(user_id)
+        conversation = self.memory.get(user_id)
+        messages = self.prompts.answer_messages(question, user_progress, conversation)
+        if conversation is not None and not conversation.empty:
+            return None, messages
+        return self.cache.make_key("answer", question, self.level_tuple(user_progress)), messages
+    
+    def remember(self, user_id: int, question: str, answer: str):
+        conversation = self.memory.record(user_id, question, answer)
+        limit = Config.CONVERSATION_SUMMARY_TOKENS
+        if conversation.needs_condensing(limit) and not conversation.condensing:
+            if Config.CONVERSATION_CONDENSE:
+                task = asyncio.create_task(self.condense(conversation, limit))
+                self._condensing.add(task)
+                task.add_done_callback(self._condensing.discard)
+            else:
+                conversation.trim_summary(limit)
+    
+    async def condense(self, conversation: Conversation, limit: int):
+        # Rolling summary: the model rewrites the notes on older turns into
+        # a shorter summary, off the reply path. Notes added meanwhile are
+        # kept; on failure the oldest notes are dropped instead.
+        conversation.condensing = True
+        notes = conversation.summary
+        try:
+            summary = await self.client.chat(self.prompts.summary_messages(notes, limit), max_tokens=limit)
+            newer = conversation.summary[len(notes):] if conversation.summary.startswith(notes) else ""
+            conversation.set_summary(summary + newer)
+        except Exception as e:
+            logger.debug("Condensing conversation failed: %s", e)
+        finally:
+            conversation.condensing = False
+        if conversation.needs_condensing(limit):
+            conversation.trim_summary(limit)
     
     async def answer_question(self, user_id: int, question: str) -> str:
-        prompt = f"""
-        Answer this student's question in a helpful, educational way:
-        Question: {question}
+        key, messages = await self.answer_context(user_id, question)
+        answer = await self.cached_ai(key, messages, user_id)
+        if answer not in OFFLINE_REPLIES.values() and answer != FALLBACK_REPLY:
+            self.remember(user_id, question, answer)
+        return answer
+    
+    async def stream_answer(self, user_id: int, question: str) -> AsyncIterator[str]:
+        # answer_question() as text deltas. A cached answer arrives in one
+        # piece and a completed stream is cached under the same key; a
+        # stream cut short (the user moved on) is not. Refusals and failures
+        # before the first delta yield the replies answer_question() gives;
+        # a failure after it raises StreamInterrupted. Unlike cached_ai(),
+        # concurrent misses on the same key each stream their own completion:
+        # a tutor question is personal context plus free text, so identical
+        # keys in flight at once are rare.
+        key, messages = await self.answer_context(user_id, question)
+        cached = await self.cache.lookup(key) if key is not None else None
+        if cached is not None:
+            self.remember(user_id, question, cached)
+            yield cached
+            return
         
-        Provide a clear explanation and maybe a follow-up question to check understanding.
-        """
+        parts = []
+        try:
+            policy = await self.admission.admit_ai(user_id)
+            async with aclosing(self.client.stream_chat(messages, policy=policy)) as deltas:
+                async for delta in deltas:
+                    parts.append(delta)
+                    yield delta
+        except Overloaded as e:
+            if parts:
+                raise StreamInterrupted(e.reason) from e
+            yield (key and self.cache.get_stale(key)) or OFFLINE_REPLIES[e.reason]
+            return
+        except Exception as e:
+            logger.warning("AI stream failed: %s", e)
+            if parts:
+                raise StreamInterrupted(str(e)) from e
+            yield FALLBACK_REPLY
+            return
+        answer = "".join(parts)
+        self.remember(user_id, question, answer)
+        if key is not None:
+            await self.cache.store(key, answer)
+    
+    async def cached_ai(self, key: Optional[str], messages: List[Dict], user_id: Optional[int] = None) -> str:
+        # Cache hits are served whatever the user's quota; only a miss goes
+        # through admission control. key=None skips the cache.
+        async def compute() -> str:
+            policy = await self.admission.admit_ai(user_id) if user_id is not None else None
+            return await self.client.chat(messages, policy=policy)
         
-        # Call AI API
-        return "Great question! Here's the explanation..."
+        try:
+            if key is None:
+                return await compute()
+            return await self.cache.get_or_compute(key, compute, personal=(Overloaded,))
+        except Overloaded as e:
+            return (key and self.cache.get_stale(key)) or OFFLINE_REPLIES[e.reason]
+        except Exception as e:
+            logger.warning("AI call failed: %s", e)
+            return FALLBACK_REPLY
     
     async def call_ai(self, prompt: str) -> str:
-        # Implement AI API call
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.choices[0].message.content
-        except:
-            return "I'm here to help you learn! Let me think about that..."
+            return await self.client.chat([{"role": "user", "content": prompt}])
+        except Exception as e:
+            logger.warning("AI call failed: %s", e)
+            return FALLBACK_REPLY
@@ -0,0 +1,173 @@
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from config import Config
+from src.utils.lazy import lazy_import
+
+try:
+    # Exact counts when tiktoken is installed; an estimate otherwise
+    tiktoken = lazy_import("tiktoken")
+except ModuleNotFoundError:
+    tiktoken = None
+
+
+class TokenCounter:
+    # Counts prompt tokens for the configured model. Without tiktoken it
+    # falls back to OpenAI's rule of thumb of ~4 characters per token,
+    # rounded up, which errs towards smaller prompts.
+    def __init__(self, model: Optional[str] = None):
+        self.model = model or Config.OPENAI_MODEL
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        if self._encoding is None and tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return (len(text) + 3) // 4
+
+    def truncate(self, text: str, limit: int) -> str:
+        # Cut text to at most `limit` tokens, on a word boundary when possible
+        if self.count(text) <= limit:
+            return text
+        if limit <= 0:
+            return ""
+        if self.encoding is not None:
+            cut = self.encoding.decode(self.encoding.encode(text)[:limit - 1])
+        else:
+            cut = text[:(limit - 1) * 4]
+        space = cut.rfind(" ", len(cut) // 2)
+        # ASCII marker: a non-Latin-1 character would double the memory of
+        # an otherwise ASCII string
+        return (cut[:space] if space != -1 else cut).rstrip() + "..."
+
+
+COUNTER = TokenCounter()
+
+
+class Exchange:
+    # One question and the answer given, both already capped to
+    # CONVERSATION_TURN_TOKENS, with their token count
+    __slots__ = ("question", "answer", "tokens")
+
+    def __init__(self, question: str, answer: str, tokens: int):
+        self.question = question
+        self.answer = answer
+        self.tokens = tokens
+
+
+class Conversation:
+    # Recent exchanges of one user in a ring buffer of `turns`. An exchange
+    # pushed out of the ring is folded into `summary` as a one-line note;
+    # once the summary outgrows summary_tokens it needs condensing (by the
+    # model, see AICoach) or trimming from the oldest line.
+    __slots__ = ("exchanges", "summary", "summary_tokens", "last_active", "condensing")
+
+    def __init__(self, turns: int):
+        self.exchanges: Deque[Exchange] = deque(maxlen=turns)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.last_active = time.monotonic()
+        self.condensing = False
+
+    def __len__(self) -> int:
+        return len(self.exchanges)
+
+    @property
+    def empty(self) -> bool:
+        return not self.exchanges and not self.summary
+
+    def add(self, exchange: Exchange, counter: TokenCounter = COUNTER):
+        if len(self.exchanges) == self.exchanges.maxlen:
+            oldest = self.exchanges[0]
+            note = f"- Asked: {counter.truncate(oldest.question, 40)}"
+            self.set_summary(f"{self.summary}\n{note}" if self.summary else note, counter)
+        self.exchanges.append(exchange)
+
+    def set_summary(self, summary: str, counter: TokenCounter = COUNTER):
+        self.summary = summary.strip()
+        self.summary_tokens = counter.count(self.summary)
+
+    def needs_condensing(self, limit: int) -> bool:
+        return self.summary_tokens > limit
+
+    def trim_summary(self, limit: int, counter: TokenCounter = COUNTER):
+        # Fallback to condensing: forget the oldest notes first
+        lines = self.summary.split("\n")
+        while len(lines) > 1 and counter.count("\n".join(lines)) > limit:
+            lines.pop(0)
+        self.set_summary(counter.truncate("\n".join(lines), limit), counter)
+
+
+class ConversationStore:
+    # Conversations by user in an OrderedDict kept in last-activity order,
+    # so idle eviction only looks at the front (as ExerciseSessionStore).
+    # A user's conversation ends after `idle_ttl` seconds without a
+    # question; past max_users the least recently active one goes.
+    def __init__(self, turns: Optional[int] = None, idle_ttl: Optional[float] = None,
+                 max_users: Optional[int] = None, turn_tokens: Optional[int] = None,
+                 counter: TokenCounter = COUNTER):
+        self.turns = turns or Config.CONVERSATION_TURNS
+        self.idle_ttl = idle_ttl or Config.CONVERSATION_IDLE_TTL
+        self.max_users = max_users or Config.CONVERSATION_MAX_USERS
+        self.turn_tokens = turn_tokens or Config.CONVERSATION_TURN_TOKENS
+        self.counter = counter
+        self._conversations: "OrderedDict[int, Conversation]" = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def get(self, user_id: int) -> Optional[Conversation]:
+        conversation = self._conversations.get(user_id)
+        if conversation is not None and conversation.last_active + self.idle_ttl <= time.monotonic():
+            del self._conversations[user_id]
+            self.expired += 1
+            return None
+        return conversation
+
+    def record(self, user_id: int, question: str, answer: str) -> Conversation:
+        now = time.monotonic()
+        conversation = self.get(user_id)
+        if conversation is None:
+            conversation = Conversation(self.turns)
+            self._conversations[user_id] = conversation
+        else:
+            self._conversations.move_to_end(user_id)
+        question = self.counter.truncate(question, self.turn_tokens)
+        answer = self.counter.truncate(answer, self.turn_tokens)
+        tokens = self.counter.count(question) + self.counter.count(answer)
+        conversation.add(Exchange(question, answer, tokens), self.counter)
+        conversation.last_active = now
+        self._evict(now)
+        return conversation
+
+    def _evict(self, now: float):
+        conversations = self._conversations
+        while conversations:
+            user_id, oldest = next(iter(conversations.items()))
+            if oldest.last_active + self.idle_ttl <= now:
+                self.expired += 1
+            elif len(conversations) > self.max_users:
+                self.evicted += 1
+            else:
+                break
+            del conversations[user_id]
+
+    def stats(self) -> Dict:
+        return {
+            "active": len(self._conversations),
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,104 @@
+from typing import Dict, List, Optional
+
+from config import Config
+from src.ai.memory import COUNTER, Conversation, TokenCounter
+from src.database.models import UserProgress
+
+# Shared instruction prefixes. They are the first message of every prompt
+# of their kind and never contain per-user text, so providers that cache
+# prompt prefixes can reuse them across users; keep them byte-identical.
+TUTOR_INSTRUCTIONS = (
+    "You are a friendly tutor for English, math and programming in a Telegram chat. "
+    "Answer the student's question in a helpful, educational way, pitched at their level. "
+    "Give a clear explanation and maybe a follow-up question to check understanding. "
+    "Use the earlier conversation only when the question refers to it."
+)
+PLAN_INSTRUCTIONS = (
+    "You are a learning coach. Create a balanced 30-minute daily study plan for the student "
+    "described below, focusing on their weak topics."
+)
+SUMMARY_INSTRUCTIONS = (
+    "Condense these notes about a tutoring conversation into a few short bullet points that keep "
+    "what the student asked about and struggled with. Reply with the bullet points only."
+)
+
+# Every chat message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD = 4
+
+
+def progress_summary(progress: Optional[UserProgress], max_topics: Optional[int] = None) -> str:
+    # One compact line per fact; weak topics are capped, not interpolated
+    # wholesale
+    if progress is None:
+        return ""
+    max_topics = Config.PROMPT_MAX_WEAK_TOPICS if max_topics is None else max_topics
+    levels = ", ".join(f"{name} {subject['level']}" for name, subject in progress.subjects.items())
+    lines = [f"Levels: {levels}"]
+    if progress.weak_topics:
+        topics = ", ".join(map(str, progress.weak_topics[-max_topics:]))
+        hidden = len(progress.weak_topics) - max_topics
+        lines.append(f"Weak topics: {topics}" + (f" (+{hidden} more)" if hidden > 0 else ""))
+    return "\n".join(lines)
+
+
+class PromptBuilder:
+    # Packs prompts into a token budget. The order is fixed: shared
+    # instructions, then the student's profile and the summary of older
+    # turns, then recent exchanges, then the question. The question and
+    # the instructions are always kept (the question capped to half the
+    # budget); the rest is added while it fits, the profile first, then
+    # the summary, then exchanges newest first.
+    def __init__(self, budget: Optional[int] = None, counter: TokenCounter = COUNTER):
+        self.budget = budget or Config.PROMPT_TOKEN_BUDGET
+        self.counter = counter
+
+    def tokens(self, messages: List[Dict]) -> int:
+        return sum(self.counter.count(message["content"]) + MESSAGE_OVERHEAD for message in messages)
+
+    def answer_messages(self, question: str, progress: Optional[UserProgress],
+                        conversation: Optional[Conversation] = None) -> List[Dict]:
+        question = self.counter.truncate(question, self.budget // 2)
+        head = [{"role": "system", "content": TUTOR_INSTRUCTIONS}]
+        tail = [{"role": "user", "content": question}]
+        left = self.budget - self.tokens(head) - self.tokens(tail)
+
+        context = []
+        profile = progress_summary(progress)
+        if profile:
+            context.append(f"About the student:\n{profile}")
+        if conversation is not None and conversation.summary:
+            context.append(f"Earlier in this conversation:\n{conversation.summary}")
+        while context:
+            message = {"role": "system", "content": "\n\n".join(context)}
+            cost = self.tokens([message])
+            if cost <= left:
+                head.append(message)
+                left -= cost
+                break
+            context.pop()
+
+        history: List[Dict] = []
+        if conversation is not None:
+            for exchange in reversed(conversation.exchanges):
+                cost = exchange.tokens + 2 * MESSAGE_OVERHEAD
+                if cost > left:
+                    break
+                history[:0] = [
+                    {"role": "user", "content": exchange.question},
+                    {"role": "assistant", "content": exchange.answer},
+                ]
+                left -= cost
+        return head + history + tail
+
+    def plan_messages(self, progress: Optional[UserProgress]) -> List[Dict]:
+        profile = progress_summary(progress) or "A new student."
+        return [
+            {"role": "system", "content": PLAN_INSTRUCTIONS},
+            {"role": "user", "content": self.counter.truncate(profile, self.budget // 2)},
+        ]
+
+    def summary_messages(self, notes: str, limit: int) -> List[Dict]:
+        return [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": f"Keep it under {limit * 3 // 4} words.\n\n{notes}"},
+        ]
@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from config import Config
+from src.database.models import Database
+from src.database.storage import create_database
+from src.gamification.leaderboard import SUBJECTS
+from src.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+try:
+    # Parquet snapshots when pyarrow is installed; compressed CSV otherwise
+    pa = lazy_import("pyarrow")
+    pq = lazy_import("pyarrow.parquet")
+except ModuleNotFoundError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Streak lengths for the retention table: users who ever reached N days
+# against users currently on a streak of at least N days
+STREAK_THRESHOLDS = (1, 3, 7, 14, 30, 100)
+# Users active within the last N days
+ACTIVITY_WINDOWS = (1, 7, 30)
+
+STATS_FIELDS = ("total_xp", "global_level", "current_streak", "longest_streak",
+                "streak_freeze", "total_learning_time")
+SUBJECT_COLUMNS = ("level", "xp", "mastery", "completed")
+
+
+def user_frame(chunk: List) -> "pd.DataFrame":
+    # One row per user from a chunk of (stats, progress) pairs, one typed
+    # column per field
+    size = len(chunk)
+    columns = {"user_id": np.fromiter((stats.user_id for stats, _ in chunk), np.int64, size)}
+    for name in STATS_FIELDS:
+        columns[name] = np.fromiter((getattr(stats, name) for stats, _ in chunk), np.int64, size)
+    columns["last_active"] = np.fromiter((stats._last_active for stats, _ in chunk), np.float64, size)
+    for subject in SUBJECTS:
+        records = [progress.subjects[subject] for _, progress in chunk]
+        columns[f"{subject}_level"] = np.fromiter((record.level for record in records), np.int64, size)
+        columns[f"{subject}_xp"] = np.fromiter((record.xp for record in records), np.int64, size)
+        columns[f"{subject}_mastery"] = np.fromiter((record.mastery_percentage for record in records), np.float64, size)
+        columns[f"{subject}_completed"] = np.fromiter((len(record.completed) for record in records), np.int64, size)
+    return pd.DataFrame(columns, copy=False)
+
+
+class CohortAggregates:
+    # Cohort statistics folded in one chunk at a time. State is a few
+    # counters per level, threshold and subject, whatever the user count.
+    def __init__(self, as_of: Optional[float] = None):
+        self.as_of = time.time() if as_of is None else as_of
+        self.users = 0
+        self.levels: Dict[str, "np.ndarray"] = {name: np.zeros(0, np.int64) for name in ("global",) + SUBJECTS}
+        self.reached = np.zeros(len(STREAK_THRESHOLDS), np.int64)
+        self.current = np.zeros(len(STREAK_THRESHOLDS), np.int64)
+        self.active = np.zeros(len(ACTIVITY_WINDOWS), np.int64)
+        self.subjects = {
+            subject: {"learners": 0, "xp": 0, "primary_users": 0, "completed": 0, "mastery": 0.0}
+            for subject in SUBJECTS
+        }
+
+    def _count_levels(self, name: str, levels: "np.ndarray"):
+        counts = np.bincount(np.clip(levels, 0, None), minlength=len(self.levels[name]))
+        counts[:len(self.levels[name])] += self.levels[name]
+        self.levels[name] = counts
+
+    def add(self, frame: "pd.DataFrame"):
+        self.users += len(frame)
+        self._count_levels("global", frame["global_level"].to_numpy())
+        longest = frame["longest_streak"].to_numpy()
+        current = frame["current_streak"].to_numpy()
+        thresholds = np.array(STREAK_THRESHOLDS)
+        self.reached += (longest[:, None] >= thresholds).sum(axis=0)
+        self.current += (current[:, None] >= thresholds).sum(axis=0)
+        idle = self.as_of - frame["last_active"].to_numpy()
+        self.active += (idle[:, None] <= np.array(ACTIVITY_WINDOWS) * 86400).sum(axis=0)
+
+        subject_xp = np.column_stack([frame[f"{subject}_xp"].to_numpy() for subject in SUBJECTS])
+        primary = np.where(subject_xp.max(axis=1) > 0, subject_xp.argmax(axis=1), -1)
+        for position, subject in enumerate(SUBJECTS):
+            self._count_levels(subject, frame[f"{subject}_level"].to_numpy())
+            totals = self.subjects[subject]
+            totals["learners"] += int((subject_xp[:, position] > 0).sum())
+            totals["xp"] += int(subject_xp[:, position].sum())
+            totals["primary_users"] += int((primary == position).sum())
+            totals["completed"] += int(frame[f"{subject}_completed"].sum())
+            totals["mastery"] += float(frame[f"{subject}_mastery"].sum())
+
+    def frames(self) -> Dict[str, "pd.DataFrame"]:
+        users = max(self.users, 1)
+        top = max(len(counts) for counts in self.levels.values())
+        levels = pd.DataFrame(
+            {name: np.pad(counts, (0, top - len(counts))) for name, counts in self.levels.items()}
+        ).rename_axis("level")
+        levels = levels[levels.sum(axis=1) > 0]
+        retention = pd.DataFrame({
+            "streak_days": STREAK_THRESHOLDS,
+            "reached": self.reached,
+            "current": self.current,
+        })
+        retention["retained_share"] = (retention["current"] / retention["reached"].where(retention["reached"] > 0)).round(4)
+        activity = pd.DataFrame({
+            "active_within_days": ACTIVITY_WINDOWS,
+            "users": self.active,
+            "share": (self.active / users).round(4),
+        })
+        subject_xp = sum(totals["xp"] for totals in self.subjects.values()) or 1
+        subjects = pd.DataFrame([
+            {
+                "subject": subject,
+                "learners": totals["learners"],
+                "learner_share": round(totals["learners"] / users, 4),
+                "xp": totals["xp"],
+                "xp_share": round(totals["xp"] / subject_xp, 4),
+                "primary_users": totals["primary_users"],
+                "completed": totals["completed"],
+                "mean_mastery": round(totals["mastery"] / users, 2),
+            }
+            for subject, totals in self.subjects.items()
+        ])
+        return {
+            "level_distribution": levels.reset_index(),
+            "streak_retention": retention,
+            "activity": activity,
+            "subject_mix": subjects,
+        }
+
+
+class SnapshotWriter:
+    # Appends chunk frames to one snapshot file: gzip CSV, or Parquet with
+    # one row group per chunk. Written beside the target and renamed on
+    # close, so readers never see a partial snapshot.
+    def __init__(self, directory: str, fmt: str = "csv"):
+        if fmt == "parquet" and pq is None:
+            raise RuntimeError("Parquet snapshots need pyarrow; use --format csv")
+        self.fmt = fmt
+        self.path = os.path.join(directory, "users.parquet" if fmt == "parquet" else "users.csv.gz")
+        self._tmp = f"{self.path}.tmp"
+        self._file = None
+        self._writer = None
+        self.rows = 0
+
+    def write(self, frame: "pd.DataFrame"):
+        if self.fmt == "parquet":
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self._tmp, table.schema, compression="zstd")
+            self._writer.write_table(table)
+        else:
+            if self._file is None:
+                self._file = gzip.open(self._tmp, "wt", compresslevel=6, newline="")
+            frame.to_csv(self._file, header=self.rows == 0, index=False, float_format="%.6g")
+        self.rows += len(frame)
+
+    def close(self, keep: bool = True):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        if not os.path.exists(self._tmp):
+            return
+        if keep:
+            os.replace(self._tmp, self.path)
+        else:
+            os.unlink(self._tmp)
+
+
+async def export_cohorts(db: Database, directory: str, chunk_size: int = 10_000, fmt: str = "csv",
+                         snapshot: bool = True, pause: float = 0.0) -> Dict:
+    # Streams every user from storage once, chunk by chunk: each chunk
+    # becomes a frame that is folded into the aggregates and appended to
+    # the snapshot, then dropped. Memory stays at about one chunk.
+    os.makedirs(directory, exist_ok=True)
+    aggregates = CohortAggregates()
+    writer = SnapshotWriter(directory, fmt) if snapshot else None
+    started = time.perf_counter()
+    try:
+        async for chunk in db.iter_user_states(chunk_size):
+            frame = user_frame(chunk)
+            aggregates.add(frame)
+            if writer is not None:
+                writer.write(frame)
+            if pause:
+                await asyncio.sleep(pause)
+    except BaseException:
+        if writer is not None:
+            writer.close(keep=False)
+        raise
+    if writer is not None:
+        writer.close()
+
+    files = [writer.path] if writer is not None else []
+    for name, frame in aggregates.frames().items():
+        path = os.path.join(directory, f"{name}.csv")
+        frame.to_csv(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        files.append(path)
+    return {"users": aggregates.users, "seconds": time.perf_counter() - started, "files": files}
+
+
+async def run_export(args) -> Dict:
+    db = create_database(args.database)
+    await db.start()
+    try:
+        return await export_cohorts(db, args.out, args.chunk_size, args.format, not args.no_snapshot, args.pause)
+    finally:
+        await db.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    # python -m src.analytics.export analytics/2024-05-01 [--database sqlite:///bot.db]
+    # Run it as its own process next to the bot: it reads the shared store
+    # page by page (SQLite in WAL mode lets the bot keep writing meanwhile)
+    # at lower CPU priority, and never touches the serving process.
+    parser = argparse.ArgumentParser(description="Export cohort statistics of all users")
+    parser.add_argument("out", help="directory for the snapshot and aggregate files")
+    parser.add_argument("--database", default=Config.DATABASE_URL)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--no-snapshot", action="store_true", help="write the aggregates only")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to yield between chunks")
+    parser.add_argument("--nice", type=int, default=10)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.nice:
+        os.nice(args.nice)
+    report = asyncio.run(run_export(args))
+    logger.info("Exported %d users in %.1fs: %s", report["users"], report["seconds"], ", ".join(report["files"]))
+
+
+if __name__ == "__main__":
+    main()
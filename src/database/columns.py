@@ -0,0 +1,121 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional
+
+from src.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Numeric per-user stats live in one typed array per column instead of a
+# __dict__ per user. A UserStats object is only a (table, row) handle.
+STATS_COLUMNS = {
+    "total_xp": "q",
+    "global_level": "l",
+    "current_streak": "l",
+    "longest_streak": "l",
+    "total_learning_time": "q",
+    "last_active": "d",  # POSIX timestamp
+    "streak_freeze": "l",
+    "lesson_day": "l",  # date.toordinal() of lessons_today
+    "lessons_today": "l",
+    "active_day": "l",  # date.toordinal() of the latest streak day with activity
+    "active_days": "l",  # bit i: active on active_day - i (see streaks.mark_active)
+}
+
+STATS_DEFAULTS = {
+    "global_level": 1,
+}
+
+
+class StatsTable:
+    def __init__(self):
+        self.columns: Dict[str, array] = {
+            name: array(typecode) for name, typecode in STATS_COLUMNS.items()
+        }
+        self.user_ids = array("q")
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def new_row(self, user_id: int) -> int:
+        row = len(self.user_ids)
+        self.user_ids.append(user_id)
+        for name, column in self.columns.items():
+            column.append(STATS_DEFAULTS.get(name, 0))
+        return row
+
+    def remove(self, row: int) -> Optional[int]:
+        # Swap-remove: the last row moves into `row` so the columns stay
+        # dense. Returns the user id now at `row`, or None if it was last.
+        last = len(self.user_ids) - 1
+        for column in (self.user_ids, *self.columns.values()):
+            column[row] = column[last]
+            column.pop()
+        return self.user_ids[row] if row < last else None
+
+    def view(self, name: str) -> "np.ndarray":
+        # Zero-copy, writable NumPy view of one column for bulk jobs. While
+        # the view is alive the column cannot grow (new_row raises
+        # BufferError), so views must not outlive the synchronous job
+        column = self.columns[name]
+        return np.frombuffer(column, dtype=np.dtype(column.typecode))
+
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column) for column in self.columns.values()) + \
+            self.user_ids.itemsize * len(self.user_ids)
+
+
+class Column:
+    # Descriptor mapping a UserStats attribute onto its table column
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj._table.columns[self.name][obj._row]
+
+    def __set__(self, obj, value):
+        obj._table.columns[self.name][obj._row] = value
+
+
+class CompletionSet:
+    # Set of completed item ids kept as a sorted int64 array: 8 bytes per id
+    # instead of a list slot plus an int object. Keeps the list-style
+    # append/len/iter API the progress dicts used before.
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids: Iterable[int] = ()):
+        self._ids = array("q", sorted(set(int(i) for i in ids)))
+
+    def append(self, item_id: int):
+        self.add(item_id)
+
+    def add(self, item_id: int) -> bool:
+        item_id = int(item_id)
+        pos = bisect_left(self._ids, item_id)
+        if pos < len(self._ids) and self._ids[pos] == item_id:
+            return False
+        self._ids.insert(pos, item_id)
+        return True
+
+    def __contains__(self, item_id) -> bool:
+        pos = bisect_left(self._ids, item_id)
+        return pos < len(self._ids) and self._ids[pos] == item_id
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (CompletionSet, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"CompletionSet({list(self._ids)!r})"
+
+    def to_list(self) -> List[int]:
+        return self._ids.tolist()
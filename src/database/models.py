@@ -1,8 +1,18 @@
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 from datetime import datetime, date
 import json
+from src.database.columns import CompletionSet, Column, StatsTable, STATS_COLUMNS
+
+# Default table for UserStats created outside a Database
+DEFAULT_STATS_TABLE = StatsTable()
+
+def shard_of(user_id: int, shards: int) -> int:
+    # Plain modulo so SQL filters can use the same rule
+    return user_id % shards
 
 class User:
+    __slots__ = ("user_id", "username", "first_name", "created_at", "subscription", "language")
+    
     def __init__(self, user_id: int, username: str, first_name: str):
         self.user_id = user_id
         self.username = username
@@ -10,48 +20,191 @@ class User:
         self.created_at = datetime.now()
         self.subscription = "free"  # free, premium
         self.language = "en"
+    
+    def to_dict(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "username": self.username,
+            "first_name": self.first_name,
+            "created_at": self.created_at.isoformat(),
+            "subscription": self.subscription,
+            "language": self.language
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "User":
+        user = cls(data["user_id"], data["username"], data["first_name"])
+        user.created_at = datetime.fromisoformat(data["created_at"])
+        user.subscription = data["subscription"]
+        user.language = data["language"]
+        return user
         
 class UserStats:
-    def __init__(self, user_id: int):
+    # Numeric stats are stored in a StatsTable row; attributes read and
+    # write the columns directly
+    __slots__ = ("user_id", "_table", "_row")
+    
+    total_xp = Column("total_xp")
+    global_level = Column("global_level")
+    current_streak = Column("current_streak")
+    longest_streak = Column("longest_streak")
+    total_learning_time = Column("total_learning_time")
+    streak_freeze = Column("streak_freeze")
+    lesson_day = Column("lesson_day")
+    lessons_today = Column("lessons_today")
+    active_day = Column("active_day")
+    active_days = Column("active_days")
+    _last_active = Column("last_active")
+    
+    def __init__(self, user_id: int, table: Optional[StatsTable] = None):
         self.user_id = user_id
-        self.total_xp = 0
-        self.global_level = 1
-        self.current_streak = 0
-        self.longest_streak = 0
-        self.total_learning_time = 0
+        self._table = DEFAULT_STATS_TABLE if table is None else table
+        self._row = self._table.new_row(user_id)
         self.last_active = datetime.now()
-        self.streak_freeze = 0
+    
+    @property
+    def last_active(self) -> datetime:
+        return datetime.fromtimestamp(self._last_active)
+    
+    @last_active.setter
+    def last_active(self, value: datetime):
+        self._last_active = value.timestamp()
+    
+    def to_dict(self) -> Dict:
+        data = {"user_id": self.user_id}
+        for name in STATS_COLUMNS:
+            data[name] = getattr(self, name)
+        data["last_active"] = self.last_active.isoformat()
+        return data
+    
+    def detach(self):
+        # Move this user's row into a private table, e.g. before the row is
+        # removed from a shared one; handles still held keep their values
+        table = StatsTable()
+        row = table.new_row(self.user_id)
+        for name, column in table.columns.items():
+            column[row] = self._table.columns[name][self._row]
+        self._table, self._row = table, row
+    
+    @classmethod
+    def from_dict(cls, data: Dict, table: Optional[StatsTable] = None) -> "UserStats":
+        stats = cls(data["user_id"], table)
+        for name in STATS_COLUMNS:
+            if name in data and name != "last_active":
+                setattr(stats, name, data[name])
+        stats.last_active = datetime.fromisoformat(data["last_active"])
+        return stats
+
+# Field names each subject exposes, mapped onto SubjectProgress slots
+SUBJECT_FIELDS = {
+    "english": {
+        "level": "level",
+        "xp": "xp",
+        "current_unit": "focus",
+        "lesson_cursors": "cursors",
+        "vocabulary_size": "vocabulary_size",
+        "mastery_percentage": "mastery_percentage",
+        "completed_lessons": "completed"
+    },
+    "math": {
+        "level": "level",
+        "xp": "xp",
+        "current_topic": "focus",
+        "mastery_percentage": "mastery_percentage",
+        "completed_exercises": "completed"
+    },
+    "programming": {
+        "level": "level",
+        "xp": "xp",
+        "current_language": "focus",
+        "mastery_percentage": "mastery_percentage",
+        "completed_challenges": "completed"
+    }
+}
+
+class SubjectProgress:
+    # Slotted record that still behaves like the old per-subject dict:
+    # subject["level"], subject["completed_lessons"].append(...), .get(), ...
+    __slots__ = ("subject", "level", "xp", "focus", "cursors", "vocabulary_size", "mastery_percentage", "completed")
+    
+    def __init__(self, subject: str, focus: str):
+        self.subject = subject
+        self.level = 1
+        self.xp = 0
+        self.focus = focus
+        # Lesson pool -> [position, cycle, pool size] (see LessonCursors)
+        self.cursors: Optional[Dict[str, List[int]]] = None
+        self.vocabulary_size = 0
+        self.mastery_percentage = 0
+        self.completed = CompletionSet()
+    
+    def _slot(self, key: str) -> str:
+        try:
+            return SUBJECT_FIELDS[self.subject][key]
+        except KeyError:
+            raise KeyError(key) from None
+    
+    def __getitem__(self, key: str):
+        return getattr(self, self._slot(key))
+    
+    def __setitem__(self, key: str, value):
+        slot = self._slot(key)
+        if slot == "completed" and not isinstance(value, CompletionSet):
+            value = CompletionSet(value)
+        setattr(self, slot, value)
+    
+    def __contains__(self, key: str) -> bool:
+        return key in SUBJECT_FIELDS[self.subject]
+    
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+    
+    def keys(self):
+        return SUBJECT_FIELDS[self.subject].keys()
+    
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+    
+    def to_dict(self) -> Dict:
+        data = dict(self.items())
+        for key, value in data.items():
+            if isinstance(value, CompletionSet):
+                data[key] = value.to_list()
+        return data
         
 class UserProgress:
+    __slots__ = ("user_id", "subjects", "weak_topics", "strengths", "achievements")
+    
     def __init__(self, user_id: int):
         self.user_id = user_id
         self.subjects = {
-            "english": {
-                "level": 1,
-                "xp": 0,
-                "current_unit": "basics",
-                "vocabulary_size": 0,
-                "mastery_percentage": 0,
-                "completed_lessons": []
-            },
-            "math": {
-                "level": 1,
-                "xp": 0,
-                "current_topic": "arithmetic",
-                "mastery_percentage": 0,
-                "completed_exercises": []
-            },
-            "programming": {
-                "level": 1,
-                "xp": 0,
-                "current_language": "python",
-                "mastery_percentage": 0,
-                "completed_challenges": []
-            }
+            "english": SubjectProgress("english", "basics"),
+            "math": SubjectProgress("math", "arithmetic"),
+            "programming": SubjectProgress("programming", "python")
         }
         self.weak_topics = []
         self.strengths = []
         self.achievements = []
+    
+    def to_dict(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "subjects": {name: subject.to_dict() for name, subject in self.subjects.items()},
+            "weak_topics": self.weak_topics,
+            "strengths": self.strengths,
+            "achievements": self.achievements
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "UserProgress":
+        progress = cls(data["user_id"])
+        for subject, values in data["subjects"].items():
+            for key, value in values.items():
+                progress.subjects[subject][key] = value
+        progress.weak_topics = data["weak_topics"]
+        progress.strengths = data["strengths"]
+        progress.achievements = data["achievements"]
+        return progress
         
 class Database:
     def __init__(self):
@@ -59,14 +212,97 @@ class Database:
         self.user_stats = {}
         self.user_progress = {}
         self.leaderboards = {}
+        self.stats_table = StatsTable()
+        # (index, count) when this process serves one shard of the users
+        self.shard: Optional[Tuple[int, int]] = None
+        self.aggregates: Dict[str, Dict[int, bytes]] = {}
+        # Serialized SRS decks and the minute each owner is next reminded
+        self.decks: Dict[int, bytes] = {}
+        self.deck_reminders: Dict[int, int] = {}
+    
+    def set_shard(self, index: int, count: int):
+        # Bulk jobs (iter_user_states, update_stats_columns) then only see
+        # this shard's users
+        self.shard = (index, count) if count > 1 else None
+    
+    def owns(self, user_id: int) -> bool:
+        return self.shard is None or shard_of(user_id, self.shard[1]) == self.shard[0]
+    
+    async def start(self):
+        # In-memory storage has nothing to open
+        pass
+    
+    async def close(self):
+        pass
+    
+    @property
+    def pending_writes(self) -> int:
+        # Rows changed in memory but not yet persisted
+        return 0
     
     async def get_user(self, user_id: int) -> Optional[User]:
         return self.users.get(user_id)
     
+    async def get_user_stats(self, user_id: int) -> Optional[UserStats]:
+        return self.user_stats.get(user_id)
+    
+    async def get_user_progress(self, user_id: int) -> Optional[UserProgress]:
+        return self.user_progress.get(user_id)
+    
+    async def count_users(self) -> int:
+        return len(self.users)
+    
+    async def iter_user_states(self, chunk_size: int = 1000):
+        # Stream (stats, progress) pairs for every user in fixed-size chunks
+        user_ids = [user_id for user_id in self.user_stats if self.owns(user_id)]
+        for start in range(0, len(user_ids), chunk_size):
+            yield [
+                (self.user_stats[user_id], self.user_progress[user_id])
+                for user_id in user_ids[start:start + chunk_size]
+            ]
+    
+    async def write_user_states(self, states: List):
+        # Persist (stats, progress) pairs changed by a bulk job
+        for stats, progress in states:
+            self.user_stats[stats.user_id] = stats
+            self.user_progress[progress.user_id] = progress
+    
+    async def update_stats_columns(self, update: Callable[[StatsTable], Sequence[int]]) -> int:
+        # Bulk jobs over the typed stats columns: update() edits a table in
+        # place through StatsTable.view and returns the rows it changed.
+        # Every in-memory user has its row in self.stats_table.
+        return len(update(self.stats_table))
+    
+    async def publish_aggregate(self, name: str, shard: int, payload: bytes):
+        # Per-shard summaries (e.g. leaderboard snapshots) that every worker
+        # reads back to build cross-shard views
+        self.aggregates.setdefault(name, {})[shard] = payload
+    
+    async def read_aggregates(self, name: str) -> Dict[int, bytes]:
+        return dict(self.aggregates.get(name, {}))
+    
+    async def load_deck(self, user_id: int) -> Optional[bytes]:
+        return self.decks.get(user_id)
+    
+    async def save_deck(self, user_id: int, data: bytes, remind_at: int):
+        self.decks[user_id] = data
+        self.deck_reminders[user_id] = remind_at
+    
+    async def claim_deck_reminders(self, now: int, rearm_at: int, limit: int) -> List[int]:
+        # Users (of this shard) whose reminder time has passed, moved to
+        # rearm_at. A scan here; the stores keep an index on the time.
+        due = sorted(
+            (remind_at, user_id) for user_id, remind_at in self.deck_reminders.items()
+            if remind_at <= now and self.owns(user_id)
+        )[:limit]
+        for _, user_id in due:
+            self.deck_reminders[user_id] = rearm_at
+        return [user_id for _, user_id in due]
+    
     async def create_user(self, user_id: int, username: str, first_name: str) -> User:
         user = User(user_id, username, first_name)
         self.users[user_id] = user
-        self.user_stats[user_id] = UserStats(user_id)
+        self.user_stats[user_id] = UserStats(user_id, self.stats_table)
         self.user_progress[user_id] = UserProgress(user_id)
         return user
     
@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import logging
+import socket
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Minimal RESP2 (Redis protocol) support: a blocking client for the
+# database writer thread, and an in-memory stand-in server that implements
+# just the commands RedisDatabase uses, for development and benchmarks
+# where no Redis-compatible server is installed.
+
+Reply = Union[None, int, bytes, List["Reply"]]
+
+
+class RespError(Exception):
+    pass
+
+
+def parse_redis_url(url: str) -> Tuple[str, int, int]:
+    # redis://host:port/db
+    parsed = urlparse(url)
+    db = int(parsed.path.lstrip("/") or 0)
+    return parsed.hostname or "127.0.0.1", parsed.port or 6379, db
+
+
+def _bulk(value) -> bytes:
+    if isinstance(value, str):
+        value = value.encode()
+    elif isinstance(value, (int, float)):
+        value = str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def encode_command(*args) -> bytes:
+    return b"*%d\r\n" % len(args) + b"".join(_bulk(arg) for arg in args)
+
+
+class RespConnection:
+    # Not thread-safe; SQLiteDatabase already confines its connection to
+    # one writer thread, and RedisDatabase inherits that
+    def __init__(self, host: str, port: int, db: int = 0, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+
+    def connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        if self.db:
+            self.execute("SELECT", self.db)
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = self._file = None
+
+    def execute(self, *args) -> Reply:
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands: Sequence[Sequence]) -> List[Reply]:
+        # One write for all commands, then read the replies in order
+        if not commands:
+            return []
+        self._sock.sendall(b"".join(encode_command(*command) for command in commands))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def _read(self) -> Reply:
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("RESP server closed the connection")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            return RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            if count < 0:
+                return None
+            return [self._read() for _ in range(count)]
+        raise RespError(f"Unexpected RESP reply {line!r}")
+
+
+class SortedSet:
+    __slots__ = ("scores", "ordered")
+
+    def __init__(self):
+        self.scores: Dict[bytes, float] = {}
+        self.ordered: List[Tuple[float, bytes]] = []
+
+    def add(self, score: float, member: bytes) -> int:
+        old = self.scores.get(member)
+        if old == score:
+            return 0
+        if old is not None:
+            self.ordered.remove((old, member))
+        self.scores[member] = score
+        insort(self.ordered, (score, member))
+        return int(old is None)
+
+
+class StandInServer:
+    # In-memory RESP server with strings, hashes and sorted sets. Single
+    # database, no expiry, no persistence.
+    def __init__(self):
+        self.data: Dict[bytes, object] = {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                writer.write(self._reply(self.dispatch(command)))
+                # Pipelined commands are answered together
+                if not reader._buffer:
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _reply(self, value) -> bytes:
+        if isinstance(value, RespError):
+            return b"-%s\r\n" % str(value).encode()
+        if value is None:
+            return b"$-1\r\n"
+        if value is True:
+            return b"+OK\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, bytes):
+            return _bulk(value)
+        return b"*%d\r\n" % len(value) + b"".join(self._reply(item) for item in value)
+
+    def _typed(self, key: bytes, kind: type):
+        value = self.data.get(key)
+        if value is None:
+            value = self.data[key] = kind()
+        elif not isinstance(value, kind):
+            raise RespError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def dispatch(self, command: List[bytes]):
+        name, args = command[0].upper().decode(), command[1:]
+        try:
+            handler = getattr(self, f"cmd_{name.lower()}")
+        except AttributeError:
+            return RespError(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args)
+        except RespError as e:
+            return e
+        except (TypeError, ValueError):
+            return RespError(f"ERR wrong arguments for '{name}'")
+
+    def cmd_ping(self, *args):
+        return args[0] if args else True
+
+    def cmd_select(self, db):
+        return True
+
+    def cmd_flushdb(self):
+        self.data.clear()
+        return True
+
+    def cmd_get(self, key):
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, bytes):
+            raise RespError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def cmd_set(self, key, value):
+        self.data[key] = value
+        return True
+
+    def cmd_del(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def cmd_hset(self, key, *pairs):
+        table = self._typed(key, dict)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in table
+            table[field] = value
+        return added
+
+    def cmd_hget(self, key, field):
+        return self._typed(key, dict).get(field)
+
+    def cmd_hmget(self, key, *fields):
+        table = self._typed(key, dict)
+        return [table.get(field) for field in fields]
+
+    def cmd_hlen(self, key):
+        return len(self._typed(key, dict))
+
+    def cmd_hgetall(self, key):
+        return [item for pair in self._typed(key, dict).items() for item in pair]
+
+    def cmd_zadd(self, key, *pairs):
+        zset = self._typed(key, SortedSet)
+        return sum(zset.add(float(score), member) for score, member in zip(pairs[::2], pairs[1::2]))
+
+    def cmd_zcard(self, key):
+        return len(self._typed(key, SortedSet).scores)
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        # Supports "(" exclusive bounds, -inf/+inf and LIMIT offset count
+        zset = self._typed(key, SortedSet)
+        exclusive = low.startswith(b"(")
+        low = float(low.lstrip(b"("))
+        high = float(high.lstrip(b"("))
+        offset, count = 0, None
+        if options and options[0].upper() == b"LIMIT":
+            offset, count = int(options[1]), int(options[2])
+        start = _upper_bound(zset.ordered, low) if exclusive else _lower_bound(zset.ordered, low)
+        members = []
+        for score, member in zset.ordered[start + offset:]:
+            if score > high or (count is not None and len(members) >= count):
+                break
+            members.append(member)
+        return members
+
+
+def _lower_bound(ordered: List[Tuple[float, bytes]], score: float) -> int:
+    # First position with a score >= score
+    return bisect_left(ordered, score, key=itemgetter(0))
+
+
+def _upper_bound(ordered: List[Tuple[float, bytes]], score: float) -> int:
+    # First position with a score > score
+    return bisect_right(ordered, score, key=itemgetter(0))
+
+
+async def serve_stand_in(host: str = "127.0.0.1", port: int = 6379):
+    server = StandInServer()
+    listener = await asyncio.start_server(server.handle, host, port)
+    logger.info("RESP stand-in listening on %s:%d", host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    # python -m src.database.resp --port 6380
+    parser = argparse.ArgumentParser(description="In-memory RESP stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve_stand_in(args.host, args.port))
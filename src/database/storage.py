@@ -0,0 +1,513 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import Config
+from src.database.columns import StatsTable
+from src.database.models import Database, User, UserProgress, UserStats
+from src.database.resp import RespConnection, parse_redis_url
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("users", "user_stats", "user_progress")
+
+
+def sqlite_path_from_url(url: str) -> Optional[str]:
+    # sqlite:///bot.db -> bot.db, sqlite:////abs/bot.db -> /abs/bot.db
+    if not url or not url.startswith("sqlite:///"):
+        return None
+    return url[len("sqlite:///"):] or ":memory:"
+
+
+def create_database(url: Optional[str] = None) -> Database:
+    url = Config.DATABASE_URL if url is None else url
+    if url == "memory://":
+        return Database()
+    if url.startswith("redis://"):
+        return RedisDatabase(url)
+    path = sqlite_path_from_url(url)
+    if path is None:
+        logger.warning("Unsupported DATABASE_URL %r, falling back to in-memory storage", url)
+        return Database()
+    return SQLiteDatabase(path)
+
+
+class SQLiteDatabase(Database):
+    # The inherited dicts act as a write-behind hot cache. Reads are served
+    # from memory, misses are loaded from SQLite, and writes only mark the
+    # user dirty. A background task flushes all dirty rows in one
+    # transaction every flush_interval seconds, then evicts clean users
+    # idle for idle_ttl seconds or beyond max_users, least recent first.
+    def __init__(self, path: str, flush_interval: Optional[float] = None,
+                 max_users: Optional[int] = None, idle_ttl: Optional[float] = None):
+        super().__init__()
+        self.path = path
+        self.flush_interval = Config.DB_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.max_users = max_users or Config.DB_CACHE_MAX_USERS
+        self.idle_ttl = Config.DB_CACHE_IDLE_TTL if idle_ttl is None else idle_ttl
+        # Last access per cached user, least recent first
+        self._access: "OrderedDict[int, float]" = OrderedDict()
+        # Bulk jobs that need the cached set to hold still
+        self._evict_paused = 0
+        self.evicted = 0
+        # One thread owns the connection, so SQLite never sees concurrent use
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._dirty: Dict[str, Set[int]] = {table: set() for table in TABLES}
+        # SRS decks are written behind too, but not kept once flushed
+        self._deck_writes: Dict[int, Tuple[bytes, int]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.flushed_rows = 0
+        self.flush_count = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    @property
+    def pending_writes(self) -> int:
+        return sum(len(dirty) for dirty in self._dirty.values()) + len(self._deck_writes)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Shard workers share the file; wait for another writer's
+        # transaction instead of failing with "database is locked"
+        conn.execute(f"PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT * 1000)}")
+        for table in TABLES:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+            )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS srs_decks "
+            "(user_id INTEGER PRIMARY KEY, data BLOB NOT NULL, remind_at INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS srs_decks_remind_at ON srs_decks (remind_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS aggregates "
+            "(name TEXT NOT NULL, shard INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (name, shard))"
+        )
+        conn.commit()
+        self._conn = conn
+
+    async def start(self):
+        await self._run(self._connect)
+        if self.flush_interval > 0:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Database flush failed")
+                continue
+            self.evict()
+
+    def _touch(self, user_id: int):
+        self._access[user_id] = time.monotonic()
+        self._access.move_to_end(user_id)
+
+    def evict(self, now: Optional[float] = None) -> int:
+        # Drops clean users from the cache, least recently used first; dirty
+        # ones stay until a flush has written them. Synchronous, so no write
+        # can slip in between the dirty check and the drop.
+        if self._evict_paused:
+            return 0
+        now = time.monotonic() if now is None else now
+        dirty = set().union(*self._dirty.values())
+        victims = []
+        for user_id, seen in self._access.items():
+            if len(self._access) - len(victims) <= self.max_users and now - seen < self.idle_ttl:
+                break
+            if user_id not in dirty:
+                victims.append(user_id)
+        for user_id in victims:
+            self._drop(user_id)
+        self.evicted += len(victims)
+        return len(victims)
+
+    def _drop(self, user_id: int):
+        del self._access[user_id]
+        self.users.pop(user_id, None)
+        self.user_progress.pop(user_id, None)
+        stats = self.user_stats.pop(user_id, None)
+        if stats is None or stats._table is not self.stats_table:
+            return
+        row = stats._row
+        stats.detach()
+        moved = self.stats_table.remove(row)
+        if moved is not None and moved in self.user_stats:
+            self.user_stats[moved]._row = row
+
+    # Reads
+
+    def _load_rows(self, user_id: int) -> Dict[str, Optional[str]]:
+        rows = {}
+        for table in TABLES:
+            row = self._conn.execute(
+                f"SELECT data FROM {table} WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            rows[table] = row[0] if row else None
+        return rows
+
+    async def _ensure_loaded(self, user_id: int) -> bool:
+        if user_id in self.users:
+            self._touch(user_id)
+            return True
+        rows = await self._run(self._load_rows, user_id)
+        if rows["users"] is None:
+            return False
+        # Another coroutine may have loaded or created the user meanwhile
+        if user_id not in self.users:
+            self.users[user_id] = User.from_dict(json.loads(rows["users"]))
+            self.user_stats[user_id] = (
+                UserStats.from_dict(json.loads(rows["user_stats"]), self.stats_table) if rows["user_stats"] else UserStats(user_id, self.stats_table)
+            )
+            self.user_progress[user_id] = (
+                UserProgress.from_dict(json.loads(rows["user_progress"])) if rows["user_progress"] else UserProgress(user_id)
+            )
+        self._touch(user_id)
+        return True
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        await self._ensure_loaded(user_id)
+        return self.users.get(user_id)
+
+    async def get_user_stats(self, user_id: int) -> Optional[UserStats]:
+        await self._ensure_loaded(user_id)
+        return self.user_stats.get(user_id)
+
+    async def get_user_progress(self, user_id: int) -> Optional[UserProgress]:
+        await self._ensure_loaded(user_id)
+        return self.user_progress.get(user_id)
+
+    def _count_users(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    async def count_users(self) -> int:
+        await self.flush()
+        return await self._run(self._count_users)
+
+    def _shard_filter(self, column: str) -> Tuple[str, Tuple]:
+        # Same rule as models.shard_of
+        if self.shard is None:
+            return "", ()
+        index, count = self.shard
+        return f" AND {column} % ? = ?", (count, index)
+
+    def _read_page(self, after: int, limit: int) -> List[Tuple[int, str, Optional[str]]]:
+        where, params = self._shard_filter("s.user_id")
+        return self._conn.execute(
+            "SELECT s.user_id, s.data, p.data FROM user_stats s "
+            "LEFT JOIN user_progress p ON p.user_id = s.user_id "
+            f"WHERE s.user_id > ?{where} ORDER BY s.user_id LIMIT ?",
+            (after, *params, limit),
+        ).fetchall()
+
+    def _read_stats_page(self, after: int, limit: int) -> List[Tuple[int, str]]:
+        where, params = self._shard_filter("user_id")
+        return self._conn.execute(
+            f"SELECT user_id, data FROM user_stats WHERE user_id > ?{where} ORDER BY user_id LIMIT ?",
+            (after, *params, limit),
+        ).fetchall()
+
+    async def iter_user_states(self, chunk_size: int = 1000):
+        # Keyset pagination over the stored rows, preferring hot-cache objects
+        await self.flush()
+        after = -1
+        while True:
+            rows = await self._run(self._read_page, after, chunk_size)
+            if not rows:
+                return
+            # Rows outside the hot cache get a throwaway table so streaming
+            # every user does not grow the shared one
+            scratch = StatsTable()
+            chunk = []
+            for user_id, stats_data, progress_data in rows:
+                stats = self.user_stats.get(user_id)
+                progress = self.user_progress.get(user_id)
+                if stats is None:
+                    stats = UserStats.from_dict(json.loads(stats_data), scratch)
+                if progress is None:
+                    progress = UserProgress.from_dict(json.loads(progress_data)) if progress_data else UserProgress(user_id)
+                chunk.append((stats, progress))
+            yield chunk
+            after = rows[-1][0]
+
+    def _load_deck(self, user_id: int) -> Optional[bytes]:
+        row = self._conn.execute("SELECT data FROM srs_decks WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    async def load_deck(self, user_id: int) -> Optional[bytes]:
+        pending = self._deck_writes.get(user_id)
+        if pending is not None:
+            return pending[0]
+        return await self._run(self._load_deck, user_id)
+
+    def _claim_deck_reminders(self, now: int, rearm_at: int, limit: int) -> List[int]:
+        where, params = self._shard_filter("user_id")
+        with self._conn:
+            user_ids = [row[0] for row in self._conn.execute(
+                f"SELECT user_id FROM srs_decks WHERE remind_at <= ?{where} ORDER BY remind_at LIMIT ?",
+                (now, *params, limit),
+            ).fetchall()]
+            self._conn.executemany(
+                "UPDATE srs_decks SET remind_at = ? WHERE user_id = ?", [(rearm_at, user_id) for user_id in user_ids]
+            )
+        return user_ids
+
+    async def claim_deck_reminders(self, now: int, rearm_at: int, limit: int) -> List[int]:
+        await self.flush()
+        return await self._run(self._claim_deck_reminders, now, rearm_at, limit)
+
+    def _read_aggregates(self, name: str) -> Dict[int, bytes]:
+        return dict(self._conn.execute("SELECT shard, data FROM aggregates WHERE name = ?", (name,)).fetchall())
+
+    async def read_aggregates(self, name: str) -> Dict[int, bytes]:
+        return await self._run(self._read_aggregates, name)
+
+    # Writes
+
+    def _publish_aggregate(self, name: str, shard: int, payload: bytes):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO aggregates (name, shard, data) VALUES (?, ?, ?)", (name, shard, payload)
+            )
+
+    async def publish_aggregate(self, name: str, shard: int, payload: bytes):
+        await self._run(self._publish_aggregate, name, shard, payload)
+
+    async def save_deck(self, user_id: int, data: bytes, remind_at: int):
+        self._deck_writes[user_id] = (data, remind_at)
+
+    def _mark_dirty(self, user_id: int, *tables: str):
+        for table in tables:
+            self._dirty[table].add(user_id)
+
+    async def create_user(self, user_id: int, username: str, first_name: str) -> User:
+        user = await super().create_user(user_id, username, first_name)
+        self._mark_dirty(user_id, *TABLES)
+        self._touch(user_id)
+        return user
+
+    async def update_user_stats(self, user_id: int, updates: Dict):
+        if await self._ensure_loaded(user_id):
+            await super().update_user_stats(user_id, updates)
+            self._mark_dirty(user_id, "user_stats")
+
+    async def update_user_progress(self, user_id: int, subject: str, updates: Dict):
+        if await self._ensure_loaded(user_id):
+            await super().update_user_progress(user_id, subject, updates)
+            self._mark_dirty(user_id, "user_progress")
+
+    async def write_user_states(self, states: List):
+        # Bulk jobs may touch users that are not in the hot cache, so write
+        # straight to SQLite in one transaction instead of loading them
+        await self.flush()
+        batch = {
+            "user_stats": [(stats.user_id, json.dumps(stats.to_dict())) for stats, _ in states],
+            "user_progress": [(progress.user_id, json.dumps(progress.to_dict())) for _, progress in states],
+        }
+        await self._run(self._write_batch, batch)
+
+    async def update_stats_columns(self, update, chunk_size: int = 50000) -> int:
+        # Users outside the hot cache first, one scratch table per page,
+        # writing back only changed rows. The hot table goes last, without
+        # an await between update() and marking rows dirty: a user loaded
+        # while the cold pages run is then covered exactly once, as long as
+        # no user is evicted meanwhile.
+        await self.flush()
+        self._evict_paused += 1
+        try:
+            return await self._update_stats_columns(update, chunk_size)
+        finally:
+            self._evict_paused -= 1
+
+    async def _update_stats_columns(self, update, chunk_size: int) -> int:
+        total = 0
+        after = -1
+        while True:
+            rows = await self._run(self._read_stats_page, after, chunk_size)
+            if not rows:
+                break
+            after = rows[-1][0]
+            scratch = StatsTable()
+            cold = [
+                UserStats.from_dict(json.loads(data), scratch)
+                for user_id, data in rows
+                if user_id not in self.user_stats
+            ]
+            changed = update(scratch) if cold else ()
+            if len(changed):
+                await self._run(self._write_batch, {
+                    "user_stats": [(cold[i].user_id, json.dumps(cold[i].to_dict())) for i in changed]
+                })
+                total += len(changed)
+
+        changed = update(self.stats_table)
+        user_ids = self.stats_table.user_ids
+        for row in changed:
+            self._mark_dirty(user_ids[row], "user_stats")
+        return total + len(changed)
+
+    def _write_batch(self, batch: Dict[str, List[Tuple]]):
+        with self._conn:
+            for table, rows in batch.items():
+                if table == "srs_decks":
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO srs_decks (user_id, data, remind_at) VALUES (?, ?, ?)", rows
+                    )
+                    continue
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} (user_id, data) VALUES (?, ?)", rows
+                )
+
+    def _snapshot(self, table: str, user_ids: Iterable[int]) -> List[Tuple[int, str]]:
+        source = {"users": self.users, "user_stats": self.user_stats, "user_progress": self.user_progress}[table]
+        return [
+            (user_id, json.dumps(source[user_id].to_dict()))
+            for user_id in user_ids
+            if user_id in source
+        ]
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if self._conn is None or not (any(self._dirty.values()) or self._deck_writes):
+                return 0
+            # Serialize on the loop so the snapshot is consistent, then hand
+            # the whole batch to the writer thread as one transaction
+            batch = {}
+            for table in TABLES:
+                dirty, self._dirty[table] = self._dirty[table], set()
+                batch[table] = self._snapshot(table, dirty)
+            decks, self._deck_writes = self._deck_writes, {}
+            batch["srs_decks"] = [(user_id, data, remind_at) for user_id, (data, remind_at) in decks.items()]
+            try:
+                await self._run(self._write_batch, batch)
+            except Exception:
+                for table in TABLES:
+                    self._dirty[table].update(user_id for user_id, _ in batch[table])
+                # Keep decks saved again meanwhile
+                for user_id, pending in decks.items():
+                    self._deck_writes.setdefault(user_id, pending)
+                raise
+            rows = sum(len(rows) for rows in batch.values())
+            self.flushed_rows += rows
+            self.flush_count += 1
+            return rows
+
+
+class RedisDatabase(SQLiteDatabase):
+    # Same write-behind cache over a Redis-compatible server, so several
+    # shard workers (or hosts) can share state. Rows are JSON in one hash
+    # per table, keyed by user id; the "user_ids" sorted set (score = id)
+    # gives keyset pagination and the user count. Only the blocking row
+    # operations differ from SQLite; they run on the same single thread.
+    def __init__(self, url: str, flush_interval: Optional[float] = None):
+        super().__init__(url, flush_interval)
+        self.host, self.port, self.db_index = parse_redis_url(url)
+
+    def _connect(self):
+        conn = RespConnection(self.host, self.port, self.db_index)
+        conn.connect()
+        conn.execute("PING")
+        self._conn = conn
+
+    def _load_rows(self, user_id: int) -> Dict[str, Optional[str]]:
+        replies = self._conn.pipeline([("HGET", table, user_id) for table in TABLES])
+        return {table: reply.decode() if reply is not None else None for table, reply in zip(TABLES, replies)}
+
+    def _count_users(self) -> int:
+        return self._conn.execute("ZCARD", "user_ids")
+
+    def _owned_ids(self, after: int, limit: int) -> List[bytes]:
+        # Next ids after `after` in this shard. The sorted set holds every
+        # shard, so keep paging until a page has some of ours.
+        while True:
+            ids = self._conn.execute("ZRANGEBYSCORE", "user_ids", f"({after}", "+inf", "LIMIT", 0, limit)
+            if not ids:
+                return []
+            owned = [user_id for user_id in ids if self.owns(int(user_id))]
+            if owned:
+                return owned
+            after = int(ids[-1])
+
+    def _read_page(self, after: int, limit: int) -> List[Tuple[int, str, Optional[str]]]:
+        ids = self._owned_ids(after, limit)
+        if not ids:
+            return []
+        stats, progress = self._conn.pipeline([("HMGET", "user_stats", *ids), ("HMGET", "user_progress", *ids)])
+        return [
+            (int(user_id), stats_data.decode(), progress_data.decode() if progress_data is not None else None)
+            for user_id, stats_data, progress_data in zip(ids, stats, progress)
+            if stats_data is not None
+        ]
+
+    def _read_stats_page(self, after: int, limit: int) -> List[Tuple[int, str]]:
+        ids = self._owned_ids(after, limit)
+        if not ids:
+            return []
+        stats = self._conn.execute("HMGET", "user_stats", *ids)
+        return [(int(user_id), data.decode()) for user_id, data in zip(ids, stats) if data is not None]
+
+    def _load_deck(self, user_id: int) -> Optional[bytes]:
+        return self._conn.execute("HGET", "srs_decks", user_id)
+
+    def _claim_deck_reminders(self, now: int, rearm_at: int, limit: int) -> List[int]:
+        # "srs_due" (score = reminder minute) holds every shard's users, so
+        # page until `limit` of ours are found
+        user_ids, offset = [], 0
+        while len(user_ids) < limit:
+            page = self._conn.execute("ZRANGEBYSCORE", "srs_due", "-inf", now, "LIMIT", offset, limit)
+            if not page:
+                break
+            offset += len(page)
+            user_ids.extend(int(user_id) for user_id in page if self.owns(int(user_id)))
+        user_ids = user_ids[:limit]
+        if user_ids:
+            self._conn.execute("ZADD", "srs_due", *(item for user_id in user_ids for item in (rearm_at, user_id)))
+        return user_ids
+
+    def _read_aggregates(self, name: str) -> Dict[int, bytes]:
+        reply = self._conn.execute("HGETALL", f"aggregate:{name}")
+        return {int(shard): payload for shard, payload in zip(reply[::2], reply[1::2])}
+
+    def _publish_aggregate(self, name: str, shard: int, payload: bytes):
+        self._conn.execute("HSET", f"aggregate:{name}", shard, payload)
+
+    def _write_batch(self, batch: Dict[str, List[Tuple]]):
+        # One pipelined round trip; the server applies each HSET atomically
+        commands = []
+        for table, rows in batch.items():
+            if not rows:
+                continue
+            if table == "srs_decks":
+                commands.append(("HSET", "srs_decks", *(item for user_id, data, _ in rows for item in (user_id, data))))
+                commands.append(("ZADD", "srs_due", *(item for user_id, _, remind_at in rows for item in (remind_at, user_id))))
+                continue
+            commands.append(("HSET", table, *(item for row in rows for item in row)))
+            if table == "users":
+                commands.append(("ZADD", "user_ids", *(item for user_id, _ in rows for item in (user_id, user_id))))
+        self._conn.pipeline(commands)
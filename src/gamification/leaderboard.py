@@ -0,0 +1,354 @@
+import json
+import struct
+import zlib
+from bisect import bisect_left, insort
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+SUBJECTS = ("english", "math", "programming")
+
+
+class RankedList:
+    # Sorted container split into buckets of roughly LOAD keys. Bisect over
+    # the bucket maxima finds a bucket, and a Fenwick tree over bucket sizes
+    # turns (bucket, offset) into a global rank. Insert, delete and rank are
+    # O(log n) plus a memmove inside one small bucket.
+    LOAD = 512
+
+    def __init__(self):
+        self._lists: List[list] = []
+        self._maxes: list = []
+        self._tree: List[int] = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _rebuild_tree(self):
+        # 1-based Fenwick layout stored in a 0-based list (node j at tree[j - 1])
+        tree = [len(bucket) for bucket in self._lists]
+        for j in range(1, len(tree) + 1):
+            parent = j + (j & -j)
+            if parent <= len(tree):
+                tree[parent - 1] += tree[j - 1]
+        self._tree = tree
+
+    def _tree_add(self, pos: int, delta: int):
+        tree = self._tree
+        j = pos + 1
+        while j <= len(tree):
+            tree[j - 1] += delta
+            j += j & -j
+
+    def _prefix(self, pos: int) -> int:
+        # Number of keys in buckets [0, pos)
+        total = 0
+        tree = self._tree
+        while pos > 0:
+            total += tree[pos - 1]
+            pos &= pos - 1
+        return total
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        # Fenwick descent: bucket holding the index-th key, and the offset in it
+        pos = 0
+        tree = self._tree
+        step = 1 << (len(tree).bit_length())
+        while step:
+            nxt = pos + step
+            if nxt <= len(tree) and tree[nxt - 1] <= index:
+                index -= tree[nxt - 1]
+                pos = nxt
+            step >>= 1
+        return pos, index
+
+    def rebuild(self, keys: Iterable):
+        # Bulk load: one sort instead of n inserts
+        values = sorted(keys)
+        self._lists = [values[i:i + self.LOAD] for i in range(0, len(values), self.LOAD)]
+        self._maxes = [bucket[-1] for bucket in self._lists]
+        self._len = len(values)
+        self._rebuild_tree()
+
+    def add(self, key):
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            self._rebuild_tree()
+            self._len = 1
+            return
+
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            pos -= 1
+        bucket = self._lists[pos]
+        insort(bucket, key)
+        self._maxes[pos] = bucket[-1]
+        self._len += 1
+
+        if len(bucket) > 2 * self.LOAD:
+            self._lists[pos:pos + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._maxes[pos:pos + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(pos, 1)
+
+    def remove(self, key):
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            raise ValueError(f"{key!r} not in list")
+        bucket = self._lists[pos]
+        idx = bisect_left(bucket, key)
+        if idx == len(bucket) or bucket[idx] != key:
+            raise ValueError(f"{key!r} not in list")
+        del bucket[idx]
+        self._len -= 1
+
+        if not bucket:
+            del self._lists[pos]
+            del self._maxes[pos]
+            self._rebuild_tree()
+        else:
+            self._maxes[pos] = bucket[-1]
+            self._tree_add(pos, -1)
+
+    def index(self, key) -> int:
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            return self._len
+        return self._prefix(pos) + bisect_left(self._lists[pos], key)
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("index out of range")
+        pos, offset = self._locate(index)
+        return self._lists[pos][offset]
+
+    def islice(self, start: int, stop: int) -> Iterable:
+        start = max(start, 0)
+        stop = min(stop, self._len)
+        if start >= stop:
+            return
+        pos, offset = self._locate(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = self._lists[pos][offset:offset + remaining]
+            yield from chunk
+            remaining -= len(chunk)
+            pos += 1
+            offset = 0
+
+
+class Leaderboard:
+    # Scores ranked high to low; ties are broken by user_id so ranks are stable
+    def __init__(self):
+        self.scores: Dict[int, int] = {}
+        self._ranked = RankedList()
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def set_score(self, user_id: int, score: int):
+        old = self.scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._ranked.remove((-old, user_id))
+        self.scores[user_id] = score
+        self._ranked.add((-score, user_id))
+
+    def set_scores(self, items: Iterable[Tuple[int, int]]):
+        self.scores.update(items)
+        self._ranked.rebuild((-score, user_id) for user_id, score in self.scores.items())
+
+    def add_score(self, user_id: int, delta: int) -> int:
+        score = self.scores.get(user_id, 0) + delta
+        self.set_score(user_id, score)
+        return score
+
+    def remove(self, user_id: int):
+        score = self.scores.pop(user_id, None)
+        if score is not None:
+            self._ranked.remove((-score, user_id))
+
+    def rank(self, user_id: int) -> Optional[int]:
+        # 1-based rank, None if the user has no score on this board
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self._ranked.index((-score, user_id)) + 1
+
+    def top(self, n: int = 10) -> List[Tuple[int, int, int]]:
+        return self.range(0, n)
+
+    def around(self, user_id: int, radius: int = 2) -> List[Tuple[int, int, int]]:
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        return self.range(rank - 1 - radius, rank + radius)
+
+    def range(self, start: int, stop: int) -> List[Tuple[int, int, int]]:
+        # (rank, user_id, score) for 0-based positions [start, stop)
+        start = max(start, 0)
+        return [
+            (start + i + 1, user_id, -neg_score)
+            for i, (neg_score, user_id) in enumerate(self._ranked.islice(start, stop))
+        ]
+
+    def count_above(self, score: int) -> int:
+        # Users with a strictly higher score
+        return self._ranked.index((-score, -1))
+
+
+def current_week(today: Optional[date] = None) -> Tuple[int, int]:
+    year, week, _ = (today or date.today()).isocalendar()
+    return year, week
+
+
+class ShardSnapshot:
+    # What one shard worker publishes for one board: its top entries with
+    # display names, and every score it holds as an ascending array so
+    # other shards can count the users above a score with a binary search
+    __slots__ = ("top", "scores", "week")
+
+    def __init__(self, top: List[Tuple[int, int, str]], scores: "np.ndarray", week: Optional[Tuple[int, int]]):
+        self.top = top  # (user_id, score, name), best first
+        self.scores = scores
+        self.week = week
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def count_above(self, score: int) -> int:
+        return len(self.scores) - int(np.searchsorted(self.scores, score, side="right"))
+
+
+_HEADER = struct.Struct("<I")
+
+
+def encode_snapshot(board: "Leaderboard", top: List[Tuple[int, int, str]],
+                    week: Optional[Tuple[int, int]] = None) -> bytes:
+    # JSON header, then the sorted scores as zlib-compressed int64 deltas
+    # (mostly small numbers, so they compress well)
+    scores = np.sort(np.fromiter(board.scores.values(), dtype=np.int64, count=len(board.scores)))
+    header = json.dumps({"top": top, "week": week}).encode()
+    deltas = np.diff(scores, prepend=np.int64(0))
+    return _HEADER.pack(len(header)) + header + zlib.compress(deltas.tobytes(), 1)
+
+
+def decode_snapshot(payload: bytes) -> ShardSnapshot:
+    (length,) = _HEADER.unpack_from(payload)
+    header = json.loads(payload[_HEADER.size:_HEADER.size + length])
+    deltas = np.frombuffer(zlib.decompress(payload[_HEADER.size + length:]), dtype=np.int64)
+    week = tuple(header["week"]) if header["week"] else None
+    return ShardSnapshot([tuple(entry) for entry in header["top"]], np.cumsum(deltas), week)
+
+
+class MergedLeaderboard:
+    # Read-only view of one board across shards: this worker's live board
+    # plus the latest snapshots of the others. Ranks count users above the
+    # score on every shard, so they are as fresh as the last merge for
+    # other shards' users; ties across shards are not broken by user_id.
+    # top() is exact for n up to the published top size.
+    def __init__(self, local: Leaderboard, remote: List[ShardSnapshot]):
+        self.local = local
+        self.remote = remote
+        self.names: Dict[int, str] = {user_id: name for snapshot in remote for user_id, _, name in snapshot.top}
+
+    def __len__(self) -> int:
+        return len(self.local) + sum(len(snapshot) for snapshot in self.remote)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        rank = self.local.rank(user_id)
+        if rank is None or not self.remote:
+            return rank
+        score = self.local.scores[user_id]
+        return rank + sum(snapshot.count_above(score) for snapshot in self.remote)
+
+    def top(self, n: int = 10) -> List[Tuple[int, int, int]]:
+        if not self.remote:
+            return self.local.top(n)
+        entries = [(user_id, score) for _, user_id, score in self.local.top(n)]
+        for snapshot in self.remote:
+            entries.extend((user_id, score) for user_id, score, _ in snapshot.top[:n])
+        entries.sort(key=lambda entry: (-entry[1], entry[0]))
+        return [(rank, user_id, score) for rank, (user_id, score) in enumerate(entries[:n], 1)]
+
+    def around(self, user_id: int, radius: int = 2) -> List[Tuple[int, int, int]]:
+        # Neighbours on other shards are not known by id, so a merged view
+        # only shows the user's own row
+        if not self.remote:
+            return self.local.around(user_id, radius)
+        rank = self.rank(user_id)
+        return [] if rank is None else [(rank, user_id, self.local.scores[user_id])]
+
+
+class LeaderboardIndex:
+    # Boards: "global" (total XP), one per subject, and a weekly twin of
+    # each that starts empty every ISO week. Resetting a weekly board just
+    # swaps in a fresh Leaderboard, so it costs O(1) whatever its size.
+    def __init__(self, boards: Optional[Dict] = None):
+        self.boards = {} if boards is None else boards
+        self._weeks: Dict[str, Tuple[int, int]] = {}
+        # Other shards' snapshots per board key, set by the periodic merge
+        self.remote: Dict[str, List[ShardSnapshot]] = {}
+        for name in ("global",) + SUBJECTS:
+            self.boards.setdefault(name, Leaderboard())
+
+    def board(self, name: str = "global", weekly: bool = False) -> Leaderboard:
+        if not weekly:
+            return self.boards[name]
+        key = f"weekly:{name}"
+        week = current_week()
+        if self._weeks.get(key) != week or key not in self.boards:
+            self.boards[key] = Leaderboard()
+            self._weeks[key] = week
+        return self.boards[key]
+
+    def view(self, name: str = "global", weekly: bool = False) -> MergedLeaderboard:
+        board = self.board(name, weekly)
+        key = f"weekly:{name}" if weekly else name
+        week = self._weeks.get(key)
+        # A weekly snapshot from last week must not count towards this one
+        remote = [snapshot for snapshot in self.remote.get(key, ()) if snapshot.week == week]
+        return MergedLeaderboard(board, remote)
+
+    def keys(self) -> List[Tuple[str, bool]]:
+        # (name, weekly) for every board
+        return [(name, weekly) for weekly in (False, True) for name in ("global",) + SUBJECTS]
+
+    def snapshot(self, name: str, weekly: bool, top: List[Tuple[int, int, str]]) -> bytes:
+        board = self.board(name, weekly)
+        return encode_snapshot(board, top, self._weeks.get(f"weekly:{name}") if weekly else None)
+
+    def record_xp(self, user_id: int, total_xp: int, gained: int,
+                  subject: Optional[str] = None, subject_xp: Optional[int] = None):
+        self.boards["global"].set_score(user_id, total_xp)
+        self.board("global", weekly=True).add_score(user_id, gained)
+        if subject in SUBJECTS:
+            self.record_subject_xp(user_id, subject, gained, subject_xp)
+
+    def record_subject_xp(self, user_id: int, subject: str, gained: int, subject_xp: Optional[int] = None):
+        if subject_xp is not None:
+            self.boards[subject].set_score(user_id, subject_xp)
+        else:
+            self.boards[subject].add_score(user_id, gained)
+        self.board(subject, weekly=True).add_score(user_id, gained)
+
+    def load(self, stats: Iterable, progress: Iterable):
+        # Rebuild the all-time boards from stored totals (weekly ones start empty)
+        self.boards["global"].set_scores(
+            (user_stats.user_id, user_stats.total_xp) for user_stats in stats
+        )
+        progress = list(progress)
+        for subject in SUBJECTS:
+            self.boards[subject].set_scores(
+                (user_progress.user_id, user_progress.subjects[subject]["xp"])
+                for user_progress in progress
+            )
@@ -0,0 +1,46 @@
+from math import isqrt
+from typing import Tuple
+
+from src.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+class LevelCurve:
+    # Quadratic curve with no level cap: reaching level L takes
+    # step * (L - 1) * L / 2 XP in total, i.e. each level costs `step` more
+    # than the one before. step=100 gives the original table
+    # 0, 100, 300, 600, 1000, ... and keeps going past level 10.
+    def __init__(self, step: int = 100):
+        self.step = step
+
+    def xp_for_level(self, level: int) -> int:
+        level = max(level, 1)
+        return self.step * (level - 1) * level // 2
+
+    def level_for_xp(self, xp: int) -> int:
+        # Largest L with L * (L - 1) <= 2 * xp / step, solved exactly with isqrt
+        if xp <= 0:
+            return 1
+        k = (2 * int(xp)) // self.step
+        return (1 + isqrt(1 + 4 * k)) // 2
+
+    def progress(self, xp: int) -> Tuple[int, int, int]:
+        # (level, xp earned inside the level, xp the level takes in total)
+        level = self.level_for_xp(xp)
+        floor = self.xp_for_level(level)
+        return level, xp - floor, self.xp_for_level(level + 1) - floor
+
+    def levels_for_xp(self, xp: "np.ndarray") -> "np.ndarray":
+        # Vectorised level_for_xp over an array of XP totals
+        xp = np.maximum(np.asarray(xp, dtype=np.int64), 0)
+        n = 1 + 4 * ((2 * xp) // self.step)
+        root = np.sqrt(n.astype(np.float64)).astype(np.int64)
+        # Float sqrt can be off by one for very large totals; fix it exactly
+        root -= (root * root > n)
+        root += ((root + 1) * (root + 1) <= n)
+        return (1 + root) // 2
+
+    def xp_for_levels(self, levels: "np.ndarray") -> "np.ndarray":
+        levels = np.maximum(np.asarray(levels, dtype=np.int64), 1)
+        return self.step * (levels - 1) * levels // 2
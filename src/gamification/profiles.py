@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config import Config
+
+
+class ProfileAggregates:
+    # Running totals behind /profile, seeded once from a UserProgress and
+    # then moved by the deltas of each progress write instead of walking
+    # every subject's completion list per view
+    __slots__ = ("mastery_sum", "subjects", "completed")
+
+    def __init__(self, mastery_sum: float, subjects: int, completed: Dict[str, int]):
+        self.mastery_sum = mastery_sum
+        self.subjects = subjects
+        self.completed = completed
+
+    @classmethod
+    def from_progress(cls, progress) -> "ProfileAggregates":
+        return cls(
+            sum(subject.mastery_percentage for subject in progress.subjects.values()),
+            len(progress.subjects),
+            {name: len(subject.completed) for name, subject in progress.subjects.items()},
+        )
+
+    @property
+    def mastery(self) -> float:
+        return self.mastery_sum / self.subjects if self.subjects else 0
+
+    @property
+    def completed_units(self) -> int:
+        return sum(self.completed.values())
+
+
+class ProfileEntry:
+    __slots__ = ("version", "epoch", "texts", "aggregates")
+
+    def __init__(self, epoch: int):
+        self.version = 0
+        self.epoch = epoch
+        self.texts: Dict[str, str] = {}
+        self.aggregates: Optional[ProfileAggregates] = None
+
+
+class ProfileCache:
+    # Rendered /profile and /stats texts and profile aggregates by user, in
+    # least recently viewed order. Every XP or progress write for a user
+    # bumps that user's version and drops the texts; bulk jobs (streak
+    # rollover, level migration) bump the epoch, which invalidates every
+    # text at once. A render takes a version() token before reading and
+    # store() refuses the text if a write came in meanwhile, so a view
+    # never caches state older than the last write. Aggregates are kept
+    # across text invalidations and moved by progress_changed().
+    def __init__(self, max_users: Optional[int] = None):
+        self.max_users = max_users or Config.PROFILE_CACHE_MAX_USERS
+        self._entries: "OrderedDict[int, ProfileEntry]" = OrderedDict()
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int, view: str) -> Optional[str]:
+        entry = self._entries.get(user_id)
+        text = entry.texts.get(view) if entry is not None and entry.epoch == self.epoch else None
+        if text is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        return text
+
+    def _entry(self, user_id: int) -> ProfileEntry:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = ProfileEntry(self.epoch)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(user_id)
+        return entry
+
+    def version(self, user_id: int) -> Tuple[int, int]:
+        entry = self._entry(user_id)
+        return self.epoch, entry.version
+
+    def store(self, user_id: int, version: Tuple[int, int], view: str, text: str) -> bool:
+        entry = self._entries.get(user_id)
+        if entry is None or (self.epoch, entry.version) != version:
+            self.stale += 1
+            return False
+        if entry.epoch != self.epoch:
+            entry.texts.clear()
+            entry.epoch = self.epoch
+        entry.texts[view] = text
+        return True
+
+    def aggregates(self, user_id: int, progress) -> ProfileAggregates:
+        # Seeded from the progress object as it is now; progress writes
+        # update it right after the write, with no await in between
+        entry = self._entry(user_id)
+        if entry.aggregates is None:
+            entry.aggregates = ProfileAggregates.from_progress(progress)
+        return entry.aggregates
+
+    def invalidate(self, user_id: int):
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry.version += 1
+            entry.texts.clear()
+
+    def progress_changed(self, user_id: int, subject: str, mastery_delta: float = 0, completed: Optional[int] = None):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        self.invalidate(user_id)
+        aggregates = entry.aggregates
+        if aggregates is not None:
+            aggregates.mastery_sum += mastery_delta
+            if completed is not None:
+                aggregates.completed[subject] = completed
+
+    def invalidate_all(self):
+        self.epoch += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,84 @@
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Tuple
+
+from src.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# (minimum streak, bonus XP), highest threshold first
+STREAK_BONUSES = ((100, 50), (30, 25), (7, 10))
+# Days of activity remembered per user, one bit per streak day
+ACTIVITY_DAYS = 32
+ACTIVITY_MASK = (1 << ACTIVITY_DAYS) - 1
+
+
+def streak_bonus(streak: int) -> int:
+    for threshold, bonus in STREAK_BONUSES:
+        if streak >= threshold:
+            return bonus
+    return 0
+
+
+def day_start(day: date, hour: int = 0) -> float:
+    # POSIX timestamp of hour:00 local time, comparable with last_active
+    return datetime.combine(day, time(hour=hour)).timestamp()
+
+
+def streak_day(at: float, hour: int = 0) -> date:
+    # The streak day a timestamp belongs to: streak days run from hour:00
+    # local time to hour:00 the next day
+    return (datetime.fromtimestamp(at) - timedelta(hours=hour)).date()
+
+
+def mark_active(active_day: int, active_days: int, day: int) -> Tuple[int, int]:
+    # Record activity on `day` (a date ordinal). Bit i of active_days is
+    # set when the user was active on active_day - i, so a rollover that
+    # runs late still sees days the user was active before last_active.
+    if day > active_day:
+        shift = day - active_day
+        active_days = (active_days << shift) & ACTIVITY_MASK if shift < ACTIVITY_DAYS else 0
+        return day, active_days | 1
+    if active_day - day < ACTIVITY_DAYS:
+        active_days |= 1 << (active_day - day)
+    return active_day, active_days
+
+
+def seconds_until(hour: int, now: Optional[datetime] = None) -> float:
+    # Time left until the next local hour:00
+    now = now or datetime.now()
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def rollover_streaks(last_active: "np.ndarray", active_day: "np.ndarray", active_days: "np.ndarray",
+                     current: "np.ndarray", longest: "np.ndarray", freezes: "np.ndarray",
+                     day: int, since: float, until: float, earn_every: int,
+                     max_freezes: int) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+    # Close one day for every user at once. day is the ordinal of the
+    # streak day being closed and [since, until) its time window; a user
+    # counts as active if that day's bit is set in active_days, or (rows
+    # written before the bitmask existed) last_active falls in the window.
+    #   active:              streak + 1, a freeze every earn_every days
+    #   inactive, freeze:    streak kept, one freeze used
+    #   inactive, no freeze: streak reset to 0
+    # Returns the new (current, longest, freezes) and a mask of changed rows.
+    offset = active_day - day
+    remembered = (offset >= 0) & (offset < ACTIVITY_DAYS)
+    remembered &= ((active_days >> np.clip(offset, 0, ACTIVITY_DAYS - 1)) & 1) == 1
+    active = remembered | ((last_active >= since) & (last_active < until))
+    lapsed = ~active & (current > 0)
+    frozen = lapsed & (freezes > 0)
+
+    new_current = np.where(active, current + 1, np.where(lapsed & ~frozen, 0, current))
+    new_longest = np.maximum(longest, new_current)
+    new_freezes = freezes - frozen
+    if earn_every > 0:
+        earned = active & (new_current % earn_every == 0)
+        new_freezes = np.where(earned, np.minimum(new_freezes + 1, max_freezes), new_freezes)
+        # Never take away freezes granted above the cap some other way
+        new_freezes = np.maximum(new_freezes, np.where(earned, freezes, 0))
+
+    changed = (new_current != current) | (new_longest != longest) | (new_freezes != freezes)
+    return new_current, new_longest, new_freezes, changed
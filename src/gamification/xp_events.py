@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class XPEvent:
+    __slots__ = ("user_id", "xp", "subject", "at")
+
+    def __init__(self, user_id: int, xp: int, subject: Optional[str], at: float):
+        self.user_id = user_id
+        self.xp = xp
+        self.subject = subject
+        self.at = at  # POSIX timestamp of the activity
+
+
+class XPEventQueue:
+    # Handlers append events and return immediately. A background task
+    # hands everything pending to apply() every flush_interval seconds, or
+    # as soon as batch_size events are waiting, so a burst of activity for
+    # one user becomes one stats/progress write instead of one per event.
+    def __init__(self, apply: Callable[[List[XPEvent]], Awaitable[None]],
+                 batch_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.apply = apply
+        self.batch_size = batch_size or Config.XP_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.XP_FLUSH_INTERVAL
+        self._pending: List[XPEvent] = []
+        self._wakeup: Optional[asyncio.Future] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.applied = 0
+        self.batches = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def put(self, event: XPEvent):
+        self._pending.append(event)
+        if len(self._pending) >= self.batch_size:
+            self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    async def _run(self):
+        # A plain future resolved by either a timer or a full batch
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup = loop.create_future()
+            timer = loop.call_later(self.flush_interval, self._wake)
+            try:
+                await self._wakeup
+            finally:
+                timer.cancel()
+            await self.flush()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                await self.apply(batch)
+            except Exception:
+                # Not re-queued: a batch that fails once would fail forever
+                logger.exception("Applying %d XP events failed", len(batch))
+                self.failed += len(batch)
+                return 0
+            self.applied += len(batch)
+            self.batches += 1
+            return len(batch)
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self._pending),
+            "applied": self.applied,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
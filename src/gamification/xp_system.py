@@ -1,10 +1,59 @@
-import math
-from datetime import datetime, timedelta
-from typing import Dict, List
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from config import Config
+from src.database.models import SUBJECT_FIELDS, Database
+from src.gamification.leaderboard import LeaderboardIndex, SUBJECTS, decode_snapshot
+from src.gamification.levels import LevelCurve
+from src.gamification.profiles import ProfileCache
+from src.gamification.streaks import (
+    ACTIVITY_DAYS, day_start, mark_active, rollover_streaks, seconds_until, streak_bonus, streak_day
+)
+from src.gamification.xp_events import XPEvent, XPEventQueue
+from src.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+# Subject credited for each activity type (None: global XP only)
+ACTIVITY_SUBJECTS = {
+    "perfect_lesson": "english",
+    "speaking_practice": "english",
+    "photo_solve": "math",
+    "math_exercise": "math",
+    "coding_challenge": "programming"
+}
+
+# Field holding each subject's completed item ids
+COMPLETED_FIELDS = {
+    subject: next(key for key, slot in fields.items() if slot == "completed")
+    for subject, fields in SUBJECT_FIELDS.items()
+}
+# Weight of the latest result in the running mastery percentage
+MASTERY_WEIGHT = 0.1
+
+# Aggregate holding each shard's last closed streak day (ISO date)
+ROLLOVER_MARKER = "streak_rollover"
+
+# on_level_up(user_id, {"leveled_up": True, "old_level", "new_level", "subject"})
+LevelUpCallback = Callable[[int, Dict], Awaitable[None]]
 
 class XPSystem:
-    def __init__(self):
-        self.xp_requirements = [0, 100, 300, 600, 1000, 1500, 2100, 2800, 3600, 4500]
+    def __init__(self, db: Optional[Database] = None, leaderboards: Optional[LeaderboardIndex] = None,
+                 level_curve: Optional[LevelCurve] = None, on_level_up: Optional[LevelUpCallback] = None,
+                 profiles: Optional[ProfileCache] = None):
+        self.db = db or Database()
+        self.leaderboards = leaderboards or LeaderboardIndex(self.db.leaderboards)
+        self.level_curve = level_curve or LevelCurve()
+        self.on_level_up = on_level_up
+        # Rendered /profile and /stats; every write below invalidates them
+        self.profiles = profiles or ProfileCache()
+        self.events = XPEventQueue(self.apply_events)
+        self._notifications: Set[asyncio.Task] = set()
+        self.level_ups = 0
         self.exercise_xp = {
             "easy": 10,
             "medium": 25,
@@ -16,29 +65,188 @@ class XPSystem:
             "coding_challenge": 30
         }
     
-    async def add_xp(self, user_id: int, xp: int, activity_type: str):
-        # Add XP to user's total and subject-specific XP
-        streak_bonus = await self.calculate_streak_bonus(user_id)
-        total_xp = xp + streak_bonus
-        
-        # Update user stats
-        # Update subject progress
-        # Check for level up
+    async def start(self):
+        self.events.start()
+    
+    async def close(self):
+        # Runs at shutdown, when the bot can no longer send: pending
+        # notifications are cancelled and the final batch is applied silently
+        self.on_level_up = None
+        for task in list(self._notifications):
+            task.cancel()
+        await self.events.close()
+    
+    async def add_xp(self, user_id: int, xp: int, activity_type: str) -> int:
+        # Returns the XP awarded (including the streak bonus) right away;
+        # the stats, progress and leaderboard writes happen in the next
+        # batch. Without a running queue the event is applied inline.
+        stats = await self.get_user_stats(user_id)
+        if stats is None:
+            return 0
         
+        total_xp = xp + streak_bonus(stats.current_streak)
+        event = XPEvent(user_id, total_xp, ACTIVITY_SUBJECTS.get(activity_type), time.time())
+        if self.events.running:
+            self.events.put(event)
+        else:
+            await self.apply_events([event])
         return total_xp
     
+    async def apply_events(self, events: List[XPEvent]):
+        # Fold the batch per user first: one stats write per user and one
+        # progress write per (user, subject), however many events came in
+        folded: Dict[int, List] = {}
+        for event in events:
+            entry = folded.get(event.user_id)
+            if entry is None:
+                entry = folded[event.user_id] = [0, event.at, {}, event.at]
+            entry[0] += event.xp
+            entry[1] = max(entry[1], event.at)
+            entry[3] = min(entry[3], event.at)
+            if event.subject:
+                entry[2][event.subject] = entry[2].get(event.subject, 0) + event.xp
+        
+        hour = Config.STREAK_ROLLOVER_HOUR
+        for user_id, (gained, last_at, subjects, first_at) in folded.items():
+            stats = await self.get_user_stats(user_id)
+            if stats is None:
+                continue
+            old_level = stats.global_level
+            new_total = stats.total_xp + gained
+            new_level = self.calculate_level(new_total)
+            active_day, active_days = stats.active_day, stats.active_days
+            for at in {first_at, last_at}:
+                active_day, active_days = mark_active(active_day, active_days, streak_day(at, hour).toordinal())
+            await self.db.update_user_stats(user_id, {
+                "total_xp": new_total,
+                "global_level": new_level,
+                "last_active": datetime.fromtimestamp(last_at),
+                "active_day": active_day,
+                "active_days": active_days
+            })
+            self.profiles.invalidate(user_id)
+            self.leaderboards.record_xp(user_id, new_total, gained)
+            if new_level > old_level:
+                self._notify(user_id, old_level, new_level, None)
+            
+            if not subjects:
+                continue
+            progress = await self.get_user_progress(user_id)
+            for subject, subject_gained in subjects.items():
+                old_level = progress.subjects[subject]["level"]
+                subject_xp = progress.subjects[subject]["xp"] + subject_gained
+                new_level = self.calculate_level(subject_xp)
+                await self.db.update_user_progress(user_id, subject, {
+                    "xp": subject_xp,
+                    "level": new_level
+                })
+                self.profiles.invalidate(user_id)
+                self.leaderboards.record_subject_xp(user_id, subject, subject_gained, subject_xp)
+                if new_level > old_level:
+                    self._notify(user_id, old_level, new_level, subject)
+    
+    async def record_progress(self, user_id: int, subject: str, updates: Dict):
+        # Progress writes other than XP (mastery, completions, vocabulary)
+        # go through here so the profile aggregates follow them
+        progress = await self.get_user_progress(user_id)
+        if progress is None:
+            return
+        subject_progress = progress.subjects[subject]
+        old_mastery = subject_progress.mastery_percentage
+        await self.db.update_user_progress(user_id, subject, updates)
+        self.profiles.progress_changed(
+            user_id, subject, subject_progress.mastery_percentage - old_mastery, len(subject_progress.completed)
+        )
+    
+    async def record_exercise(self, user_id: int, subject: str, score: float, item_id: Optional[int] = None):
+        # An answered exercise or lesson: mastery moves towards the score
+        # (0-100) and a passed item joins the subject's completed ids
+        progress = await self.get_user_progress(user_id)
+        if progress is None:
+            return
+        subject_progress = progress.subjects[subject]
+        mastery = subject_progress.mastery_percentage
+        updates = {"mastery_percentage": round(mastery + (score - mastery) * MASTERY_WEIGHT, 1)}
+        if item_id is not None and item_id not in subject_progress.completed:
+            updates[COMPLETED_FIELDS[subject]] = [*subject_progress.completed, item_id]
+        await self.record_progress(user_id, subject, updates)
+    
+    def _notify(self, user_id: int, old_level: int, new_level: int, subject: Optional[str]):
+        # Fire and forget so a slow send never holds up the next batch
+        self.level_ups += 1
+        if self.on_level_up is None:
+            return
+        task = asyncio.create_task(self.on_level_up(user_id, {
+            "leveled_up": True,
+            "old_level": old_level,
+            "new_level": new_level,
+            "subject": subject
+        }))
+        self._notifications.add(task)
+        task.add_done_callback(self._notification_done)
+    
+    def _notification_done(self, task: asyncio.Task):
+        self._notifications.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Level-up notification failed: %s", task.exception())
+    
+    async def get_user(self, user_id: int):
+        return await self.db.get_user(user_id)
+    
+    async def get_user_stats(self, user_id: int):
+        return await self.db.get_user_stats(user_id)
+    
+    async def get_user_progress(self, user_id: int):
+        return await self.db.get_user_progress(user_id)
+    
+    async def load_leaderboards(self):
+        stats, progress = [], []
+        async for chunk in self.db.iter_user_states():
+            for user_stats, user_progress in chunk:
+                stats.append(user_stats)
+                progress.append(user_progress)
+        self.leaderboards.load(stats, progress)
+    
+    async def _display_name(self, user_id: int) -> str:
+        user = await self.get_user(user_id)
+        return (user.username or user.first_name) if user else str(user_id)
+    
+    async def publish_leaderboards(self, shard: int, top: Optional[int] = None):
+        # Write this shard's snapshot of every board to the shared store
+        top = top or Config.LEADERBOARD_MERGE_TOP
+        for name, weekly in self.leaderboards.keys():
+            entries = [
+                (user_id, score, await self._display_name(user_id))
+                for _, user_id, score in self.leaderboards.board(name, weekly).top(top)
+            ]
+            payload = self.leaderboards.snapshot(name, weekly, entries)
+            key = f"weekly:{name}" if weekly else name
+            await self.db.publish_aggregate(f"leaderboard:{key}", shard, payload)
+    
+    async def merge_leaderboards(self, shard: int):
+        # Pick up the other shards' latest snapshots
+        for name, weekly in self.leaderboards.keys():
+            key = f"weekly:{name}" if weekly else name
+            payloads = await self.db.read_aggregates(f"leaderboard:{key}")
+            self.leaderboards.remote[key] = [
+                decode_snapshot(payload) for other, payload in sorted(payloads.items()) if other != shard
+            ]
+    
+    async def run_leaderboard_merge(self, shard: int, interval: Optional[float] = None):
+        # Background task for shard workers: publish, then merge
+        interval = interval or Config.LEADERBOARD_MERGE_INTERVAL
+        while True:
+            try:
+                await self.publish_leaderboards(shard)
+                await self.merge_leaderboards(shard)
+            except Exception:
+                logger.exception("Leaderboard merge failed")
+            await asyncio.sleep(interval)
+    
     async def calculate_streak_bonus(self, user_id: int) -> int:
         # Calculate bonus based on current streak
         user_stats = await self.get_user_stats(user_id)
-        streak = user_stats.current_streak
-        
-        if streak >= 7:
-            return 10
-        elif streak >= 30:
-            return 25
-        elif streak >= 100:
-            return 50
-        return 0
+        return streak_bonus(user_stats.current_streak)
     
     async def check_level_up(self, user_id: int, subject: str = None) -> Dict:
         # Check if user leveled up
@@ -60,18 +268,124 @@ class XPSystem:
         return {"leveled_up": False}
     
     def calculate_level(self, xp: int) -> int:
-        level = 1
-        for i, requirement in enumerate(self.xp_requirements[1:], 1):
-            if xp >= requirement:
-                level = i + 1
-            else:
-                break
-        return level
-    
-    async def get_user_profile(self, user_id: int) -> Dict:
+        return self.level_curve.level_for_xp(xp)
+    
+    async def recompute_levels(self, chunk_size: int = 10000) -> int:
+        # Migrate every stored level to the current curve, one vectorised
+        # pass per chunk; only records whose level changed are written back
+        changed_total = 0
+        async for chunk in self.db.iter_user_states(chunk_size):
+            stats_list = [stats for stats, _ in chunk]
+            progress_list = [progress for _, progress in chunk]
+            changed = np.zeros(len(chunk), dtype=bool)
+            
+            total_xp = np.fromiter((stats.total_xp for stats in stats_list), np.int64, len(chunk))
+            old_levels = np.fromiter((stats.global_level for stats in stats_list), np.int64, len(chunk))
+            new_levels = self.level_curve.levels_for_xp(total_xp)
+            for i in np.flatnonzero(new_levels != old_levels):
+                stats_list[i].global_level = int(new_levels[i])
+                changed[i] = True
+            
+            for subject in SUBJECTS:
+                subject_xp = np.fromiter(
+                    (progress.subjects[subject]["xp"] for progress in progress_list), np.int64, len(chunk)
+                )
+                old_levels = np.fromiter(
+                    (progress.subjects[subject]["level"] for progress in progress_list), np.int64, len(chunk)
+                )
+                new_levels = self.level_curve.levels_for_xp(subject_xp)
+                for i in np.flatnonzero(new_levels != old_levels):
+                    progress_list[i].subjects[subject]["level"] = int(new_levels[i])
+                    changed[i] = True
+            
+            if changed.any():
+                await self.db.write_user_states([chunk[i] for i in np.flatnonzero(changed)])
+                changed_total += int(changed.sum())
+        if changed_total:
+            self.profiles.invalidate_all()
+        return changed_total
+
+    async def rollover_streaks(self, day: Optional[date] = None) -> Dict:
+        # Close streak day `day` (default: the last finished one) for every
+        # user: streak, longest streak and freezes are computed in one
+        # vectorised pass over the typed stats columns and written back in
+        # place. Streak days start at STREAK_ROLLOVER_HOUR:00 local time.
+        hour = Config.STREAK_ROLLOVER_HOUR
+        day = day or streak_day(time.time(), hour) - timedelta(days=1)
+        since, until = day_start(day, hour), day_start(day + timedelta(days=1), hour)
+        await self.events.flush()
+        counts = {"users": 0, "extended": 0, "frozen": 0, "reset": 0}
+        
+        def roll(table) -> "np.ndarray":
+            current = table.view("current_streak")
+            longest = table.view("longest_streak")
+            freezes = table.view("streak_freeze")
+            new_current, new_longest, new_freezes, changed = rollover_streaks(
+                table.view("last_active"), table.view("active_day"), table.view("active_days"),
+                current, longest, freezes, day.toordinal(), since, until,
+                Config.STREAK_FREEZE_EVERY, Config.STREAK_FREEZE_MAX
+            )
+            counts["users"] += len(current)
+            counts["extended"] += int((new_current > current).sum())
+            counts["frozen"] += int((new_freezes < freezes).sum())
+            counts["reset"] += int(((new_current == 0) & (current > 0)).sum())
+            current[:] = new_current
+            longest[:] = new_longest
+            freezes[:] = new_freezes
+            return np.flatnonzero(changed)
+        
+        counts["changed"] = await self.db.update_stats_columns(roll)
+        if counts["changed"]:
+            self.profiles.invalidate_all()
+        return counts
+
+    async def last_rolled_day(self) -> Optional[date]:
+        shard = self.db.shard[0] if self.db.shard else 0
+        marker = (await self.db.read_aggregates(ROLLOVER_MARKER)).get(shard)
+        return date.fromisoformat(marker.decode()) if marker else None
+    
+    async def catch_up_rollover(self) -> List[date]:
+        # Close every finished streak day after the last one closed, oldest
+        # first, recording each as it completes. A first run only records
+        # the current day. Days older than the activity bitmask reaches are
+        # skipped; their users would have lost their streaks anyway.
+        latest = streak_day(time.time(), Config.STREAK_ROLLOVER_HOUR) - timedelta(days=1)
+        shard = self.db.shard[0] if self.db.shard else 0
+        last = await self.last_rolled_day()
+        if last is None:
+            await self.db.publish_aggregate(ROLLOVER_MARKER, shard, latest.isoformat().encode())
+            return []
+        day = max(last + timedelta(days=1), latest - timedelta(days=ACTIVITY_DAYS - 1))
+        if day > last + timedelta(days=1):
+            logger.warning("Streak rollover skipped %s to %s", last + timedelta(days=1), day - timedelta(days=1))
+        rolled = []
+        while day <= latest:
+            started = time.perf_counter()
+            counts = await self.rollover_streaks(day)
+            await self.db.publish_aggregate(ROLLOVER_MARKER, shard, day.isoformat().encode())
+            logger.info("Streak rollover for %s done in %.2fs: %s", day, time.perf_counter() - started, counts)
+            rolled.append(day)
+            day += timedelta(days=1)
+        return rolled
+    
+    async def run_nightly_rollover(self):
+        # Background task: on start, close any days missed while the bot was
+        # down, then close each day shortly after STREAK_ROLLOVER_HOUR:00
+        # local time. A failed day stays open and is retried the next time.
+        while True:
+            try:
+                await self.catch_up_rollover()
+            except Exception:
+                logger.exception("Streak rollover failed")
+            await asyncio.sleep(seconds_until(Config.STREAK_ROLLOVER_HOUR) + 1)
+
+    async def get_user_profile(self, user_id: int) -> Optional[Dict]:
         user = await self.get_user(user_id)
+        if user is None:
+            return None
         stats = await self.get_user_stats(user_id)
         progress = await self.get_user_progress(user_id)
+        aggregates = self.profiles.aggregates(user_id, progress)
         
         return {
             "username": user.username,
@@ -84,21 +398,6 @@ class XPSystem:
             "longest_streak": stats.longest_streak,
             "learning_time": stats.total_learning_time,
             "vocabulary_size": progress.subjects["english"]["vocabulary_size"],
-            "mastery_percentage": self.calculate_mastery(progress),
-            "completed_units": self.count_completed_units(progress)
+            "mastery_percentage": round(aggregates.mastery, 1),
+            "completed_units": aggregates.completed_units
         }
-    
-    def calculate_mastery(self, progress) -> float:
-        # Calculate overall mastery percentage
-        total_mastery = sum(
-            subject["mastery_percentage"] 
-            for subject in progress.subjects.values()
-        )
-        return total_mastery / len(progress.subjects)
-    
-    def count_completed_units(self, progress) -> int:
-        # Count completed units across all subjects
-        return sum(
-            len(subject.get("completed_lessons", [])) 
-            for subject in progress.subjects.values()
-        )
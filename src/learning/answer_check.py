@@ -0,0 +1,291 @@
+import ast
+import asyncio
+import logging
+import math
+import random
+import re
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from src.learning.exercises import ExpectedAnswer, normalize_answer
+
+logger = logging.getLogger(__name__)
+
+SYMBOLIC_KINDS = ("expression", "factored", "antiderivative")
+
+MAX_ANSWER_LENGTH = 200
+MAX_NODES = 120
+MAX_CONSTANT = 1e6
+SAMPLE_POINTS = 8
+MIN_VALID_SAMPLES = 5
+
+FUNCTIONS = {
+    "sin": math.sin, "cos": math.cos, "tan": math.tan, "exp": math.exp,
+    "log": math.log, "ln": math.log, "sqrt": math.sqrt,
+}
+CONSTANTS = {"pi": math.pi, "e": math.e}
+BINARY = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.Pow: lambda a, b: a ** b,
+}
+
+_IMPLICIT_MUL = [
+    (re.compile(r"(\d)([a-z(])"), r"\1*\2"),         # 2x, 3sin(x), 4(x+1)
+    (re.compile(r"\)([\w(])"), r")*\1"),             # (x+1)(x-1), (x+1)x
+    (re.compile(r"\bx(\(|\d|[a-z])"), r"x*\1"),      # x(x+1), xsin(x)
+]
+
+
+class Verdict:
+    __slots__ = ("correct", "path")
+
+    def __init__(self, correct: Optional[bool], path: str):
+        # correct is None when equivalence could not be decided in time
+        self.correct = correct
+        self.path = path
+
+    def __repr__(self) -> str:
+        return f"Verdict({self.correct}, {self.path!r})"
+
+
+def to_python(text: str) -> str:
+    # Normalised answer text -> Python expression syntax
+    text = normalize_answer(text)
+    text = re.sub(r"\+c$", "", text)
+    for pattern, replacement in _IMPLICIT_MUL:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+@lru_cache(maxsize=4096)
+def compile_answer(text: str) -> Optional[Tuple[Callable[[float], float], ast.AST]]:
+    # Whitelisted arithmetic only: no attribute access, no calls other than
+    # the listed functions, bounded size. Everything is evaluated in floats,
+    # so huge powers overflow quickly instead of building giant integers.
+    # Returns None for anything outside the grammar.
+    if len(text) > MAX_ANSWER_LENGTH:
+        return None
+    try:
+        tree = ast.parse(to_python(text), mode="eval").body
+    except (SyntaxError, ValueError, RecursionError):
+        return None
+    nodes = 0
+    for node in ast.walk(tree):
+        nodes += 1
+        if nodes > MAX_NODES:
+            return None
+        if isinstance(node, ast.BinOp):
+            if type(node.op) not in BINARY:
+                return None
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.USub, ast.UAdd)):
+                return None
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)) or isinstance(node.value, bool) \
+                    or abs(node.value) > MAX_CONSTANT:
+                return None
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS \
+                    or len(node.args) != 1 or node.keywords:
+                return None
+        elif isinstance(node, ast.Name):
+            if node.id != "x" and node.id not in CONSTANTS and node.id not in FUNCTIONS:
+                return None
+        elif not isinstance(node, (ast.operator, ast.unaryop, ast.Load)):
+            return None
+    return _build(tree), tree
+
+
+def _build(node: ast.AST) -> Callable[[float], float]:
+    # Compile the validated tree into nested closures (no eval)
+    if isinstance(node, ast.BinOp):
+        op, left, right = BINARY[type(node.op)], _build(node.left), _build(node.right)
+        return lambda x: op(left(x), right(x))
+    if isinstance(node, ast.UnaryOp):
+        operand = _build(node.operand)
+        if isinstance(node.op, ast.USub):
+            return lambda x: -operand(x)
+        return operand
+    if isinstance(node, ast.Constant):
+        value = float(node.value)
+        return lambda x: value
+    if isinstance(node, ast.Call):
+        func, arg = FUNCTIONS[node.func.id], _build(node.args[0])
+        return lambda x: func(arg(x))
+    if node.id == "x":
+        return lambda x: x
+    value = CONSTANTS[node.id]
+    return lambda x: value
+
+
+def is_factored(tree: ast.AST) -> bool:
+    while isinstance(tree, ast.UnaryOp):
+        tree = tree.operand
+    return isinstance(tree, ast.BinOp) and isinstance(tree.op, (ast.Mult, ast.Pow))
+
+
+def _evaluate(func: Callable[[float], float], x: float) -> Optional[float]:
+    # Overflow is reported as inf rather than None: a value beyond float
+    # range cannot equal a finite reference, so it decides the comparison
+    # without a trip to sympy
+    try:
+        value = func(x)
+    except OverflowError:
+        return math.inf
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+    if isinstance(value, complex) or math.isnan(value):
+        return None
+    return value
+
+
+def sample_equivalent(expected: Callable, given: Callable, up_to_constant: bool,
+                      points: List[float]) -> Optional[bool]:
+    # True/False when the sample points decide it, None when too few points
+    # evaluate on both sides (domain errors, overflow)
+    offset = None
+    valid = 0
+    for x in points:
+        a, b = _evaluate(expected, x), _evaluate(given, x)
+        if a is None or b is None or math.isinf(a):
+            continue
+        if math.isinf(b):
+            return False
+        difference = a - b
+        if up_to_constant:
+            if offset is None:
+                offset = difference
+            difference -= offset
+        if not math.isclose(difference, 0.0, abs_tol=1e-9 * max(1.0, abs(a), abs(b))):
+            return False
+        valid += 1
+    return True if valid >= MIN_VALID_SAMPLES else None
+
+
+def sympy_equivalent(kind: str, expected: str, given: str, time_limit: float) -> Optional[bool]:
+    # Last resort, run in a worker process. Inputs have already passed
+    # compile_answer, so parse_expr only ever sees whitelisted arithmetic.
+    # SIGALRM bounds the time spent in Python-level sympy code; the caller
+    # additionally kills the worker if it does not come back at all.
+    import signal
+
+    import sympy
+    from sympy.parsing.sympy_parser import parse_expr
+
+    def on_alarm(signum, frame):
+        raise TimeoutError()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, time_limit)
+    try:
+        names = {"x": sympy.Symbol("x"), "e": sympy.E, "ln": sympy.log}
+        expected_expr = parse_expr(to_python(expected), local_dict=names)
+        given_expr = parse_expr(to_python(given), local_dict=names)
+        difference = expected_expr - given_expr
+        if kind == "antiderivative":
+            difference = sympy.diff(difference, names["x"])
+        return sympy.simplify(difference) == 0
+    except TimeoutError:
+        return None
+    except (sympy.SympifyError, TypeError, ValueError, ZeroDivisionError):
+        return False
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class AnswerChecker:
+    # Cheapest test first:
+    #   1. exact / numeric / set match precomputed at issue time
+    #   2. compile both sides with the whitelisted evaluator and compare at
+    #      random sample points (up to a constant for antiderivatives)
+    #   3. sympy simplify in a worker process under a time limit
+    # Verdicts are memoised per (expected, given) in an LRU.
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None,
+                 cache_size: Optional[int] = None):
+        self.workers = workers or Config.ANSWER_CHECK_WORKERS
+        self.timeout = timeout or Config.ANSWER_CHECK_TIMEOUT
+        self.cache_size = cache_size or Config.ANSWER_CHECK_CACHE_SIZE
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._memo: "OrderedDict[Tuple[str, str, str], Verdict]" = OrderedDict()
+        self._rng = random.Random(7)
+        self.paths: Counter = Counter()
+
+    async def check(self, expected: ExpectedAnswer, answer: str) -> Verdict:
+        key = (expected.kind, expected.canonical or expected.display, normalize_answer(answer))
+        verdict = self._memo.get(key)
+        if verdict is not None:
+            self._memo.move_to_end(key)
+            self.paths["memo"] += 1
+            return verdict
+
+        verdict = await self._check(expected, answer)
+        self.paths[verdict.path] += 1
+        if verdict.path != "timeout":
+            self._memo[key] = verdict
+            if len(self._memo) > self.cache_size:
+                self._memo.popitem(last=False)
+        return verdict
+
+    async def _check(self, expected: ExpectedAnswer, answer: str) -> Verdict:
+        if expected.matches(answer):
+            return Verdict(True, "exact")
+        if expected.kind not in SYMBOLIC_KINDS:
+            return Verdict(False, "exact")
+
+        given = compile_answer(answer)
+        if given is None:
+            return Verdict(False, "rejected")
+        reference = compile_answer(expected.canonical or expected.display)
+        if reference is None:
+            # Should not happen for generated problems; let sympy decide
+            return await self._symbolic(expected, answer)
+        if expected.kind == "factored" and not is_factored(given[1]):
+            return Verdict(False, "sampled")
+
+        points = [self._rng.uniform(0.3, 2.7) for _ in range(SAMPLE_POINTS)]
+        sampled = sample_equivalent(reference[0], given[0], expected.kind == "antiderivative", points)
+        if sampled is not None:
+            return Verdict(sampled, "sampled")
+        return await self._symbolic(expected, answer)
+
+    async def _symbolic(self, expected: ExpectedAnswer, answer: str) -> Verdict:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor, sympy_equivalent, expected.kind, expected.canonical or expected.display,
+            answer, self.timeout
+        )
+        try:
+            result = await asyncio.wait_for(future, timeout=self.timeout + 1.0)
+        except asyncio.TimeoutError:
+            # Stuck in C code the alarm cannot interrupt: replace the pool
+            logger.warning("Symbolic answer check timed out; restarting worker pool")
+            self._kill_workers()
+            return Verdict(None, "timeout")
+        if result is None:
+            return Verdict(None, "timeout")
+        return Verdict(result, "symbolic")
+
+    def _kill_workers(self):
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        return {"memo_size": len(self._memo), **self.paths}
@@ -0,0 +1,321 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from collections import OrderedDict
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from config import Config
+
+# Lesson pack layout (little-endian):
+#   header   magic "LPK1", version, lesson count, index length
+#   index    JSON {"subject/difficulty/unit": [first lesson, count]}
+#   offsets  count + 1 u64 offsets of each lesson into the data section
+#   data     one JSON object per lesson, grouped by index key
+# Lessons of one subject and difficulty are contiguous whatever their unit,
+# so both a unit and a whole difficulty are a (first, count) range. Only the
+# header and index are parsed on open; a lesson is decoded when selected.
+# Every lesson carries a stable "id" (see lesson_id), which completions
+# store; positions shift whenever a lesson is added.
+MAGIC = b"LPK1"
+VERSION = 2
+HEADER = struct.Struct("<4sIII")
+OFFSET = struct.Struct("<Q")
+
+DIFFICULTIES = ("beginner", "intermediate", "advanced")
+
+# Shipped with the code; a pack file (LESSON_PACK_PATH) replaces them
+BUILTIN_LESSONS = [
+    {
+        "subject": "english", "difficulty": "beginner", "unit": "basics",
+        "title": "Basic Greetings",
+        "content": "Learn how to greet people in English...",
+        "exercise": {
+            "type": "multiple_choice",
+            "question": "How do you say 'Hello' in English?",
+            "options": ["Hello", "Goodbye", "Thank you", "Please"],
+            "answer": 0
+        }
+    },
+    {
+        "subject": "english", "difficulty": "beginner", "unit": "food",
+        "title": "At the Market",
+        "content": "Name everyday foods and ask for them politely: 'Can I have some bread, please?'",
+        "exercise": {
+            "type": "multiple_choice",
+            "question": "Which word is a fruit?",
+            "options": ["Bread", "Cheese", "Banana", "Water"],
+            "answer": 2
+        }
+    },
+    {
+        "subject": "english", "difficulty": "intermediate", "unit": "basics",
+        "title": "Present Perfect",
+        "content": "Use the present perfect (have/has + past participle) for experiences and recent events.",
+        "exercise": {
+            "type": "multiple_choice",
+            "question": "Choose the correct sentence.",
+            "options": ["I have saw that film.", "I have seen that film.", "I seen that film.", "I has seen that film."],
+            "answer": 1
+        }
+    },
+    {
+        "subject": "english", "difficulty": "intermediate", "unit": "basics",
+        "title": "Phrasal Verbs",
+        "content": "Many verbs change meaning with a particle: 'look up' a word, 'give up' a habit.",
+        "exercise": {
+            "type": "multiple_choice",
+            "question": "What does 'give up' mean in 'She gave up sugar'?",
+            "options": ["Started eating", "Stopped eating", "Bought", "Shared"],
+            "answer": 1
+        }
+    },
+    {
+        "subject": "english", "difficulty": "advanced", "unit": "basics",
+        "title": "Conditionals",
+        "content": "Third conditional: if + past perfect, would have + past participle, for unreal past events.",
+        "exercise": {
+            "type": "multiple_choice",
+            "question": "Complete: 'If I had known, I ___ you.'",
+            "options": ["will tell", "would tell", "would have told", "had told"],
+            "answer": 2
+        }
+    },
+]
+
+
+def difficulty_for_level(level: int) -> str:
+    if level > 10:
+        return "advanced"
+    if level > 5:
+        return "intermediate"
+    return "beginner"
+
+
+def _key(lesson: Dict) -> Tuple[str, str, str]:
+    return lesson["subject"], lesson["difficulty"], lesson.get("unit", "")
+
+
+def lesson_id(lesson: Dict) -> int:
+    # The lesson's own "id", else one derived from what identifies it, so
+    # it survives reordering and lessons added to the pack
+    if "id" in lesson:
+        return int(lesson["id"])
+    return zlib.crc32(f"{lesson['subject']}/{lesson.get('unit', '')}/{lesson['title']}".encode())
+
+
+def build_pack(lessons: Iterable[Dict]) -> bytes:
+    # Whole pack in memory; lessons are sorted by (subject, difficulty, unit)
+    lessons = sorted((dict(lesson, id=lesson_id(lesson)) for lesson in lessons), key=_key)
+    titles: Dict[int, str] = {}
+    for lesson in lessons:
+        if lesson["id"] in titles:
+            raise ValueError(f"Lessons {titles[lesson['id']]!r} and {lesson['title']!r} share id {lesson['id']}; "
+                             "give one of them an explicit id")
+        titles[lesson["id"]] = lesson["title"]
+    index = {}
+    records: List[bytes] = []
+    for key, group in groupby(lessons, key=_key):
+        first = len(records)
+        records.extend(json.dumps(lesson, separators=(",", ":")).encode() for lesson in group)
+        index["/".join(key)] = [first, len(records) - first]
+    offsets = [0]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    index_bytes = json.dumps(index, separators=(",", ":")).encode()
+    return b"".join([
+        HEADER.pack(MAGIC, VERSION, len(records), len(index_bytes)),
+        index_bytes,
+        struct.pack(f"<{len(offsets)}Q", *offsets),
+        *records,
+    ])
+
+
+def write_pack(path: str, lessons: Iterable[Dict]):
+    # Written beside the target and renamed, so running bots never map a
+    # half-written file
+    data = build_pack(lessons)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class LessonPack:
+    # Read side of a pack: a file mapped with mmap (pages are loaded on
+    # demand and shared by every process mapping the file), or pack bytes.
+    # Nothing is read until the first lookup.
+    def __init__(self, path: Optional[str] = None, data: Optional[bytes] = None):
+        self.path = path
+        self._data = data
+        self._buffer: Union[None, bytes, mmap.mmap] = None
+        self._units: Dict[Tuple[str, str, str], Tuple[int, int]] = {}
+        self._levels: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self._offsets_at = 0
+        self._data_at = 0
+        self.count = 0
+
+    @property
+    def buffer(self) -> Union[bytes, mmap.mmap]:
+        if self._buffer is None:
+            self._load()
+        return self._buffer
+
+    def _load(self):
+        if self._data is not None:
+            buffer = self._data
+        else:
+            with open(self.path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, index_length = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path or 'data'} is not a version {VERSION} lesson pack")
+        index = json.loads(buffer[HEADER.size:HEADER.size + index_length])
+        for name, (first, size) in index.items():
+            subject, difficulty, unit = name.split("/", 2)
+            self._units[subject, difficulty, unit] = (first, size)
+            start, total = self._levels.get((subject, difficulty), (first, 0))
+            self._levels[subject, difficulty] = (min(start, first), total + size)
+        self._offsets_at = HEADER.size + index_length
+        self._data_at = self._offsets_at + (count + 1) * OFFSET.size
+        self.count = count
+        self._buffer = buffer
+
+    def span(self, subject: str, difficulty: str, unit: Optional[str] = None) -> Tuple[int, int]:
+        # (first lesson, count) of a unit, or of every unit of a difficulty
+        if self._buffer is None:
+            self._load()
+        if unit is None:
+            return self._levels.get((subject, difficulty), (0, 0))
+        return self._units.get((subject, difficulty, unit), (0, 0))
+
+    def lesson(self, number: int) -> Dict:
+        buffer = self.buffer
+        start, end = struct.unpack_from("<2Q", buffer, self._offsets_at + number * OFFSET.size)
+        return json.loads(buffer[self._data_at + start:self._data_at + end])
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._buffer = None
+
+
+def _mix(value: int) -> int:
+    # 32-bit integer hash (murmur3 finaliser)
+    value &= 0xFFFFFFFF
+    value ^= value >> 16
+    value = (value * 0x85EBCA6B) & 0xFFFFFFFF
+    value ^= value >> 13
+    value = (value * 0xC2B2AE35) & 0xFFFFFFFF
+    return value ^ (value >> 16)
+
+
+def shuffled_index(position: int, size: int, seed: int) -> int:
+    # The position-th element of a pseudo-random permutation of
+    # range(size), without materialising it: a 4-round Feistel network over
+    # the smallest power of four >= size, walking the cycle until the value
+    # falls inside range(size). That takes under four steps on average.
+    if size <= 1:
+        return 0
+    half = ((size - 1).bit_length() + 1) // 2
+    mask = (1 << half) - 1
+    value = position
+    while True:
+        left, right = value >> half, value & mask
+        for round_key in range(4):
+            left, right = right, left ^ (_mix(right ^ _mix(seed + round_key)) & mask)
+        value = (left << half) | right
+        if value < size:
+            return value
+
+
+class LessonCursors:
+    # Per-user position in a shuffled pool. A cursor is [position, cycle,
+    # pool size]: each cycle is a fresh permutation seeded by user, pool and
+    # cycle number, so nothing repeats until the pool is exhausted and no
+    # per-lesson state is kept. A pool that changes size starts a new
+    # permutation. Callers pass the user's stored cursors (the progress
+    # row's lesson_cursors), which are advanced in place and saved with
+    # the row; users without a progress row get cursors in process memory,
+    # least recently used users first out.
+    def __init__(self, max_users: Optional[int] = None):
+        self.max_users = max_users or Config.LESSON_CURSOR_MAX_USERS
+        self._users: "OrderedDict[int, Dict[str, List[int]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _cached(self, user_id: int) -> Dict[str, List[int]]:
+        cursors = self._users.get(user_id)
+        if cursors is None:
+            cursors = self._users[user_id] = {}
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return cursors
+
+    def next(self, user_id: int, pool: str, size: int, cursors: Optional[Dict[str, List[int]]] = None) -> int:
+        if cursors is None:
+            cursors = self._cached(user_id)
+        cursor = cursors.get(pool)
+        if cursor is None or cursor[2] != size:
+            cursor = cursors[pool] = [0, 0, size]
+        if cursor[0] >= size:
+            cursor[0] = 0
+            cursor[1] += 1
+        seed = zlib.crc32(f"{user_id}/{pool}/{cursor[1]}".encode())
+        index = shuffled_index(cursor[0], size, seed)
+        cursor[0] += 1
+        return index
+
+
+class LessonCatalog:
+    # Lessons by subject, difficulty and unit from a LessonPack, picked per
+    # user through LessonCursors. A user's unit is preferred; without
+    # lessons there the whole difficulty is used, then the nearest other
+    # difficulty, so an empty pool never fails a lesson request.
+    def __init__(self, pack: Optional[LessonPack] = None, cursors: Optional[LessonCursors] = None):
+        if pack is None:
+            path = Config.LESSON_PACK_PATH
+            pack = LessonPack(path) if path else LessonPack(data=build_pack(BUILTIN_LESSONS))
+        self.pack = pack
+        self.cursors = cursors or LessonCursors()
+
+    @staticmethod
+    def _pools(difficulty: str, unit: Optional[str]):
+        if unit is not None:
+            yield difficulty, unit
+        yield difficulty, None
+        # Then the other difficulties, closest (and at equal distance, easier) first
+        position = DIFFICULTIES.index(difficulty) if difficulty in DIFFICULTIES else 0
+        nearest = sorted(range(len(DIFFICULTIES)), key=lambda other: (abs(other - position), other))
+        for other in nearest[1:]:
+            yield DIFFICULTIES[other], None
+
+    def next_lesson(self, user_id: int, subject: str, difficulty: str, unit: Optional[str] = None,
+                    cursors: Optional[Dict[str, List[int]]] = None) -> Optional[Dict]:
+        for pool_difficulty, pool_unit in self._pools(difficulty, unit):
+            first, size = self.pack.span(subject, pool_difficulty, pool_unit)
+            if size:
+                pool = f"{subject}/{pool_difficulty}/{pool_unit or '*'}"
+                return self.pack.lesson(first + self.cursors.next(user_id, pool, size, cursors))
+        return None
+
+    def close(self):
+        self.pack.close()
+
+
+if __name__ == "__main__":
+    # python -m src.learning.catalog lessons.jsonl lessons.pack
+    # One lesson per input line, with subject, difficulty, unit and title
+    # fields, and an optional stable integer id
+    source, target = sys.argv[1:3]
+    with open(source) as f:
+        write_pack(target, (json.loads(line) for line in f if line.strip()))
+    pack = LessonPack(target)
+    pack.span("", "")
+    print(f"Wrote {pack.count} lessons to {target}")
@@ -0,0 +1,166 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Sequence, Union
+
+from config import Config
+
+_SPACES = re.compile(r"\s+")
+_TRANSLATE = str.maketrans({"×": "*", "·": "*", "÷": "/", "−": "-", "^": "**"})
+
+
+def normalize_answer(text: str) -> str:
+    # Lower-case, drop whitespace and trailing punctuation, unify operators
+    text = _SPACES.sub("", text.strip().lower()).translate(_TRANSLATE)
+    if text.startswith("x="):
+        text = text[2:]
+    return text.rstrip(".!")
+
+
+def parse_number(text: str) -> Optional[float]:
+    try:
+        if "/" in text:
+            numerator, denominator = text.split("/", 1)
+            return float(numerator) / float(denominator)
+        return float(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def parse_number_set(text: str) -> Optional[FrozenSet[float]]:
+    values = set()
+    for part in re.split(r"[,;]|and|or", text):
+        part = part.strip()
+        if part.startswith("x="):
+            part = part[2:]
+        value = parse_number(part)
+        if value is None:
+            return None
+        values.add(value)
+    return frozenset(values) if values else None
+
+
+class ExpectedAnswer:
+    # Everything needed to check an answer, derived once when the exercise
+    # is issued. kind is one of: choice, numeric, set, expression,
+    # factored, antiderivative (the last three are symbolic).
+    __slots__ = ("kind", "display", "accepted", "value", "canonical")
+
+    def __init__(self, kind: str, display: str, accepted: FrozenSet[str],
+                 value: Union[None, int, float, FrozenSet[float]] = None, canonical: Optional[str] = None):
+        self.kind = kind
+        self.display = display
+        self.accepted = accepted
+        self.value = value
+        self.canonical = canonical
+
+    @classmethod
+    def choice(cls, options: Sequence[str], index: int) -> "ExpectedAnswer":
+        letter = chr(ord("a") + index)
+        accepted = frozenset((letter, str(index + 1), normalize_answer(options[index])))
+        return cls("choice", f"{letter.upper()}. {options[index]}", accepted, index)
+
+    @classmethod
+    def from_problem(cls, kind: str, solution: str, canonical: Optional[str] = None) -> "ExpectedAnswer":
+        display = solution
+        if kind == "antiderivative":
+            solution = solution.removesuffix(" + C")
+        accepted = {normalize_answer(solution)}
+        # The expanded form is the question itself for factoring exercises
+        if canonical and kind != "factored":
+            accepted.add(normalize_answer(canonical))
+        value = None
+        if kind == "numeric":
+            value = parse_number(normalize_answer(solution))
+        elif kind == "set":
+            value = parse_number_set(solution)
+        return cls(kind, display, frozenset(accepted), value, canonical)
+
+    def matches(self, answer: str) -> bool:
+        # Cheap checks only; symbolic equivalence is out of scope here
+        text = normalize_answer(answer)
+        if self.kind == "antiderivative":
+            text = re.sub(r"\+c$", "", text)
+        if text in self.accepted:
+            return True
+        if self.kind == "numeric" and self.value is not None:
+            given = parse_number(text)
+            return given is not None and abs(given - self.value) <= 1e-9 * max(1.0, abs(self.value))
+        if self.kind == "set" and self.value is not None:
+            return parse_number_set(text) == self.value
+        return False
+
+
+class ExerciseSession:
+    __slots__ = ("user_id", "subject", "topic", "expected", "xp_reward", "expires_at", "attempts", "item_id")
+
+    def __init__(self, user_id: int, subject: str, topic: str, expected: ExpectedAnswer,
+                 xp_reward: int, expires_at: float, item_id: Optional[int] = None):
+        self.user_id = user_id
+        self.subject = subject
+        self.topic = topic
+        self.expected = expected
+        self.xp_reward = xp_reward
+        self.expires_at = expires_at
+        self.attempts = 0
+        # Lesson or exercise id recorded as completed on a correct answer
+        self.item_id = item_id
+
+
+class ExerciseSessionStore:
+    # At most one active exercise per user, in an OrderedDict kept in issue
+    # order. With a single TTL that is also expiry order, so eviction only
+    # ever looks at the front: expired sessions and, past max_sessions,
+    # the oldest ones. Lookups are one dict probe plus an expiry check.
+    def __init__(self, ttl: Optional[float] = None, max_sessions: Optional[int] = None):
+        self.ttl = ttl or Config.EXERCISE_TTL
+        self.max_sessions = max_sessions or Config.EXERCISE_MAX_SESSIONS
+        self._sessions: "OrderedDict[int, ExerciseSession]" = OrderedDict()
+        self.issued = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def issue(self, user_id: int, subject: str, topic: str, expected: ExpectedAnswer,
+              xp_reward: int, item_id: Optional[int] = None) -> ExerciseSession:
+        now = time.monotonic()
+        session = ExerciseSession(user_id, subject, topic, expected, xp_reward, now + self.ttl, item_id)
+        # A new exercise replaces the previous one and moves to the back
+        self._sessions.pop(user_id, None)
+        self._sessions[user_id] = session
+        self.issued += 1
+        self._evict(now)
+        return session
+
+    def get(self, user_id: int) -> Optional[ExerciseSession]:
+        session = self._sessions.get(user_id)
+        if session is not None and session.expires_at <= time.monotonic():
+            del self._sessions[user_id]
+            self.expired += 1
+            return None
+        return session
+
+    def pop(self, user_id: int) -> Optional[ExerciseSession]:
+        return self._sessions.pop(user_id, None)
+
+    def _evict(self, now: float):
+        sessions = self._sessions
+        while sessions:
+            user_id, oldest = next(iter(sessions.items()))
+            if oldest.expires_at <= now:
+                self.expired += 1
+            elif len(sessions) > self.max_sessions:
+                self.evicted += 1
+            else:
+                break
+            del sessions[user_id]
+
+    def stats(self) -> Dict:
+        return {
+            "active": len(self._sessions),
+            "issued": self.issued,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -1,54 +1,97 @@
-import random
-from typing import Dict, List
+from typing import Dict, List, Optional
+from src.database.models import Database
+from src.learning.catalog import LessonCatalog, difficulty_for_level
+from src.learning.srs import SRSEngine
+from src.media.audio import AudioPipeline, score_pronunciation
+
+PRONUNCIATION_FEEDBACK = {
+    "voicing": ("Try to speak more continuously - there were long gaps or a lot of noise.",
+                "Record somewhere quiet and read a full sentence without stopping."),
+    "volume": ("Your voice was hard to hear clearly.",
+               "Hold the phone closer and speak at a normal, confident volume."),
+    "intonation": ("Your intonation sounded a bit flat.",
+                   "Let your voice rise on questions and fall at the end of statements."),
+    "pace": ("Your pace was a little uneven.",
+             "Aim for a steady rhythm - about three syllables per second."),
+}
 
 class LanguageLearning:
-    def __init__(self):
-        self.lessons = {
-            "beginner": [
-                {
-                    "title": "Basic Greetings",
-                    "content": "Learn how to greet people in English...",
-                    "exercise": {
-                        "type": "multiple_choice",
-                        "question": "How do you say 'Hello' in English?",
-                        "options": ["Hello", "Goodbye", "Thank you", "Please"],
-                        "answer": 0
-                    }
-                }
-            ],
-            "intermediate": [
-                # More lessons...
-            ]
-        }
+    def __init__(self, db: Optional[Database] = None, srs: Optional[SRSEngine] = None,
+                 audio_pipeline: Optional[AudioPipeline] = None, catalog: Optional[LessonCatalog] = None):
+        self.db = db or Database()
+        self.srs = srs or SRSEngine(self.db)
+        self.audio_pipeline = audio_pipeline or AudioPipeline()
+        # Lessons come from the on-disk pack (or the built-in set), a
+        # shuffled non-repeating sequence per user
+        self.catalog = catalog or LessonCatalog()
         self.vocabulary_sets = {
             "basics": ["hello", "goodbye", "thank you", "please", "yes", "no"],
             "food": ["apple", "banana", "water", "bread", "cheese"],
             # More vocabulary sets...
         }
+        # Card ids for the SRS engine are positions in this flat word list
+        self.vocabulary = [word for words in self.vocabulary_sets.values() for word in words]
+        self.word_ids = {word: card_id for card_id, word in enumerate(self.vocabulary)}
     
-    async def generate_lesson(self, user_id: int) -> Dict:
+    async def get_user_progress(self, user_id: int):
+        return await self.db.get_user_progress(user_id)
+    
+    async def generate_lesson(self, user_id: int) -> Optional[Dict]:
         user_progress = await self.get_user_progress(user_id)
-        english_level = user_progress.subjects["english"]["level"]
-        
-        difficulty = "beginner"
-        if english_level > 5:
-            difficulty = "intermediate"
-        elif english_level > 10:
-            difficulty = "advanced"
-        
-        lesson = random.choice(self.lessons[difficulty])
+        english = user_progress.subjects["english"] if user_progress else None
+        difficulty = difficulty_for_level(english["level"] if english else 1)
+        unit = english["current_unit"] if english else None
+        if english is None:
+            return self.catalog.next_lesson(user_id, "english", difficulty, unit)
+        # Cursors are advanced in place on the progress row, then saved
+        cursors = english["lesson_cursors"] or {}
+        lesson = self.catalog.next_lesson(user_id, "english", difficulty, unit, cursors)
+        await self.db.update_user_progress(user_id, "english", {"lesson_cursors": cursors})
         return lesson
     
-    async def generate_vocabulary_review(self, user_id: int) -> List[str]:
+    async def generate_vocabulary_review(self, user_id: int, count: int = 5) -> List[str]:
         # Generate vocabulary words for review using spaced repetition
         user_progress = await self.get_user_progress(user_id)
-        return random.sample(self.vocabulary_sets["basics"], 5)
+        unit = user_progress.subjects["english"]["current_unit"] if user_progress else "basics"
+        
+        due = await self.srs.due_cards(user_id, count)
+        if len(due) < count:
+            # Top up with words from the current unit the user has not seen yet
+            deck = await self.srs.deck(user_id)
+            new_words = [
+                self.word_ids[word]
+                for word in self.vocabulary_sets.get(unit, self.vocabulary_sets["basics"])
+                if deck.slot_of(self.word_ids[word]) is None
+            ]
+            await self.srs.add_cards(user_id, new_words[:count - len(due)])
+            due = await self.srs.due_cards(user_id, count)
+        return [self.vocabulary[card_id] for card_id in due]
+    
+    async def record_vocabulary_review(self, user_id: int, word: str, quality: int) -> Optional[int]:
+        # quality: 0 (forgot) .. 5 (perfect recall); returns the next due minute
+        card_id = self.word_ids.get(word)
+        if card_id is None:
+            return None
+        try:
+            return await self.srs.review(user_id, card_id, quality)
+        except KeyError:
+            # Not in this user's deck (e.g. a button from another account)
+            return None
     
     async def analyze_pronunciation(self, voice_file) -> Dict:
-        # This would integrate with speech recognition API
+        # Prosody features come from the audio pipeline; there is no
+        # speech-to-text backend, so the transcript is not available
+        features = await self.audio_pipeline.process(voice_file)
+        score = score_pronunciation(features)
+        if score["accuracy"] >= 85:
+            feedback = "Clear, well-paced speech. Great job!"
+            tip = "Try a longer passage or a tongue twister next."
+        else:
+            feedback, tip = PRONUNCIATION_FEEDBACK[score["weakest"]]
         return {
-            "transcript": "Hello, how are you?",
-            "accuracy": 85,
-            "feedback": "Good pronunciation! Work on the 'th' sound.",
-            "tip": "Practice saying 'the' and 'this' slowly."
+            "transcript": f"(speech-to-text unavailable - {features['duration']:.1f}s recording analysed)",
+            "accuracy": score["accuracy"],
+            "feedback": feedback,
+            "tip": tip,
+            "features": features,
         }
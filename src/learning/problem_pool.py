@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import Config
+from src.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ("arithmetic", "algebra", "geometry", "calculus")
+MAX_TIER = 5
+
+
+def level_tier(level: int) -> int:
+    # Levels are unbounded, pools are not: bucket levels into 1..MAX_TIER
+    return max(1, min(MAX_TIER, (level + 1) // 2))
+
+
+# Generators. These run in worker processes, so they are plain module-level
+# functions that return picklable dicts. sympy is imported inside them so
+# the bot process itself never pays for it.
+
+def _problem(topic: str, tier: int, problem: str, solution: str, kind: str,
+             canonical: Optional[str] = None) -> Dict:
+    # canonical: expanded sympy form of symbolic answers, computed here so
+    # answer checking in the bot process never has to derive it
+    return {"topic": topic, "tier": tier, "problem": problem, "solution": solution, "answer_kind": kind,
+            "canonical": canonical if canonical is not None else solution}
+
+
+def generate_arithmetic(tier: int, count: int, seed: Optional[int] = None) -> List[Dict]:
+    # Sampled in one vectorised draw per operand instead of per problem
+    rng = np.random.default_rng(seed)
+    if tier <= 2:
+        high = 20 if tier == 1 else 100
+        a = rng.integers(1, high + 1, count)
+        b = rng.integers(1, high + 1, count)
+        subtract = rng.random(count) < 0.5
+        # Keep results non-negative for beginners
+        a, b = np.where(subtract, np.maximum(a, b), a), np.where(subtract, np.minimum(a, b), b)
+        answers = np.where(subtract, a - b, a + b)
+        return [
+            _problem("arithmetic", tier, f"What is {x} {'-' if s else '+'} {y}?", str(r), "numeric")
+            for x, y, s, r in zip(a.tolist(), b.tolist(), subtract.tolist(), answers.tolist())
+        ]
+    if tier == 3:
+        a = rng.integers(2, 13, count)
+        b = rng.integers(2, 13, count)
+        return [
+            _problem("arithmetic", tier, f"What is {x} × {y}?", str(x * y), "numeric")
+            for x, y in zip(a.tolist(), b.tolist())
+        ]
+    # (a × b) ÷ c with a a multiple of c, so the answer is a whole number
+    c = rng.integers(2, 11, count)
+    k = rng.integers(1, 11 * (tier - 2), count)
+    b = rng.integers(2, 20 * (tier - 2), count)
+    a = c * k
+    return [
+        _problem("arithmetic", tier, f"Calculate: ({x} × {y}) ÷ {z}", str(r), "numeric")
+        for x, y, z, r in zip(a.tolist(), b.tolist(), c.tolist(), (k * b).tolist())
+    ]
+
+
+def _nonzero(rng: random.Random, low: int, high: int) -> int:
+    value = 0
+    while value == 0:
+        value = rng.randint(low, high)
+    return value
+
+
+def generate_algebra(tier: int, count: int, seed: Optional[int] = None) -> List[Dict]:
+    import sympy
+
+    rng = random.Random(seed)
+    x = sympy.Symbol("x")
+    problems = []
+    for _ in range(count):
+        if tier <= 2:
+            root, a, b = rng.randint(-10, 10), _nonzero(rng, 2, 9), rng.randint(-20, 20)
+            lhs = a * x + b
+            problems.append(_problem(
+                "algebra", tier, f"Solve for x: {sympy.sstr(lhs)} = {a * root + b}", str(root), "numeric"
+            ))
+        elif tier <= 4:
+            r1, r2 = sorted((rng.randint(-9, 9), rng.randint(-9, 9)))
+            poly = sympy.expand((x - r1) * (x - r2))
+            roots = str(r1) if r1 == r2 else f"{r1}, {r2}"
+            problems.append(_problem(
+                "algebra", tier, f"Solve for x: {sympy.sstr(poly)} = 0", roots, "set"
+            ))
+        else:
+            factors = [x - rng.randint(-6, 6) for _ in range(3)]
+            poly = sympy.expand(sympy.Mul(*factors))
+            problems.append(_problem(
+                "algebra", tier, f"Factor: {sympy.sstr(poly)}", sympy.sstr(sympy.factor(poly)), "factored",
+                canonical=sympy.sstr(poly)
+            ))
+    return problems
+
+
+PYTHAGOREAN_TRIPLES = ((3, 4, 5), (5, 12, 13), (8, 15, 17), (7, 24, 25), (20, 21, 29))
+
+
+def generate_geometry(tier: int, count: int, seed: Optional[int] = None) -> List[Dict]:
+    import sympy
+
+    rng = random.Random(seed)
+    problems = []
+    for _ in range(count):
+        kind = rng.randrange(3) if tier > 1 else 0
+        if kind == 0:
+            a, b = rng.randint(20, 90), rng.randint(20, 70)
+            problems.append(_problem(
+                "geometry", tier,
+                f"Two angles of a triangle are {a}° and {b}°. What is the third angle (in degrees)?",
+                str(180 - a - b), "numeric"
+            ))
+        elif kind == 1:
+            p, q, h = rng.choice(PYTHAGOREAN_TRIPLES)
+            scale = rng.randint(1, tier)
+            problems.append(_problem(
+                "geometry", tier,
+                f"A right triangle has legs {p * scale} and {q * scale}. How long is the hypotenuse?",
+                str(h * scale), "numeric"
+            ))
+        else:
+            r = rng.randint(2, 5 * tier)
+            problems.append(_problem(
+                "geometry", tier,
+                f"What is the exact area of a circle with radius {r}?",
+                sympy.sstr(sympy.pi * r ** 2), "expression"
+            ))
+    return problems
+
+
+def generate_calculus(tier: int, count: int, seed: Optional[int] = None) -> List[Dict]:
+    import sympy
+
+    rng = random.Random(seed)
+    x = sympy.Symbol("x")
+    extras = (sympy.sin(x), sympy.cos(x), sympy.exp(x), sympy.log(x))
+    problems = []
+    for _ in range(count):
+        degree = min(2 + tier // 2, 5)
+        expr = sum(rng.randint(-9, 9) * x ** power for power in range(degree + 1))
+        if tier >= 3:
+            expr += rng.randint(1, 5) * rng.choice(extras)
+        if expr == 0:
+            expr = x ** 2
+        if tier >= 4 and rng.random() < 0.5:
+            integral = sympy.integrate(expr, x)
+            problems.append(_problem(
+                "calculus", tier, f"Find the indefinite integral of {sympy.sstr(expr)} dx",
+                sympy.sstr(integral) + " + C", "antiderivative", canonical=sympy.sstr(sympy.expand(integral))
+            ))
+        else:
+            problems.append(_problem(
+                "calculus", tier, f"Find the derivative of {sympy.sstr(expr)}",
+                sympy.sstr(sympy.diff(expr, x)), "expression",
+                canonical=sympy.sstr(sympy.expand(sympy.diff(expr, x)))
+            ))
+    return problems
+
+
+GENERATORS = {
+    "arithmetic": generate_arithmetic,
+    "algebra": generate_algebra,
+    "geometry": generate_geometry,
+    "calculus": generate_calculus,
+}
+
+
+def generate_batch(topic: str, tier: int, count: int, seed: Optional[int] = None) -> List[Dict]:
+    return GENERATORS[topic](tier, count, seed)
+
+
+class ProblemPool:
+    # Per-(topic, tier) queues filled by a background process pool. take()
+    # is an O(1) popleft; dropping below the low-water mark schedules a
+    # refill batch, so requests never wait on sympy.
+    def __init__(self, target_size: Optional[int] = None, low_water: Optional[int] = None,
+                 workers: Optional[int] = None, batch_size: Optional[int] = None):
+        self.target_size = target_size or Config.PROBLEM_POOL_SIZE
+        self.low_water = low_water or Config.PROBLEM_POOL_LOW_WATER
+        self.workers = workers or Config.PROBLEM_POOL_WORKERS
+        self.batch_size = batch_size or self.target_size
+        self.pools: Dict[Tuple[str, int], Deque[Dict]] = {
+            (topic, tier): deque() for topic in TOPICS for tier in range(1, MAX_TIER + 1)
+        }
+        self._refilling: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.served = 0
+        self.empty_hits = 0
+        self.generated = 0
+
+    async def start(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Warm every pool in the background; nothing awaits this
+        for key in self.pools:
+            self._schedule_refill(key)
+
+    async def close(self):
+        for future in list(self._refilling.values()):
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def take(self, topic: str, level: int) -> Optional[Dict]:
+        key = (topic, level_tier(level))
+        pool = self.pools.get(key)
+        if pool is None:
+            return None
+        problem = pool.popleft() if pool else None
+        if len(pool) < self.low_water:
+            self._schedule_refill(key)
+        if problem is None:
+            self.empty_hits += 1
+        else:
+            self.served += 1
+        return problem
+
+    def _schedule_refill(self, key: Tuple[str, int]):
+        if self._executor is None or key in self._refilling:
+            return
+        missing = self.target_size - len(self.pools[key])
+        if missing <= 0:
+            return
+        topic, tier = key
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor, generate_batch, topic, tier, min(missing, self.batch_size), random.getrandbits(32)
+        )
+        self._refilling[key] = future
+        future.add_done_callback(lambda done: self._on_refilled(key, done))
+
+    def _on_refilled(self, key: Tuple[str, int], future: asyncio.Future):
+        del self._refilling[key]
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error("Problem pool refill for %s failed: %s", key, future.exception())
+            return
+        problems = future.result()
+        self.pools[key].extend(problems)
+        self.generated += len(problems)
+        # Large deficits are filled over several batches
+        if len(self.pools[key]) < self.low_water:
+            self._schedule_refill(key)
+
+    def stats(self) -> Dict:
+        return {
+            "served": self.served,
+            "empty_hits": self.empty_hits,
+            "generated": self.generated,
+            "refills_in_flight": len(self._refilling),
+            "pooled": sum(len(pool) for pool in self.pools.values()),
+        }
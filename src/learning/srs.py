@@ -0,0 +1,300 @@
+import asyncio
+import heapq
+import logging
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from config import Config
+from src.database.models import Database
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+# Serialized deck: version, card count, then every array's raw items
+DECK_VERSION = 1
+DECK_HEADER = struct.Struct("<BI")
+DECK_ARRAYS = ("card_ids", "due", "interval", "ease", "reps", "lapses", "heap", "pos", "_sorted_ids", "_sorted_slots")
+
+
+def now_minutes() -> int:
+    return int(time.time() // 60)
+
+
+class Deck:
+    # One user's cards in parallel typed arrays (34 bytes per card)
+    # with an indexed binary min-heap over due time. The heap stores slots
+    # and `pos` maps slot -> heap position, so rescheduling a card is a
+    # sift in place rather than a push of a new entry.
+    def __init__(self):
+        self.card_ids = array("i")
+        self.due = array("I")         # minutes since the epoch
+        self.interval = array("f")    # days
+        self.ease = array("H")        # ease factor x 1000
+        self.reps = array("H")
+        self.lapses = array("H")
+        self.heap = array("i")        # slots ordered by due
+        self.pos = array("i")         # slot -> index in heap
+        self._sorted_ids = array("i") # card ids, sorted, for lookup
+        self._sorted_slots = array("i")
+
+    def __len__(self) -> int:
+        return len(self.card_ids)
+
+    def to_bytes(self) -> bytes:
+        return DECK_HEADER.pack(DECK_VERSION, len(self.card_ids)) + b"".join(
+            getattr(self, name).tobytes() for name in DECK_ARRAYS
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Deck":
+        version, count = DECK_HEADER.unpack_from(data, 0)
+        if version != DECK_VERSION:
+            raise ValueError(f"Unsupported deck version {version}")
+        deck = cls()
+        offset = DECK_HEADER.size
+        for name in DECK_ARRAYS:
+            column = getattr(deck, name)
+            end = offset + count * column.itemsize
+            column.frombytes(data[offset:end])
+            offset = end
+        return deck
+
+    def slot_of(self, card_id: int) -> Optional[int]:
+        i = bisect_left(self._sorted_ids, card_id)
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == card_id:
+            return self._sorted_slots[i]
+        return None
+
+    def add(self, card_id: int, due: int) -> bool:
+        if self.slot_of(card_id) is not None:
+            return False
+        slot = len(self.card_ids)
+        self.card_ids.append(card_id)
+        self.due.append(due)
+        self.interval.append(0.0)
+        self.ease.append(2500)
+        self.reps.append(0)
+        self.lapses.append(0)
+        i = bisect_left(self._sorted_ids, card_id)
+        self._sorted_ids.insert(i, card_id)
+        self._sorted_slots.insert(i, slot)
+        self.pos.append(len(self.heap))
+        self.heap.append(slot)
+        self._sift_up(len(self.heap) - 1)
+        return True
+
+    def next_due(self) -> Optional[int]:
+        return self.due[self.heap[0]] if self.heap else None
+
+    def review(self, card_id: int, quality: int, now: int) -> int:
+        # SM-2: quality 0-5, below 3 counts as a lapse
+        slot = self.slot_of(card_id)
+        if slot is None:
+            raise KeyError(card_id)
+        quality = max(0, min(5, quality))
+        ease = self.ease[slot] / 1000
+        if quality < 3:
+            self.reps[slot] = 0
+            self.lapses[slot] = min(self.lapses[slot] + 1, 0xFFFF)
+            interval = 1.0
+        else:
+            reps = self.reps[slot] = min(self.reps[slot] + 1, 0xFFFF)
+            if reps == 1:
+                interval = 1.0
+            elif reps == 2:
+                interval = 6.0
+            else:
+                interval = round(self.interval[slot] * ease, 1)
+        ease += 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+        self.ease[slot] = int(max(1.3, ease) * 1000)
+        self.interval[slot] = interval
+        old_due = self.due[slot]
+        self.due[slot] = now + int(interval * MINUTES_PER_DAY)
+        index = self.pos[slot]
+        if self.due[slot] < old_due:
+            self._sift_up(index)
+        else:
+            self._sift_down(index)
+        return self.due[slot]
+
+    def due_cards(self, now: int, k: int) -> List[int]:
+        # Best-first walk of the heap: only children of emitted nodes are
+        # examined, so this is O(k log k) and never touches later cards
+        result = []
+        if not self.heap or self.due[self.heap[0]] > now:
+            return result
+        frontier = [(self.due[self.heap[0]], 0)]
+        while frontier and len(result) < k:
+            due, index = heapq.heappop(frontier)
+            if due > now:
+                break
+            result.append(self.card_ids[self.heap[index]])
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(self.heap):
+                    heapq.heappush(frontier, (self.due[self.heap[child]], child))
+        return result
+
+    def count_due(self, now: int) -> int:
+        return len(self.due_cards(now, len(self.heap)))
+
+    def _swap(self, i: int, j: int):
+        heap, pos = self.heap, self.pos
+        heap[i], heap[j] = heap[j], heap[i]
+        pos[heap[i]] = i
+        pos[heap[j]] = j
+
+    def _sift_up(self, i: int):
+        heap, due = self.heap, self.due
+        while i > 0:
+            parent = (i - 1) >> 1
+            if due[heap[i]] >= due[heap[parent]]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i: int):
+        heap, due = self.heap, self.due
+        n = len(heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and due[heap[child]] < due[heap[smallest]]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+
+class SRSEngine:
+    # Decks are stored through the Database (one blob per user, written
+    # behind like other user state) and the most recently used
+    # SRS_MAX_DECKS are kept in memory. Each stored deck carries the minute
+    # its owner should next be reminded: its earliest due card, but never
+    # within remind_after of the user's last practice, so a user is nudged
+    # at most once a day. sweep_due_users() claims the users whose time has
+    # come and re-arms them for the next day. Reviews only mark the deck
+    # dirty; each dirty deck is serialised once per flush_interval, and
+    # only clean decks are dropped from memory.
+    def __init__(self, db: Optional[Database] = None, max_decks: Optional[int] = None,
+                 remind_after: int = MINUTES_PER_DAY, flush_interval: Optional[float] = None):
+        self.db = db or Database()
+        self.max_decks = max_decks or Config.SRS_MAX_DECKS
+        self.remind_after = remind_after
+        self.flush_interval = Config.SRS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._decks: "OrderedDict[int, Deck]" = OrderedDict()
+        # Earliest reminder minute of each deck changed since the last flush
+        self._dirty: Dict[int, int] = {}
+        # Decks being written by the running flush, also kept in memory
+        self._saving: Dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.saves = 0
+
+    def __len__(self) -> int:
+        return len(self._decks)
+
+    def start(self):
+        if self._flush_task is None and self.flush_interval > 0:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("SRS deck flush failed")
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            self._saving, self._dirty = self._dirty, {}
+            try:
+                for user_id, remind_after in self._saving.items():
+                    deck = self._decks[user_id]
+                    await self.db.save_deck(user_id, deck.to_bytes(), max(deck.next_due(), remind_after))
+            except BaseException:
+                # Changed again meanwhile keeps the later reminder floor
+                for user_id, remind_after in self._saving.items():
+                    self._dirty.setdefault(user_id, remind_after)
+                raise
+            finally:
+                saved, self._saving = len(self._saving), {}
+            self.saves += saved
+            self._trim()
+            return saved
+
+    def _trim(self):
+        # Least recently used clean decks first; dirty ones wait for a flush
+        excess = len(self._decks) - self.max_decks
+        if excess <= 0:
+            return
+        victims = []
+        for user_id in self._decks:
+            if len(victims) == excess:
+                break
+            if user_id not in self._dirty and user_id not in self._saving:
+                victims.append(user_id)
+        for user_id in victims:
+            del self._decks[user_id]
+
+    async def deck(self, user_id: int) -> Deck:
+        deck = self._decks.get(user_id)
+        if deck is not None:
+            self._decks.move_to_end(user_id)
+            return deck
+        data = await self.db.load_deck(user_id)
+        self.loads += 1
+        # Another coroutine may have loaded it meanwhile
+        deck = self._decks.get(user_id)
+        if deck is None:
+            deck = Deck.from_bytes(data) if data is not None else Deck()
+            self._decks[user_id] = deck
+            self._trim()
+        return deck
+
+    def _changed(self, user_id: int, now: int):
+        # O(1): the deck is serialised by the next flush
+        self._dirty[user_id] = now + self.remind_after
+
+    async def add_cards(self, user_id: int, card_ids: Iterable[int], now: Optional[int] = None) -> int:
+        now = now_minutes() if now is None else now
+        deck = await self.deck(user_id)
+        added = sum(deck.add(card_id, now) for card_id in card_ids)
+        if added:
+            self._changed(user_id, now)
+        return added
+
+    async def review(self, user_id: int, card_id: int, quality: int, now: Optional[int] = None) -> int:
+        now = now_minutes() if now is None else now
+        deck = await self.deck(user_id)
+        due = deck.review(card_id, quality, now)
+        self._changed(user_id, now)
+        return due
+
+    async def due_cards(self, user_id: int, k: int, now: Optional[int] = None) -> List[int]:
+        deck = await self.deck(user_id)
+        return deck.due_cards(now_minutes() if now is None else now, k)
+
+    async def sweep_due_users(self, now: Optional[int] = None, limit: int = 1000) -> List[int]:
+        # Up to `limit` users (of this shard) to push today's reviews to,
+        # each re-armed for a day later in case they do not review
+        now = now_minutes() if now is None else now
+        await self.flush()
+        return await self.db.claim_deck_reminders(now, now + self.remind_after, limit)
@@ -0,0 +1,81 @@
+import io
+import time
+from tempfile import NamedTemporaryFile
+from typing import Dict, Optional
+
+from config import Config
+from src.media.pipeline import MediaPipeline
+
+
+def otsu_threshold(histogram) -> int:
+    # Threshold maximising between-class variance of a 256-bin histogram
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_threshold, best_variance = 127, -1.0
+    for threshold, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += threshold * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return best_threshold
+
+
+def preprocess_image(path: str, max_side: int = 1600) -> Dict:
+    # Runs in a worker process: decode, normalise orientation and size,
+    # binarise for OCR. Returns a compact 1-bit PNG plus a few measurements.
+    from PIL import Image, ImageOps
+
+    started = time.perf_counter()
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        original_size = image.size
+        image = image.convert("L")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        image = ImageOps.autocontrast(image, cutoff=1)
+        threshold = otsu_threshold(image.histogram())
+        binary = image.point(lambda value: 255 if value > threshold else 0, mode="1")
+        ink = binary.histogram()[0]
+        out = io.BytesIO()
+        binary.save(out, format="PNG", optimize=True)
+    return {
+        "original_size": original_size,
+        "size": binary.size,
+        "threshold": threshold,
+        "ink_ratio": ink / (binary.size[0] * binary.size[1]),
+        "image": out.getvalue(),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+class PhotoPipeline(MediaPipeline):
+    # Download to a temp file -> preprocess_image reads it in a worker, so
+    # only the path crosses the process boundary
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None,
+                 cache_size: Optional[int] = None):
+        super().__init__(
+            workers=workers or Config.PHOTO_WORKERS,
+            max_queue=max_queue or Config.PHOTO_MAX_QUEUE,
+            cache_size=cache_size or Config.PHOTO_CACHE_SIZE,
+            max_bytes=Config.PHOTO_MAX_BYTES
+        )
+
+    async def _run(self, photo) -> Dict:
+        started = time.perf_counter()
+        telegram_file = await photo.get_file()
+        with NamedTemporaryFile(suffix=".jpg") as out:
+            await self.download(telegram_file, out)
+            out.flush()
+            downloaded = time.perf_counter()
+            result = await self.run_in_worker(preprocess_image, out.name)
+        result["download_seconds"] = downloaded - started
+        result["total_seconds"] = time.perf_counter() - started
+        return result
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK = 64 * 1024
+
+
+class PipelineBusy(Exception):
+    # Raised instead of queueing when the pipeline is at capacity
+    pass
+
+
+class MediaTooLarge(ValueError):
+    # The download passed the pipeline's max_bytes
+    pass
+
+
+class MediaPipeline:
+    # Shared plumbing for Telegram media jobs. Work runs in a process pool.
+    # At most max_queue jobs are admitted (running or waiting); beyond that
+    # process() raises PipelineBusy right away. Results are cached by
+    # Telegram's file_unique_id, which is stable across forwards and resends,
+    # and concurrent requests for the same file share one job.
+    # Subclasses implement _run(media).
+    def __init__(self, workers: int, max_queue: int, cache_size: int, max_bytes: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.cache_size = cache_size
+        self.max_bytes = max_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._completions: Deque[float] = deque(maxlen=1000)
+        self.pending = 0
+        self.running = 0
+        self.processed = 0
+        self.cache_hits = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._slots = asyncio.Semaphore(self.workers)
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0))
+
+    async def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def process(self, media) -> Dict:
+        key = media.file_unique_id
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return cached
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.cache_hits += 1
+            return await asyncio.shield(pending)
+
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            raise PipelineBusy()
+
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.pending += 1
+        try:
+            result = await self._run(media)
+            self.processed += 1
+            self._completions.append(time.monotonic())
+            self._remember(key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.failed += 1
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self.pending -= 1
+            del self._inflight[key]
+
+    async def _run(self, media) -> Dict:
+        raise NotImplementedError
+
+    async def run_in_worker(self, func, *args):
+        # Waits for a free worker slot, so queue depth is visible in stats()
+        async with self._slots:
+            self.running += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            finally:
+                self.running -= 1
+
+    async def download(self, telegram_file, out):
+        # Stream the body in chunks so large files never sit whole in memory
+        # while downloading; files served from local Bot API mode are copied
+        if (getattr(telegram_file, "file_size", None) or 0) > self.max_bytes:
+            raise MediaTooLarge("file too large")
+        url = telegram_file.file_path or ""
+        if not url.startswith("http"):
+            await telegram_file.download_to_memory(out=out)
+            return
+        size = 0
+        async with self._http.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise MediaTooLarge("file too large")
+                out.write(chunk)
+
+    def _remember(self, key: str, result: Dict):
+        self._cache[key] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        recent = sum(1 for finished in self._completions if now - finished <= 60)
+        return {
+            "queue_depth": self.pending - self.running,
+            "running": self.running,
+            "processed": self.processed,
+            "cache_hits": self.cache_hits,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "throughput_per_min": recent,
+        }
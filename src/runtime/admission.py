@@ -0,0 +1,156 @@
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from config import Config
+from src.database.models import Database
+from src.runtime.metrics import ADMISSION
+
+
+class Overloaded(Exception):
+    # Refused by admission control: reason is "rate" (the user's bucket is
+    # empty) or "busy" (no LLM slot in time). Callers degrade to cached or
+    # offline content instead of waiting.
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TierPolicy:
+    # Limits for one subscription tier. aging is added to the arrival time
+    # to form the LLM slot priority (smaller first), as in
+    # UserOrderedUpdateProcessor; max_waiting sheds new requests of the
+    # tier once that many are already queued for a slot (0: never).
+    __slots__ = ("name", "lesson_limit", "rate", "burst", "aging", "max_wait", "max_waiting")
+
+    def __init__(self, name: str, lesson_limit: int, rate: float, burst: float,
+                 aging: float, max_wait: float, max_waiting: int):
+        self.name = name
+        self.lesson_limit = lesson_limit
+        self.rate = rate
+        self.burst = burst
+        self.aging = aging
+        self.max_wait = max_wait
+        self.max_waiting = max_waiting
+
+
+def default_policies() -> Dict[str, TierPolicy]:
+    return {
+        "free": TierPolicy(
+            "free", Config.DAILY_LESSON_LIMIT_FREE, Config.AI_RATE_FREE, Config.AI_BURST_FREE,
+            Config.AI_AGING_FREE, Config.AI_MAX_WAIT_FREE, Config.AI_MAX_WAITING_FREE
+        ),
+        "premium": TierPolicy(
+            "premium", Config.DAILY_LESSON_LIMIT_PREMIUM, Config.AI_RATE_PREMIUM, Config.AI_BURST_PREMIUM,
+            0.0, Config.AI_MAX_WAIT_PREMIUM, 0
+        ),
+    }
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+    def refill(self, rate: float, burst: float, now: float):
+        # Refilled lazily from the time since the last call
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float) -> bool:
+        self.refill(rate, burst, now)
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def delay(self, rate: float, burst: float, now: float) -> float:
+        # Seconds until take() would succeed; a negative balance (a penalty)
+        # has to be earned back first
+        self.refill(rate, burst, now)
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / rate
+
+
+class RateLimiter:
+    # One token bucket per user, in an OrderedDict ordered by last use. A
+    # bucket left alone long enough to refill completely is the same as no
+    # bucket, so idle ones are dropped from the front lazily; max_users
+    # bounds memory under a flood of distinct users.
+    def __init__(self, policies: Dict[str, TierPolicy], max_users: Optional[int] = None):
+        self.max_users = max_users or Config.RATE_LIMIT_MAX_USERS
+        self.idle_after = max(policy.burst / policy.rate for policy in policies.values())
+        self._buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, user_id: int, policy: TierPolicy, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return self.bucket(user_id, policy, now).take(policy.rate, policy.burst, now)
+
+    def bucket(self, key: int, policy: TierPolicy, now: float) -> TokenBucket:
+        # The key's bucket, created full and marked as just used
+        self._evict(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(policy.burst, now)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            user_id, oldest = next(iter(buckets.items()))
+            if now - oldest.updated < self.idle_after and len(buckets) <= self.max_users:
+                break
+            del buckets[user_id]
+
+
+class AdmissionControl:
+    # Per-request checks keyed on User.subscription, all O(1):
+    #   take_lesson: DAILY_LESSON_LIMIT_* per day, counted on the user's
+    #                stats row and reset lazily on the first lesson of a
+    #                new day, so there is no midnight sweep
+    #   admit_ai:    token bucket per user for LLM calls; returns the tier
+    #                policy that AIClient uses for slot priority
+    def __init__(self, db: Database, policies: Optional[Dict[str, TierPolicy]] = None):
+        self.db = db
+        self.policies = policies or default_policies()
+        self.limiter = RateLimiter(self.policies)
+
+    async def policy(self, user_id: int) -> TierPolicy:
+        user = await self.db.get_user(user_id)
+        tier = user.subscription if user is not None else "free"
+        return self.policies.get(tier, self.policies["free"])
+
+    async def take_lesson(self, user_id: int) -> Tuple[bool, int]:
+        # (allowed, lessons left today)
+        policy = await self.policy(user_id)
+        stats = await self.db.get_user_stats(user_id)
+        if stats is None:
+            return True, policy.lesson_limit
+        today = date.today().toordinal()
+        used = stats.lessons_today if stats.lesson_day == today else 0
+        if used >= policy.lesson_limit:
+            ADMISSION.inc(tier=policy.name, outcome="lesson_limit")
+            return False, 0
+        await self.db.update_user_stats(user_id, {"lesson_day": today, "lessons_today": used + 1})
+        return True, policy.lesson_limit - used - 1
+
+    async def refund_lesson(self, user_id: int):
+        # Give back a lesson taken for content that could not be served
+        stats = await self.db.get_user_stats(user_id)
+        if stats is not None and stats.lesson_day == date.today().toordinal() and stats.lessons_today > 0:
+            await self.db.update_user_stats(user_id, {"lessons_today": stats.lessons_today - 1})
+
+    async def admit_ai(self, user_id: int) -> TierPolicy:
+        policy = await self.policy(user_id)
+        if not self.limiter.allow(user_id, policy):
+            ADMISSION.inc(tier=policy.name, outcome="rate")
+            raise Overloaded("rate")
+        ADMISSION.inc(tier=policy.name, outcome="admitted")
+        return policy
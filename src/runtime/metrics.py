@@ -0,0 +1,235 @@
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def lines(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.lines())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def lines(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def lines(self) -> Iterable[str]:
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(self._sums[key])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CallbackMetric(Metric):
+    # Read at scrape time from a callback returning {label values: value};
+    # used for state that already lives elsewhere (queue sizes, cache stats)
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Labels, float]]):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def lines(self) -> Iterable[str]:
+        for key, value in self.callback().items():
+            if not isinstance(key, tuple):
+                key = (key,)
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        # Re-registering a name replaces the old metric (e.g. a rebuilt bot)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def gauge_callback(self, name: str, help: str, labelnames: Sequence[str], callback,
+                       kind: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, kind, labelnames, callback))
+
+    def render(self) -> str:
+        parts = []
+        for metric in self._metrics.values():
+            try:
+                parts.append(metric.render())
+            except Exception:
+                logger.exception("Failed to collect metric %s", metric.name)
+        return "".join(parts)
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.register(Histogram(
+    "bot_handler_duration_seconds", "Handler latency", ["handler"]
+))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    "bot_handler_errors_total", "Handler calls that raised", ["handler"]
+))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    "bot_llm_requests_total", "LLM API attempts by outcome (ok, retry, error, cancelled)", ["outcome"]
+))
+LLM_LATENCY = REGISTRY.register(Histogram(
+    "bot_llm_request_duration_seconds", "LLM API attempt latency", ["outcome"]
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "bot_llm_tokens_total", "Tokens reported by the LLM API", ["kind"]
+))
+LLM_FIRST_TOKEN = REGISTRY.register(Histogram(
+    "bot_llm_first_token_seconds", "Time from a streaming LLM request to its first content token"
+))
+STREAMED_REPLIES = REGISTRY.register(Counter(
+    "bot_streamed_replies_total", "Streamed tutor answers by outcome (done, stopped)", ["outcome"]
+))
+STREAM_EDITS = REGISTRY.register(Counter(
+    "bot_stream_edits_total", "Message edits made while streaming answers"
+))
+ADMISSION = REGISTRY.register(Counter(
+    "bot_admission_total", "Admission decisions by tier and outcome (admitted, rate, busy, lesson_limit)",
+    ["tier", "outcome"]
+))
+OUTBOUND = REGISTRY.register(Counter(
+    "bot_outbound_requests_total", "Bot API calls to chats by kind (reply, bulk) and outcome (sent, flood_wait, error)",
+    ["kind", "outcome"]
+))
+OUTBOUND_WAIT = REGISTRY.register(Histogram(
+    "bot_outbound_wait_seconds", "Time Bot API calls waited for the send rate limits", ["kind"]
+))
+SHARD_ROUTED = REGISTRY.register(Counter(
+    "bot_shard_updates_total", "Updates routed to each shard worker", ["shard"]
+))
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop woke a periodic timer", buckets=LAG_BUCKETS
+))
+
+
+def timed(callback, name: Optional[str] = None):
+    # Wrap a PTB handler callback with latency/error metrics and slow-call
+    # reporting from the sampling profiler
+    from src.runtime.profiler import PROFILER
+
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_LATENCY.observe(elapsed, handler=name)
+            if elapsed >= Config.SLOW_HANDLER_SECONDS:
+                PROFILER.report_slow(name, started, elapsed)
+
+    return wrapper
+
+
+async def monitor_event_loop(interval: float):
+    # A timer that should fire every `interval`; anything later is time the
+    # loop spent running other callbacks (i.e. blocking work)
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - expected))
@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from telegram import Bot, Message
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+from config import Config
+from src.database.models import Database, UserProgress, UserStats
+from src.runtime.admission import RateLimiter, TierPolicy, TokenBucket
+from src.runtime.metrics import OUTBOUND, OUTBOUND_WAIT, STREAM_EDITS, STREAMED_REPLIES
+
+logger = logging.getLogger(__name__)
+
+
+def _policy(name: str, rate: float, burst: float) -> TierPolicy:
+    return TierPolicy(name, 0, rate, burst, 0.0, 0.0, 0)
+
+
+class OutboundLimiter(BaseRateLimiter[Dict]):
+    # Sits in ExtBot's request path, so replies, edits, notifications and
+    # broadcasts share one budget. Calls that target a chat take a token
+    # from each of:
+    #   global: Telegram's ~30 messages/s per bot (0 disables it)
+    #   chat:   ~1/s in private chats, 20/min in groups, with a small burst
+    #   bulk:   only for rate_limit_args={"bulk": True}; broadcasts get at
+    #           most BROADCAST_RATE of the global rate, so replies keep
+    #           headroom during a broadcast
+    # On RetryAfter the chat's bucket is pushed back by retry_after, the
+    # global bucket is drained, and the call is retried up to max_retries
+    # times.
+    def __init__(self, global_rate: Optional[float] = None, chat_rate: Optional[float] = None,
+                 group_rate: Optional[float] = None, chat_burst: Optional[float] = None,
+                 bulk_rate: Optional[float] = None, max_retries: Optional[int] = None):
+        self.global_rate = Config.SEND_RATE_GLOBAL if global_rate is None else global_rate
+        self.bulk_rate = Config.BROADCAST_RATE if bulk_rate is None else bulk_rate
+        self.max_retries = Config.SEND_MAX_RETRIES if max_retries is None else max_retries
+        burst = chat_burst or Config.SEND_BURST_CHAT
+        self.private = _policy("private", chat_rate or Config.SEND_RATE_CHAT, burst)
+        self.group = _policy("group", group_rate or Config.SEND_RATE_GROUP, burst)
+        self.chats = RateLimiter({"private": self.private, "group": self.group})
+        # No burst for the bot-wide buckets: sends are spaced evenly, so no
+        # one-second window holds more than rate + 1 of them
+        now = time.monotonic()
+        self._global = TokenBucket(1.0, now)
+        self._bulk = TokenBucket(1.0, now)
+        self.waiting = 0
+        self.flood_waits = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_policy(self, chat_id: Any) -> TierPolicy:
+        # Group and channel ids are negative; "@channel" names count as groups
+        return self.private if isinstance(chat_id, int) and chat_id > 0 else self.group
+
+    async def _acquire(self, chat_id: Any, bulk: bool) -> TokenBucket:
+        # All buckets must have a token at the same moment; otherwise sleep
+        # for the longest wait and look again
+        policy = self._chat_policy(chat_id)
+        key = chat_id if isinstance(chat_id, int) else hash(chat_id)
+        self.waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                chat = self.chats.bucket(key, policy, now)
+                delay = chat.delay(policy.rate, policy.burst, now)
+                if self.global_rate:
+                    delay = max(delay, self._global.delay(self.global_rate, 1.0, now))
+                if bulk and self.bulk_rate:
+                    delay = max(delay, self._bulk.delay(self.bulk_rate, 1.0, now))
+                if delay <= 0:
+                    chat.tokens -= 1.0
+                    if self.global_rate:
+                        self._global.tokens -= 1.0
+                    if bulk and self.bulk_rate:
+                        self._bulk.tokens -= 1.0
+                    return chat
+                await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+
+    async def process_request(self, callback: Callable[..., Awaitable], args: Any, kwargs: Dict[str, Any],
+                              endpoint: str, data: Dict[str, Any], rate_limit_args: Optional[Dict]):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # getFile, answerCallbackQuery, ...: not message limits
+            return await callback(*args, **kwargs)
+        if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+            chat_id = int(chat_id)
+        bulk = bool(rate_limit_args and rate_limit_args.get("bulk"))
+        kind = "bulk" if bulk else "reply"
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            chat = await self._acquire(chat_id, bulk)
+            OUTBOUND_WAIT.observe(time.monotonic() - started, kind=kind)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.flood_waits += 1
+                OUTBOUND.inc(kind=kind, outcome="flood_wait")
+                if attempt == self.max_retries:
+                    raise
+                chat.tokens = -float(e.retry_after) * self._chat_policy(chat_id).rate
+                self._global.tokens = min(self._global.tokens, 0.0)
+                logger.debug("Flood wait %ss on %s to %s", e.retry_after, endpoint, chat_id)
+                continue
+            except TelegramError:
+                OUTBOUND.inc(kind=kind, outcome="error")
+                raise
+            OUTBOUND.inc(kind=kind, outcome="sent")
+            return result
+
+    def stats(self) -> Dict:
+        return {"waiting": self.waiting, "chats": len(self.chats), "flood_waits": self.flood_waits}
+
+
+async def replace_placeholder(placeholder: Message, text: str, **kwargs) -> Message:
+    # Turn a "working on it" message into the final answer with one edit.
+    # A new message is sent only when the edit is impossible (too long, or
+    # the placeholder was deleted).
+    if len(text) <= MessageLimit.MAX_TEXT_LENGTH:
+        try:
+            return await placeholder.edit_text(text, **kwargs)
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return placeholder
+            logger.debug("Editing placeholder failed (%s), sending instead", e)
+    return await placeholder.get_bot().send_message(placeholder.chat_id, text, **kwargs)
+
+
+# Shown at the end of a message while its text is still growing
+STREAM_CURSOR = " ▌"
+STREAM_STOPPED = "\n\n⏹ Stopped - reading your new message."
+STREAM_FAILED = "\n\n⚠️ The answer was cut off - please ask again."
+
+
+class StreamInterrupted(Exception):
+    # Raised by a delta stream that fails after yielding some text, so the
+    # reply is finished as cut short instead of looking complete
+    pass
+
+
+def split_point(text: str, limit: int) -> int:
+    # Where to cut text longer than one message: the last paragraph break,
+    # else line break, else space in the second half of the limit
+    for separator in ("\n\n", "\n", " "):
+        cut = text.rfind(separator, limit // 2, limit)
+        if cut != -1:
+            return cut + len(separator)
+    return limit
+
+
+class StreamingReply:
+    # Writes an answer that arrives as text deltas into a reply to
+    # `message`. The reply is sent as soon as the first delta arrives and
+    # then edited with everything received so far, at most once per
+    # `interval` seconds: deltas arriving in between are coalesced into the
+    # next edit, and a slow edit never holds up reading the stream. Edits
+    # still pass OutboundLimiter's per-chat bucket. Text beyond one
+    # message's limit continues in a new message.
+    def __init__(self, message: Message, interval: Optional[float] = None):
+        self.message = message
+        self.interval = Config.STREAM_EDIT_INTERVAL if interval is None else interval
+        self.text = ""
+        self.sent: Optional[Message] = None  # message currently being written
+        self.shown = ""  # its text as last sent
+        self.offset = 0  # where its text starts in self.text
+        self.messages = 0
+        self.edits = 0
+        self.started = time.monotonic()
+        self.first_delta: Optional[float] = None  # seconds after started
+        self.first_shown: Optional[float] = None
+        self._dirty = asyncio.Event()
+        self._closed = asyncio.Event()
+
+    async def run(self, deltas: AsyncIterator[str]):
+        # Consume the stream and finish the message. Cancelling run() closes
+        # `deltas` (and with it the upstream request); call stop() afterwards
+        # to mark the partial answer as such.
+        writer = asyncio.create_task(self._write())
+        interrupted = False
+        try:
+            async with aclosing(deltas):
+                async for delta in deltas:
+                    if self.first_delta is None:
+                        self.first_delta = time.monotonic() - self.started
+                    self.text += delta
+                    self._dirty.set()
+        except StreamInterrupted as e:
+            logger.debug("Stream interrupted: %s", e)
+            interrupted = True
+        finally:
+            # Let an edit in progress finish rather than cancel it, so the
+            # final render cannot race it or send a duplicate message
+            self._closed.set()
+            self._dirty.set()
+            await writer
+        await self._render(final=True, suffix=STREAM_FAILED if interrupted else "")
+        STREAMED_REPLIES.inc(outcome="failed" if interrupted else "done")
+
+    async def stop(self):
+        if self.text:
+            await self._render(final=True, suffix=STREAM_STOPPED)
+        STREAMED_REPLIES.inc(outcome="stopped")
+
+    async def _write(self):
+        last = 0.0
+        while True:
+            await self._dirty.wait()
+            if self._closed.is_set():
+                return
+            wait = last + self.interval - time.monotonic()
+            if self.sent is not None and wait > 0:
+                try:
+                    await asyncio.wait_for(self._closed.wait(), wait)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+            self._dirty.clear()
+            try:
+                await self._render(final=False)
+            except TelegramError as e:
+                logger.debug("Streaming edit failed: %s", e)
+            last = time.monotonic()
+
+    async def _render(self, final: bool, suffix: str = ""):
+        limit = MessageLimit.MAX_TEXT_LENGTH - max(len(STREAM_CURSOR), len(suffix))
+        while len(self.text) - self.offset > limit:
+            # Close the current message at a clean break, go on in a new one
+            body = self.text[self.offset:]
+            cut = split_point(body, limit)
+            await self._show(body[:cut])
+            self.offset += cut
+            self.sent = None
+            self.shown = ""
+        body = self.text[self.offset:]
+        if body:
+            await self._show(body + (suffix if final else STREAM_CURSOR))
+
+    async def _show(self, text: str):
+        if text == self.shown:
+            return
+        if self.sent is None:
+            self.sent = await self.message.reply_text(text)
+            self.messages += 1
+            if self.first_shown is None:
+                self.first_shown = time.monotonic() - self.started
+        else:
+            self.sent = await replace_placeholder(self.sent, text)
+            self.edits += 1
+            STREAM_EDITS.inc()
+        self.shown = text
+
+
+class BroadcastReport:
+    __slots__ = ("sent", "skipped", "blocked", "failed", "elapsed")
+
+    def __init__(self):
+        self.sent = 0
+        self.skipped = 0  # render() returned None
+        self.blocked = 0  # the user blocked the bot
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "sent": self.sent, "skipped": self.skipped, "blocked": self.blocked, "failed": self.failed,
+            "elapsed": round(self.elapsed, 2), "rate": round(self.rate, 1),
+        }
+
+
+# render(stats, progress) -> send_message kwargs (text, reply_markup, ...)
+# or None to skip the user
+Renderer = Callable[[UserStats, UserProgress], Optional[Dict]]
+
+
+class Broadcaster:
+    # Sends one message to every user of the database (of this shard, when
+    # sharded). Users are streamed with iter_user_states, so memory stays
+    # flat; at most `concurrency` sends are in flight and the pace comes
+    # from OutboundLimiter's bulk bucket. Flood waits are retried there.
+    def __init__(self, bot: Bot, db: Database, concurrency: Optional[int] = None,
+                 chunk_size: Optional[int] = None):
+        self.bot = bot
+        self.db = db
+        self.concurrency = concurrency or Config.BROADCAST_CONCURRENCY
+        self.chunk_size = chunk_size or Config.BROADCAST_CHUNK_SIZE
+
+    async def broadcast(self, render: Renderer, progress_every: float = 30.0) -> BroadcastReport:
+        async def messages():
+            async for chunk in self.db.iter_user_states(self.chunk_size):
+                for stats, progress in chunk:
+                    yield stats.user_id, render(stats, progress)
+
+        return await self._send_all(messages(), progress_every)
+
+    async def send_to(self, user_ids: Iterable[int], message: Dict) -> BroadcastReport:
+        # The same message to a known set of users (e.g. due reminders), at
+        # the broadcast pace
+        async def messages():
+            for user_id in user_ids:
+                yield user_id, message
+
+        return await self._send_all(messages())
+
+    async def _send_all(self, messages: AsyncIterator[Tuple[int, Optional[Dict]]],
+                        progress_every: float = 30.0) -> BroadcastReport:
+        report = BroadcastReport()
+        slots = asyncio.Semaphore(self.concurrency)
+        in_flight: Set[asyncio.Task] = set()
+        started = time.monotonic()
+        next_progress = started + progress_every
+
+        async def send(chat_id: int, message: Dict):
+            try:
+                await self.bot.send_message(chat_id=chat_id, rate_limit_args={"bulk": True}, **message)
+                report.sent += 1
+            except Forbidden:
+                report.blocked += 1
+            except TelegramError as e:
+                logger.debug("Broadcast to %s failed: %s", chat_id, e)
+                report.failed += 1
+            finally:
+                slots.release()
+
+        try:
+            async with aclosing(messages):
+                async for chat_id, message in messages:
+                    if message is None:
+                        report.skipped += 1
+                        continue
+                    await slots.acquire()
+                    task = asyncio.create_task(send(chat_id, message))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+                    if time.monotonic() >= next_progress:
+                        report.elapsed = time.monotonic() - started
+                        logger.info("Broadcast progress: %s", report.to_dict())
+                        next_progress += progress_every
+            if in_flight:
+                await asyncio.gather(*in_flight)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            report.elapsed = time.monotonic() - started
+        return report
@@ -0,0 +1,98 @@
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MAX_DEPTH = 64
+
+
+class SamplingProfiler:
+    # Stdlib sampling profiler for the event-loop thread. A daemon thread
+    # snapshots the loop thread's stack every `interval` seconds while
+    # enabled; samples are kept in a bounded ring with their timestamps.
+    # Stacks are rendered in the folded "a;b;c count" format that
+    # flamegraph.pl and speedscope read. Off by default and toggled at
+    # runtime (see the /debug/profiler endpoint), so it costs nothing
+    # unless someone is looking.
+    def __init__(self, interval: Optional[float] = None, max_samples: int = 100_000):
+        self.interval = interval or Config.PROFILER_INTERVAL
+        self._samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=max_samples)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._target: Optional[int] = None
+        self.started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, thread_id: Optional[int] = None):
+        # Call from the event-loop thread, or pass its id
+        if self.running:
+            return
+        self._target = thread_id or threading.get_ident()
+        self._samples.clear()
+        self._stop.clear()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info("Sampling profiler started (every %.1f ms)", self.interval * 1000)
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("Sampling profiler stopped (%d samples)", len(self._samples))
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self._samples.append((time.perf_counter(), tuple(reversed(stack))))
+
+    def stacks(self, since: float = 0.0, until: float = float("inf")) -> Counter:
+        return Counter(stack for at, stack in list(self._samples) if since <= at <= until)
+
+    def folded(self, since: float = 0.0, until: float = float("inf")) -> str:
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.stacks(since, until).most_common()
+        )
+
+    def report_slow(self, name: str, started: float, elapsed: float):
+        # Log what the loop thread was doing while a slow handler ran
+        if not self.running:
+            return
+        stacks = self.stacks(started, started + elapsed)
+        total = sum(stacks.values())
+        if not total:
+            return
+        top = "\n".join(
+            f"  {count / total:5.1%}  {stack[-1]}  <- {' <- '.join(reversed(stack[-4:-1]))}"
+            for stack, count in stacks.most_common(5)
+        )
+        logger.warning("Slow handler %s took %.2fs; loop thread samples:\n%s", name, elapsed, top)
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": len(self._samples),
+            "seconds": time.perf_counter() - self.started_at if self.started_at else 0.0,
+        }
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram.ext import BaseUpdateProcessor
+
+# Priority classes for updates; lower runs first
+PRIORITY_FAST = 0      # cheap lookups: /profile, /stats, /leaderboard
+PRIORITY_NORMAL = 1    # media and anything unclassified
+PRIORITY_SLOW = 2      # AI-backed replies
+
+
+class PrioritySemaphore:
+    # Semaphore whose waiters are woken smallest key first (FIFO among equal
+    # keys). Cancelled waiters are dropped lazily when they reach the top.
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, key: float = 0.0, timeout: Optional[float] = None):
+        # The waiter is queued before the first suspension, so `waiting` is
+        # accurate even for acquires started in the same tick. On timeout
+        # asyncio.TimeoutError is raised and the waiter is dropped.
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (key, next(self._counter), future))
+        try:
+            if timeout is None:
+                await future
+            else:
+                await asyncio.wait_for(future, timeout)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Woken and cancelled in the same tick: hand the slot on
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+    def slot(self, key: float = 0.0) -> "_Slot":
+        return _Slot(self, key)
+
+
+class _Slot:
+    __slots__ = ("semaphore", "key")
+
+    def __init__(self, semaphore: PrioritySemaphore, key: float):
+        self.semaphore = semaphore
+        self.key = key
+
+    async def __aenter__(self):
+        await self.semaphore.acquire(self.key)
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    # Runs updates concurrently on at most `workers` handlers while keeping
+    # each user's updates in arrival order.
+    #
+    # Ordering: every update joins its user's lane synchronously on entry
+    # (PTB starts update tasks in arrival order) and waits for the previous
+    # update of that user to finish. A lane is just the tail future of that
+    # chain, so it disappears as soon as the user has nothing in flight;
+    # there is no per-user state to evict for idle users.
+    #
+    # Scheduling: a worker slot is only requested once the user's turn has
+    # come, so queued updates of a busy user never hold a slot. Slots go to
+    # the earliest deadline, where deadline = arrival + aging[priority]: fast
+    # commands overtake queued AI calls, but an AI call never waits more
+    # than its aging delay behind newer fast updates.
+    #
+    # Preemption: when an update arrives while its user still has one in
+    # flight, `preempt(update)` is called before it joins the lane, so
+    # long-running work of that user (e.g. an answer still streaming) can be
+    # cut short instead of holding the lane.
+    def __init__(self, workers: int, priority: Callable[[object], int],
+                 aging: Tuple[float, ...] = (0.0, 0.5, 2.0), max_pending: int = 4096,
+                 preempt: Optional[Callable[[object], None]] = None):
+        # The base semaphore only caps admitted updates; concurrency is
+        # enforced by the priority semaphore below
+        super().__init__(max(max_pending, workers))
+        self.workers = workers
+        self.priority = priority
+        self.aging = aging
+        self.preempt = preempt
+        self._slots = PrioritySemaphore(workers)
+        self._lanes: Dict[int, asyncio.Future] = {}
+        self.running = 0
+        self.processed = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @staticmethod
+    def lane_key(update) -> Optional[int]:
+        user = getattr(update, "effective_user", None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        arrived = time.monotonic()
+        key = self.lane_key(update)
+        if key is None:
+            await self._run(update, coroutine, arrived)
+            return
+
+        previous = self._lanes.get(key)
+        if previous is not None and self.preempt is not None:
+            self.preempt(update)
+        done = asyncio.get_running_loop().create_future()
+        done.add_done_callback(lambda _: self._lanes.get(key) is done and self._lanes.pop(key))
+        self._lanes[key] = done
+        try:
+            if previous is not None:
+                try:
+                    await asyncio.shield(previous)
+                except asyncio.CancelledError:
+                    coroutine.close()
+                    raise
+            await self._run(update, coroutine, arrived)
+        finally:
+            if previous is not None and not previous.done():
+                # Cancelled while waiting: release the next update only
+                # after the previous one is through
+                previous.add_done_callback(lambda _: done.done() or done.set_result(None))
+            elif not done.done():
+                done.set_result(None)
+
+    async def _run(self, update, coroutine, arrived: float):
+        level = self.priority(update)
+        deadline = arrived + self.aging[min(level, len(self.aging) - 1)]
+        try:
+            async with self._slots.slot(deadline):
+                self.running += 1
+                try:
+                    await coroutine
+                finally:
+                    self.running -= 1
+                    self.processed += 1
+        except asyncio.CancelledError:
+            # Never started: close the coroutine to avoid a "never awaited" warning
+            coroutine.close()
+            raise
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "waiting": self._slots.waiting,
+            "active_users": len(self._lanes),
+            "processed": self.processed,
+        }
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import struct
+import time
+from typing import Dict, List, Optional, Sequence
+
+from aiohttp import web
+from telegram import Bot, Update
+from telegram.error import TelegramError
+from telegram.ext import Application
+
+from src.database.models import shard_of
+from src.runtime.metrics import SHARD_ROUTED
+
+logger = logging.getLogger(__name__)
+
+# Updates travel from the front process to shard workers as raw Bot API
+# JSON, each frame prefixed with its length
+FRAME = struct.Struct("!I")
+
+# Update fields whose object carries the acting user as "from" (or "user")
+UPDATE_KINDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "poll_answer", "my_chat_member", "chat_member",
+    "chat_join_request", "channel_post", "edited_channel_post",
+)
+
+
+def update_user_id(data: Dict) -> Optional[int]:
+    for kind in UPDATE_KINDS:
+        payload = data.get(kind)
+        if payload:
+            sender = payload.get("from") or payload.get("user")
+            if sender:
+                return sender["id"]
+            chat = payload.get("chat")
+            if chat:
+                return chat["id"]
+    return None
+
+
+def shard_socket_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f"shard-{index}.sock")
+
+
+def _stop_event() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+class ShardRouter:
+    # Front side: one unix-socket stream per worker. Every update of a user
+    # goes to the same worker (shard_of(user_id)), so per-user ordering,
+    # the hot cache and in-memory sessions stay valid without coordination.
+    # drain() pushes back on the webhook when a worker falls behind.
+    def __init__(self, paths: Sequence[str]):
+        self.paths = list(paths)
+        self._writers: List[Optional[asyncio.StreamWriter]] = [None] * len(self.paths)
+        self.routed = [0] * len(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    async def _open(self, shard: int, timeout: float):
+        # Workers start in parallel with the front, so wait for the socket
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                _, writer = await asyncio.open_unix_connection(self.paths[shard])
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+                continue
+            self._writers[shard] = writer
+            return
+
+    async def connect(self, timeout: float = 60.0):
+        await asyncio.gather(*(self._open(shard, timeout) for shard in range(len(self.paths))))
+
+    def shard_for(self, data: Dict) -> int:
+        # Updates without a user (rare) are spread by update_id
+        user_id = update_user_id(data)
+        return shard_of(data.get("update_id", 0) if user_id is None else user_id, len(self.paths))
+
+    async def route(self, data: Dict) -> int:
+        shard = self.shard_for(data)
+        body = json.dumps(data, separators=(",", ":")).encode()
+        try:
+            writer = self._writers[shard]
+            writer.write(FRAME.pack(len(body)) + body)
+            await writer.drain()
+        except (ConnectionError, AttributeError):
+            # The worker restarted (or was never reached); one reconnect,
+            # otherwise the error reaches the webhook and Telegram retries
+            logger.warning("Reconnecting to shard %d", shard)
+            await self._open(shard, timeout=5.0)
+            writer = self._writers[shard]
+            writer.write(FRAME.pack(len(body)) + body)
+            await writer.drain()
+        self.routed[shard] += 1
+        SHARD_ROUTED.inc(shard=str(shard))
+        return shard
+
+    async def close(self):
+        for writer in self._writers:
+            if writer is not None:
+                writer.close()
+        self._writers = [None] * len(self.paths)
+
+
+async def serve_shard(application: Application, path: str):
+    # Worker side: the Application lifecycle of serve_webhook, fed from the
+    # front's frames instead of HTTP. The front owns the webhook.
+    stop = _stop_event()
+
+    async def receive(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+                data = json.loads(await reader.readexactly(length))
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)  # left over from a crashed worker
+    server = None
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        server = await asyncio.start_unix_server(receive, path)
+        logger.info("Shard worker listening on %s", path)
+        await stop.wait()
+    finally:
+        if server is not None:
+            server.close()
+            if os.path.exists(path):
+                os.unlink(path)
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+async def _poll(bot: Bot, router: ShardRouter, timeout: int = 10):
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=timeout, read_timeout=timeout + 5, allowed_updates=Update.ALL_TYPES
+            )
+        except TelegramError:
+            logger.exception("get_updates failed")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            await router.route(update.to_dict())
+            offset = update.update_id + 1
+
+
+async def serve_front(token: str, router: ShardRouter, webhook_url: Optional[str] = None,
+                      listen: str = "0.0.0.0", port: int = 8443, url_path: str = "",
+                      secret_token: Optional[str] = None):
+    # Front process for WORKERS > 1: receives updates (webhook, or polling
+    # without WEBHOOK_URL) and routes them; /metrics here shows routing
+    from src.runtime.webserver import create_web_app
+
+    stop = _stop_event()
+    bot = Bot(token)
+    await router.connect()
+    async with bot:
+        if webhook_url:
+            runner = web.AppRunner(create_web_app(router.route, url_path, secret_token), access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, listen, port).start()
+            # Listening before Telegram learns the URL
+            await bot.set_webhook(url=webhook_url, allowed_updates=Update.ALL_TYPES, secret_token=secret_token)
+            logger.info("Routing webhook on %s:%d to %d workers", listen, port, len(router))
+            try:
+                await stop.wait()
+            finally:
+                await runner.cleanup()
+        else:
+            await bot.delete_webhook()
+            poller = asyncio.create_task(_poll(bot, router))
+            logger.info("Routing polled updates to %d workers", len(router))
+            await stop.wait()
+            poller.cancel()
+            try:
+                await poller
+            except asyncio.CancelledError:
+                pass
+    await router.close()
@@ -0,0 +1,110 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from config import Config
+from src.runtime.metrics import CONTENT_TYPE, REGISTRY
+from src.runtime.profiler import PROFILER
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def _authorized(request: web.Request) -> bool:
+    # METRICS_TOKEN guards /metrics and /debug/*; without one nothing passes
+    if not Config.METRICS_TOKEN:
+        return False
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return hmac.compare_digest(supplied, Config.METRICS_TOKEN)
+
+
+def create_web_app(deliver: Callable[[Dict], Awaitable], url_path: str,
+                   secret_token: Optional[str] = None) -> web.Application:
+    # One aiohttp server for the Telegram webhook plus /metrics and the
+    # profiler controls (only with METRICS_TOKEN), so no extra port has to
+    # be exposed. deliver()
+    # takes the decoded update JSON: the local update queue, or a
+    # ShardRouter when running several workers.
+    async def webhook(request: web.Request) -> web.Response:
+        if secret_token and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret_token):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            return web.Response(status=400)
+        await deliver(data)
+        return web.Response()
+
+    async def metrics(request: web.Request) -> web.Response:
+        if not _authorized(request):
+            return web.Response(status=401)
+        return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def profiler(request: web.Request) -> web.Response:
+        # GET  /debug/profiler              -> status
+        # POST /debug/profiler?action=start -> start sampling the loop thread
+        # POST /debug/profiler?action=stop  -> stop
+        # GET  /debug/profiler?format=folded -> folded stacks for flame graphs
+        if not _authorized(request):
+            return web.Response(status=401)
+        action = request.query.get("action")
+        if request.method == "POST" and action == "start":
+            PROFILER.start()
+        elif request.method == "POST" and action == "stop":
+            PROFILER.stop()
+        elif request.query.get("format") == "folded":
+            return web.Response(text=PROFILER.folded())
+        return web.json_response(PROFILER.status())
+
+    app = web.Application()
+    app.router.add_post(f"/{url_path.lstrip('/')}", webhook)
+    if Config.METRICS_TOKEN:
+        app.router.add_get(Config.METRICS_PATH, metrics)
+        app.router.add_route("*", "/debug/profiler", profiler)
+    else:
+        logger.info("METRICS_TOKEN is not set: %s and /debug/profiler are disabled", Config.METRICS_PATH)
+    return app
+
+
+async def serve_webhook(application: Application, listen: str, port: int, url_path: str,
+                        webhook_url: str, secret_token: Optional[str] = None):
+    # Replacement for Application.run_webhook on our own aiohttp server.
+    # Mirrors its lifecycle: initialize, post_init, start, set_webhook,
+    # then the reverse on SIGINT/SIGTERM. The port is listening before
+    # Telegram learns the URL, so first deliveries never hit a closed port.
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async def deliver(data: Dict):
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    runner = web.AppRunner(create_web_app(deliver, url_path, secret_token), access_log=None)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        await application.start()
+        await application.bot.set_webhook(
+            url=webhook_url, allowed_updates=Update.ALL_TYPES, secret_token=secret_token
+        )
+        logger.info("Webhook server listening on %s:%d", listen, port)
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
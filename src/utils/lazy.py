@@ -0,0 +1,64 @@
+import asyncio
+import importlib
+import importlib.util
+import logging
+import sys
+import time
+from types import ModuleType
+from typing import Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Heavy dependencies the serving process loads once a feature is used.
+# PIL.Image is inherited by the photo workers forked after the warm-up.
+# sympy (problem and answer-check workers) and pandas (offline export)
+# never load in the serving process, so warming them only blocks the loop.
+HEAVY_MODULES = ("openai", "numpy", "PIL.Image")
+
+
+def lazy_import(name: str) -> ModuleType:
+    # Returns a module whose body runs on first attribute access, so
+    # `np = lazy_import("numpy")` at module level costs nothing at startup
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def import_modules(names: Iterable[str] = HEAVY_MODULES) -> Dict[str, float]:
+    # Fully load each module, returning seconds spent per module
+    timings = {}
+    for name in names:
+        started = time.perf_counter()
+        try:
+            module = importlib.import_module(name)
+            # Touch an attribute so lazily imported modules really execute
+            getattr(module, "__name__")
+            dir(module)
+        except ImportError as e:
+            logger.warning("Warm-up could not import %s: %s", name, e)
+            continue
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+async def warm_up(names: Iterable[str] = HEAVY_MODULES, pause: float = 0.1) -> Dict[str, float]:
+    # Load heavy modules once the bot is serving, so the first user to need
+    # them does not pay the import cost. This runs on the loop thread, one
+    # module per step with a pause in between for queued updates: a module
+    # from lazy_import must not be executed from another thread while a
+    # handler may touch it (LazyLoader is not thread-safe before 3.12).
+    timings = {}
+    for name in names:
+        timings.update(import_modules((name,)))
+        await asyncio.sleep(pause)
+    logger.info("Warmed up %s", ", ".join(f"{name} ({seconds * 1000:.0f} ms)" for name, seconds in timings.items()))
+    return timings